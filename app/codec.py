@@ -0,0 +1,109 @@
+import json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+CONTENT_TYPE_JSON = "application/json"
+CONTENT_TYPE_MSGPACK = "application/msgpack"
+CONTENT_TYPE_CBOR = "application/cbor"
+
+
+class Codec(object):
+    """
+    Serializes JSON data (dicts, lists, strings, numbers, booleans and None) into a media type
+    """
+
+    __slots__ = ("__name", "__content_type", "__encode")
+
+    def __init__(self, name, content_type, encode):
+        """
+        Creates codec instance.
+        :param name: Short name of the codec, eg. "msgpack"
+        :type name: str
+        :param content_type: Media type of the encoded data
+        :type content_type: str
+        :param encode: Function encoding JSON data into bytes
+        """
+        self.__name = name
+        self.__content_type = content_type
+        self.__encode = encode
+
+    @property
+    def name(self):
+        return self.__name
+
+    @property
+    def content_type(self):
+        return self.__content_type
+
+    def encode(self, data):
+        """
+        :rtype: bytes
+        """
+        return self.__encode(data)
+
+    def __str__(self):
+        return "Codec [name:{} content_type:{}]".format(self.name, self.content_type)
+
+    def __repr__(self):
+        return self.__str__()
+
+
+# stdlib encoder (C accelerated) is kept for JSON, faster third party encoders don't produce the same bytes
+JSON_CODEC = Codec("json", CONTENT_TYPE_JSON, lambda data: json.dumps(data).encode("utf-8"))
+
+# available codecs, the first one is the default
+__codecs = [JSON_CODEC]
+
+
+def register_codec(codec):
+    """
+    Makes the codec available for content negotiation, replaces a codec of the same content type
+    :type codec: Codec
+    """
+    unregister_codec(codec.content_type)
+    __codecs.append(codec)
+
+
+def unregister_codec(content_type):
+    """
+    Removes codec of the content type, the JSON codec can't be removed
+    :type content_type: str
+    """
+    if content_type == CONTENT_TYPE_JSON:
+        return
+    __codecs[:] = [codec for codec in __codecs if codec.content_type != content_type]
+
+
+def get_codecs():
+    """
+    Returns available codecs, JSON first
+    :rtype: list
+    """
+    return list(__codecs)
+
+
+def negotiate_codec(accept_mimetypes):
+    """
+    Returns the available codec the client prefers, JSON if the client accepts anything or none of the available
+    :param accept_mimetypes: Media types accepted by the client, eg. request.accept_mimetypes of Flask
+    :type accept_mimetypes: werkzeug.datastructures.MIMEAccept
+    :rtype: Codec
+    """
+    codecs = {codec.content_type: codec for codec in __codecs}
+    content_type = accept_mimetypes.best_match(list(codecs), default=CONTENT_TYPE_JSON)
+    return codecs[content_type]
+
+
+if msgpack is not None:
+    register_codec(Codec("msgpack", CONTENT_TYPE_MSGPACK, lambda data: msgpack.packb(data, use_bin_type=True)))
+
+if cbor2 is not None:
+    register_codec(Codec("cbor", CONTENT_TYPE_CBOR, cbor2.dumps))
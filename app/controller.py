@@ -2,23 +2,86 @@ import json
 import time
 import atexit
 import uuid
-from app.program import Program, ProgramState
+from app.program import Program, ProgramState, ProgramRollup, ProgramOperation, ProgramOperationResult
 from app.hardware.therm_sensor_api import ThermSensorApi, NoSensorFoundError, ThermSensorError, SensorNotReadyError
 from app.logger import Logger
+from app.metrics import ControllerMetrics, METRIC_TYPE_COUNTER, METRIC_TYPE_GAUGE
 from app.therm_sensor import ThermSensor
 from app.hardware.relay_api import RelayApi
 from app.storage import Storage
 from threading import RLock
 from app.monitor import Monitor
+from app.shared_relay import SharedRelayScheduler
 from app.utils import EventBus
 
 _bus = EventBus()
 
 
+class ControllerSnapshot(object):
+    """
+    Immutable record of sensors, programs, program states and relay states captured at once, see
+    Controller.get_snapshot
+    """
+
+    __slots__ = ("__versions", "__sensors", "__programs", "__program_states", "__relay_states")
+
+    def __init__(self, versions, sensors, programs, program_states, relay_states):
+        """
+        Creates snapshot instance.
+        :param versions: Versions of the data by VERSION_PROGRAMS, VERSION_SENSORS and VERSION_STATES
+        :type versions: dict
+        :param sensors: Available therm sensors
+        :type sensors: list
+        :param programs: Existing programs
+        :type programs: list
+        :param program_states: States of the programs, in the order of the programs
+        :type program_states: list
+        :param relay_states: States of all relays (0|1) by relay index
+        :type relay_states: list
+        """
+        self.__versions = dict(versions)
+        self.__sensors = list(sensors)
+        self.__programs = list(programs)
+        self.__program_states = list(program_states)
+        self.__relay_states = list(relay_states)
+
+    @property
+    def versions(self):
+        return self.__versions
+
+    @property
+    def sensors(self):
+        return self.__sensors
+
+    @property
+    def programs(self):
+        return self.__programs
+
+    @property
+    def program_states(self):
+        return self.__program_states
+
+    @property
+    def relay_states(self):
+        return self.__relay_states
+
+    def __str__(self):
+        return "ControllerSnapshot [versions:{} sensors:{} programs:{} program_states:{} relay_states:{}]".format(
+            self.versions, self.sensors, self.programs, self.program_states, self.relay_states)
+
+    def __repr__(self):
+        return self.__str__()
+
+
 class Controller(object):
     RELAYS_COUNT = len(RelayApi.RELAY_GPIO_CHANNELS)
 
-    def __init__(self, therm_sensor_api=None, relay_api=None, storage=None):
+    VERSION_PROGRAMS = "programs"
+    VERSION_SENSORS = "sensors"
+    VERSION_STATES = "states"
+
+    def __init__(self, therm_sensor_api=None, relay_api=None, storage=None, shared_relays=None,
+                 power_scheduler=None, history=None, journal=None):
         """
         Creates controller instance.
         :param therm_sensor_api: Api to obtain therm sensors and their measurements
@@ -27,19 +90,59 @@ class Controller(object):
         :type relay_api: RelayApi
         :param storage: Api for storing data
         :type storage: Storage
+        :param shared_relays: Relays driving devices shared by several programs, see SharedRelay. Programs cannot use
+        these relays directly
+        :type shared_relays: list
+        :param power_scheduler: Scheduler keeping total power of active relays within the budget. If not given
+        relays are activated as soon as programs need them
+        :type power_scheduler: PowerScheduler
+        :param history: Store of temperature and relay history, samples of all programs are appended to it after
+        each check. History is not recorded if not given
+        :type history: HistoryStore
+        :param journal: Journal the state is written to periodically and restored from after restart, so relays
+        keep their state and program states are available immediately. Nothing is journaled if not given
+        :type journal: StateJournal
         """
         super().__init__()
         self.__sensors = None
         self.__programs = []
         self.__monitors = []
+        self.__states = {}
         self.__therm_sensor_api = therm_sensor_api
         self.__relay_api = relay_api
         self.__storage = storage if storage is not None else Storage()
         self.__lock = RLock()
+        self.__shared_relay_scheduler = SharedRelayScheduler(
+            Controller.__validate_shared_relays(shared_relays or []), relay_api)
+        self.__power_scheduler = power_scheduler
+        self.__history = history
+        self.__journal = journal
+        self.__relay_states = None
+        # incremented on every change, see get_versions
+        self.__versions = {Controller.VERSION_PROGRAMS: 0, Controller.VERSION_SENSORS: 0,
+                           Controller.VERSION_STATES: 0}
+        self.__metrics = ControllerMetrics(Controller.RELAYS_COUNT)
+
+    @staticmethod
+    def __validate_shared_relays(shared_relays):
+        for shared_relay in shared_relays:
+            relay_indexes = {shared_relay.relay_index} | shared_relay.dependent_relay_indexes
+            if any(relay_index not in range(Controller.RELAYS_COUNT) for relay_index in relay_indexes):
+                raise ValueError("Invalid shared relay: {}".format(shared_relay))
+            if shared_relay.relay_index in shared_relay.dependent_relay_indexes:
+                raise ValueError("Shared relay cannot depend on itself: {}".format(shared_relay))
+        return shared_relays
 
     def __set_programs(self, programs):
         self.__programs = programs
-        self.__monitors = [Monitor(program, self.__therm_sensor_api, self.__relay_api) for program in programs]
+        self.__versions[Controller.VERSION_PROGRAMS] += 1
+        if self.__power_scheduler is not None:
+            # requests of relays the programs still own are repeated or cancelled by the new monitors, cancelling them
+            # here would restart their wait and short-cycle the devices
+            self.__power_scheduler.retain(Controller.__get_assigned_relays(programs))
+        self.__monitors = [Monitor(program, self.__therm_sensor_api, self.__relay_api, self.__power_scheduler,
+                                   self.__metrics)
+                           for program in programs]
         _bus.emit('programs_updated', programs)
 
     def __default_main_loop_exit_condition(self):
@@ -53,15 +156,20 @@ class Controller(object):
         """
         Logger.info("Starting controller")
 
-        atexit.register(self.__clean_up)
+        atexit.register(self.clean_up)
         self.__load_programs()
+        if self.__journal is not None:
+            self.__restore_from_journal()
 
         if main_loop_exit_condition is None:
             main_loop_exit_condition = self.__default_main_loop_exit_condition
 
         Logger.info("Starting main loop")
 
+        next_tick_time = None
         while not main_loop_exit_condition():
+            tick_start_time = time.monotonic()
+            tick_lag_secs = 0.0 if next_tick_time is None else tick_start_time - next_tick_time
 
             self.__lock.acquire()
             try:
@@ -74,6 +182,19 @@ class Controller(object):
 
             for monitor in monitors:
                 monitor.check()
+            if self.__power_scheduler is not None:
+                self.__schedule_power(monitors)
+            states = self.__publish_states(monitors)
+            self.__shared_relay_scheduler.update(programs, states)
+            # read once per tick, reading relays accesses hardware
+            relay_states = self.__publish_relay_states()
+            if self.__history is not None:
+                self.__record_history(programs, states, relay_states)
+            if self.__journal is not None and self.__journal.is_due():
+                self.__journal.write(relay_states, states)
+            self.__metrics.record_tick(time.monotonic() - tick_start_time, tick_lag_secs)
+            next_tick_time = time.monotonic() + interval_secs
+
             try:
                 time.sleep(interval_secs)
             except KeyboardInterrupt:
@@ -82,19 +203,107 @@ class Controller(object):
 
         Logger.info("Controller stopped")
 
-    def __clean_up(self):
+    def __publish_states(self, monitors):
+        states = {}
+        for monitor in monitors:
+            state = monitor.get_state()
+            states[state.program_id] = state
+        self.__lock.acquire()
+        try:
+            self.__states = states
+            self.__versions[Controller.VERSION_STATES] += 1
+        finally:
+            self.__lock.release()
+        _bus.emit('states_published', states)
+        return states
+
+    def __publish_relay_states(self):
+        relay_states = self.get_relays_state()
+        self.__metrics.record_relay_states(relay_states)
+        if relay_states != self.__relay_states:
+            self.__relay_states = relay_states
+            _bus.emit('relays_changed', relay_states)
+        return relay_states
+
+    def __restore_from_journal(self):
+        snapshot = self.__journal.restore()
+        if snapshot is None:
+            return
+        self.__lock.acquire()
+        try:
+            programs = self.__programs
+            # states of the programs modified meanwhile are not restored
+            states = {}
+            for program in programs:
+                state = snapshot.program_states.get(program.program_id)
+                if state is not None and state.program_crc == program.program_crc:
+                    states[program.program_id] = state
+            self.__states = states
+            self.__versions[Controller.VERSION_STATES] += 1
+        finally:
+            self.__lock.release()
+
+        # relays of the restored programs are set as they were, without switching them off first
+        restored_programs = [program for program in programs if program.program_id in states]
+        for relay_index, relay_state in enumerate(snapshot.relay_states[:Controller.RELAYS_COUNT]):
+            if not Controller.__is_relay_assigned(relay_index, restored_programs) and \
+                    not self.__shared_relay_scheduler.is_shared(relay_index):
+                continue
+            if self.__relay_api.get_relay_state(relay_index) != relay_state:
+                self.__relay_api.set_relay_state(relay_index, relay_state)
+        Logger.info("Restored from journal captured at {} states of programs {}".format(
+            snapshot.timestamp, list(states.keys())))
+
+    def __record_history(self, programs, states, relay_states):
+        relay_mask = 0
+        for relay_index, relay_state in enumerate(relay_states):
+            if relay_state:
+                relay_mask |= 1 << relay_index
+        for program in programs:
+            state = states.get(program.program_id)
+            if state is not None and state.timestamp is not None:
+                self.__history.append(program.sensor_id, state.current_temperature, relay_mask, state.timestamp)
+
+    def clean_up(self):
+        """
+        Deactivates all programs and relays and clears the journal, called at exit. The journal is cleared only
+        after the relays are switched off, so a crash meanwhile still restores them
+        """
         Logger.info("Deactivating all programs")
         # remove all programs
         self.__set_programs([])
         # deactivate all relays that are not assigned to any program
         self.__deactivate_all_unassigned_relays()
+        self.__shared_relay_scheduler.deactivate_all()
+        if self.__journal is not None:
+            self.__journal.clear()
+        if self.__history is not None:
+            self.__history.stop()
 
     def __deactivate_all_unassigned_relays(self, programs=[]):
         for relay_index in range(Controller.RELAYS_COUNT):
             if not Controller.__is_relay_assigned(relay_index, programs) and \
+                    not self.__shared_relay_scheduler.is_shared(relay_index) and \
                     self.__relay_api.get_relay_state(relay_index):
                 self.__relay_api.set_relay_state(relay_index, 0)
 
+    def __schedule_power(self, monitors):
+        self.__lock.acquire()
+        try:
+            programs = None if monitors is self.__monitors else self.__programs
+        finally:
+            self.__lock.release()
+        if programs is not None:
+            # programs were changed during the checks, monitors no longer current may have requested relays that
+            # aren't owned by the current programs
+            self.__power_scheduler.retain(Controller.__get_assigned_relays(programs))
+        self.__power_scheduler.schedule()
+
+    @staticmethod
+    def __get_assigned_relays(programs):
+        return {relay_index for program in programs
+                for relay_index in (program.heating_relay_index, program.cooling_relay_index) if relay_index != -1}
+
     @staticmethod
     def __is_relay_assigned(relay_index, programs):
         for program in programs:
@@ -134,6 +343,7 @@ class Controller(object):
                     else:
                         sensors.append(ThermSensor(existing_sensor_id))
                 self.__sensors = sensors
+                self.__versions[Controller.VERSION_SENSORS] += 1
 
             return self.__sensors
         finally:
@@ -176,9 +386,10 @@ class Controller(object):
                 raise NoSensorFoundError(sensor_id)
 
             try:
-                self.__storage.store_sensors(sensors)
+                self.__store_sensor(modified_sensor, sensors)
                 Logger.info("Sensors stored {}".format(str(sensors)))
                 self.__sensors = sensors
+                self.__versions[Controller.VERSION_SENSORS] += 1
                 return modified_sensor
             except Exception as e:
                 Logger.error("Sensors store error {}".format(str(e)))
@@ -186,6 +397,57 @@ class Controller(object):
         finally:
             self.__lock.release()
 
+    def get_versions(self):
+        """
+        Returns versions of programs, sensors and program states. A version is incremented whenever the data changes,
+        so clients can tell whether the data changed without getting it. Versions start from 0 on every start
+        :return: Versions by VERSION_PROGRAMS, VERSION_SENSORS and VERSION_STATES
+        :rtype: dict
+        """
+        self.__lock.acquire()
+        try:
+            return dict(self.__versions)
+        finally:
+            self.__lock.release()
+
+    def get_snapshot(self):
+        """
+        Returns sensors, programs, program states and relay states with their versions, all captured at once.
+        Relay states are the ones published by the control loop after its last check, relays are read only if the
+        loop has not published them yet
+        :rtype: ControllerSnapshot
+        """
+        self.__lock.acquire()
+        try:
+            relay_states = self.__relay_states
+            if relay_states is None:
+                relay_states = self.get_relays_state()
+            return ControllerSnapshot(self.__versions, self.get_therm_sensors(), self.__programs,
+                                      [self.__get_published_state(program) for program in self.__programs],
+                                      relay_states)
+        finally:
+            self.__lock.release()
+
+    def collect_metrics(self, writer):
+        """
+        Adds metrics of the control loop, sensors, relays, programs, power scheduling and history to the writer.
+        Only values kept in memory are collected, no hardware is accessed, see MetricsRegistry
+        :type writer: MetricsWriter
+        """
+        self.__metrics.collect(writer)
+        self.__lock.acquire()
+        try:
+            states = [self.__get_published_state(program) for program in self.__programs]
+        finally:
+            self.__lock.release()
+        for state in states:
+            writer.add("brewery_program_error", METRIC_TYPE_GAUGE, state.error is not None,
+                       {"program": state.program_id}, help_text="Whether the last check of the program failed")
+        writer.add_values("brewery_power", self.get_power_metrics())
+        if self.__history is not None:
+            writer.add("brewery_history_dropped_total", METRIC_TYPE_COUNTER, self.__history.dropped_count,
+                       help_text="Number of history samples dropped because the writer didn't keep up")
+
     def get_relays_state(self):
         """
         Return list with available relays' states. Values in the list are integers 0 or 1
@@ -195,6 +457,16 @@ class Controller(object):
 
         return [self.__relay_api.get_relay_state(relay_index) for relay_index in range(self.RELAYS_COUNT)]
 
+    def get_power_metrics(self):
+        """
+        Returns power scheduler decisions and current power usage, see PowerScheduler.get_metrics
+        :return: Power metrics or None if power is not scheduled
+        :rtype: dict
+        """
+        if self.__power_scheduler is None:
+            return None
+        return self.__power_scheduler.get_metrics()
+
     def create_program(self, program):
         """
         Creates a new program that will monitor temperature at specified therm sensor and control it by activating
@@ -214,7 +486,7 @@ class Controller(object):
             self.__validate_program(created_program, programs)
             programs.append(created_program)
             try:
-                self.__storage.store_programs(programs)
+                self.__store_program(created_program, programs)
                 Logger.info("Program created {}".format(str(created_program)))
                 self.__set_programs(programs)
             except Exception as e:
@@ -224,6 +496,28 @@ class Controller(object):
         finally:
             self.__lock.release()
 
+    def __store_program(self, program, programs):
+        # row level update if the storage supports it (see SqliteStorage), all programs are rewritten otherwise
+        upsert_program = getattr(self.__storage, "upsert_program", None)
+        if upsert_program is None:
+            self.__storage.store_programs(programs)
+        else:
+            upsert_program(program)
+
+    def __delete_stored_program(self, program_id, programs):
+        delete_program = getattr(self.__storage, "delete_program", None)
+        if delete_program is None:
+            self.__storage.store_programs(programs)
+        else:
+            delete_program(program_id)
+
+    def __store_sensor(self, sensor, sensors):
+        upsert_sensor = getattr(self.__storage, "upsert_sensor", None)
+        if upsert_sensor is None:
+            self.__storage.store_sensors(sensors)
+        else:
+            upsert_sensor(sensor)
+
     @staticmethod
     def find_program_index(program_id, programs):
         for index in range(len(programs)):
@@ -252,7 +546,7 @@ class Controller(object):
             updated_programs[program_index] = existing_program.modify_with(program)
             self.__validate_program(program, updated_programs, skip_index=program_index)
             try:
-                self.__storage.store_programs(updated_programs)
+                self.__store_program(updated_programs[program_index], updated_programs)
                 self.__set_programs(updated_programs)
                 Logger.info("Program modified {} -> {}".format(str(existing_program), str(program)))
                 return updated_programs[program_index]
@@ -262,7 +556,7 @@ class Controller(object):
         finally:
             self.__lock.release()
 
-    def __validate_program(self, program, existing_programs, skip_index=-1):
+    def __validate_program(self, program, existing_programs, skip_index=-1, sensor_ids=None):
         if program.min_temperature > program.max_temperature:
             Logger.error("Program rejected - min temperature is higher than max: {}".format(str(program)))
             raise ProgramError(program, "Min temperature is higher than max", ProgramError.ERROR_CODE_MIN_TEMP_HIGHER_THAN_MAX)
@@ -279,7 +573,9 @@ class Controller(object):
             if program.heating_relay_index != -1 and existing_program.heating_relay_index == program.heating_relay_index:
                 Logger.error("Program rejected - duplicate heating relay: {}".format(str(program)))
                 raise ProgramError(program, "Relay {} is used in other program".format(program.heating_relay_index), ProgramError.ERROR_CODE_HEATING_RELAY_ALREADY_IN_USE)
-        if program.sensor_id not in self.__therm_sensor_api.get_sensor_id_list():
+        if sensor_ids is None:
+            sensor_ids = self.__therm_sensor_api.get_sensor_id_list()
+        if program.sensor_id not in sensor_ids:
             Logger.error("Program rejected - invalid sensor_id: {}".format(str(program)))
             raise ProgramError(program, "Sensor {} is invalid".format(program.sensor_id), ProgramError.ERROR_CODE_INVALID_SENSOR)
         if program.cooling_relay_index < 0 and program.cooling_relay_index != -1 or \
@@ -290,6 +586,85 @@ class Controller(object):
                 program.heating_relay_index >= Controller.RELAYS_COUNT:
             Logger.error("Program rejected - invalid heating relay index: {}".format(str(program)))
             raise ProgramError(program, "Relay {} is invalid".format(program.cooling_relay_index), ProgramError.ERROR_CODE_INVALID_RELAY)
+        if self.__shared_relay_scheduler.is_shared(program.cooling_relay_index) or \
+                self.__shared_relay_scheduler.is_shared(program.heating_relay_index):
+            Logger.error("Program rejected - shared relay used: {}".format(str(program)))
+            raise ProgramError(program, "Shared relay cannot be used by a program", ProgramError.ERROR_CODE_INVALID_RELAY)
+
+    def apply_program_operations(self, operations):
+        """
+        Creates, modifies and deletes programs at once. Operations are applied in the given order, then all
+        created and modified programs are validated against the resulting program list. Either all operations are
+        applied and stored, or none of them
+        :param operations: Operations to apply
+        :type operations: list
+        :return: Results of the operations, in the same order as the operations
+        :rtype: list
+        :raises ProgramOperationsError: if any of the operations was rejected or programs could not be stored.
+            The error contains results of all operations, the rejected ones have error set
+        """
+        Logger.info("Apply program operations:{}".format(str(operations)))
+        self.__lock.acquire()
+        try:
+            programs = self.__programs.copy()
+            results = [self.__apply_program_operation(operation, programs) for operation in operations]
+            sensor_ids = self.__therm_sensor_api.get_sensor_id_list()
+            results = [self.__validate_program_operation_result(result, programs, sensor_ids) for result in results]
+
+            if any(result.error is not None for result in results):
+                raise ProgramOperationsError(results, "Program operations rejected")
+            if not results:
+                return results
+            try:
+                self.__storage.store_programs(programs)
+                Logger.info("Program operations applied {}".format(str(programs)))
+                self.__set_programs(programs)
+            except Exception as e:
+                Logger.error("Programs store error {}".format(str(e)))
+                raise ProgramOperationsError(results, str(e), ProgramError.ERROR_CODE_CANNOT_STORE_PROGRAMS)
+            return results
+        finally:
+            self.__lock.release()
+
+    @staticmethod
+    def __apply_program_operation(operation, programs):
+        # Applies the operation to given programs list, validation against other programs is done separately
+        if operation.kind == ProgramOperation.CREATE and operation.program is not None:
+            program = operation.program
+            created_program = Program(str(uuid.uuid4()), program.program_name,
+                                      program.sensor_id, program.heating_relay_index, program.cooling_relay_index,
+                                      program.min_temperature, program.max_temperature, program.active)
+            programs.append(created_program)
+            return ProgramOperationResult(operation, created_program)
+        if operation.kind not in (ProgramOperation.MODIFY, ProgramOperation.DELETE) or \
+                operation.kind == ProgramOperation.MODIFY and operation.program is None:
+            error = ProgramError(operation.program, "Invalid program operation:{}".format(operation.kind),
+                                 ProgramError.ERROR_CODE_INVALID_OPERATION)
+            return ProgramOperationResult(operation, error=error)
+
+        program_index = Controller.find_program_index(operation.program_id, programs)
+        if program_index < 0:
+            error = ProgramError(None, "Program with the given ID not found:{}".format(operation.program_id),
+                                 ProgramError.ERROR_CODE_INVALID_ID)
+            return ProgramOperationResult(operation, error=error)
+        if operation.kind == ProgramOperation.DELETE:
+            return ProgramOperationResult(operation, programs.pop(program_index))
+        modified_program = programs[program_index].modify_with(operation.program)
+        programs[program_index] = modified_program
+        return ProgramOperationResult(operation, modified_program)
+
+    def __validate_program_operation_result(self, result, programs, sensor_ids):
+        if result.error is not None or result.operation.kind == ProgramOperation.DELETE:
+            return result
+        program_index = self.find_program_index(result.program.program_id, programs)
+        if program_index < 0 or programs[program_index] is not result.program:
+            # the program was deleted or modified again by one of the subsequent operations
+            return result
+        try:
+            self.__validate_program(result.program, programs, skip_index=program_index, sensor_ids=sensor_ids)
+            return result
+        except ProgramError as e:
+            return ProgramOperationResult(result.operation, error=e)
 
     def get_programs(self):
         """
@@ -317,7 +692,7 @@ class Controller(object):
                                    ProgramError.ERROR_CODE_INVALID_ID)
             program = programs.pop(program_index)
             try:
-                self.__storage.store_programs(programs)
+                self.__delete_stored_program(program_id, programs)
                 Logger.info("Program deleted {}".format(str(program)))
                 self.__set_programs(programs)
                 return program
@@ -329,8 +704,10 @@ class Controller(object):
 
     def get_program_state(self, program_id):
         """
-        Returns current state of the given program
-        :return: State of the program
+        Returns the state of the given program published by the control loop after the last program check.
+        No hardware is accessed here, the returned state may be as old as the control loop interval
+        :return: State of the program. If the program has not been checked yet the state has no temperature and
+        no timestamp
         :rtype: ProgramState
         """
         self.__lock.acquire()
@@ -339,22 +716,68 @@ class Controller(object):
             if program_index < 0:
                 raise ProgramError(None, "Program with the given ID not found:{}".format(program_id),
                                    ProgramError.ERROR_CODE_INVALID_ID)
-            return self.__programs[program_index].create_program_state(self.__therm_sensor_api, self.__relay_api)
+            return self.__get_published_state(self.__programs[program_index])
         finally:
             self.__lock.release()
 
     def get_program_states(self):
         """
-        Returns states of all programs as an array
+        Returns states of all programs as an array. See get_program_state
         :return: States of existing programs
         :rtype: list
         """
         self.__lock.acquire()
         try:
-            return [self.__programs[program_index].create_program_state(self.__therm_sensor_api, self.__relay_api) for
-                    program_index in range(len(self.__programs))]
+            return [self.__get_published_state(program) for program in self.__programs]
+        finally:
+            self.__lock.release()
+
+    def get_program_history(self, program_id, start=None, end=None, resolution_secs=None):
+        """
+        Returns temperature and relay history of the given program. History is recorded per sensor, so it covers
+        the period the sensor was used by other programs as well
+        :param program_id: Id of the program
+        :type program_id: str
+        :param start: Beginning of the period (inclusive), seconds since epoch. Unbounded if not given
+        :type start: float
+        :param end: End of the period (inclusive), seconds since epoch. Unbounded if not given
+        :type end: float
+        :param resolution_secs: Requested resolution of the history. If given the history is summarized by the
+        coarsest rollups that are not coarser than requested, if there are any
+        :type resolution_secs: float
+        :return: States (ProgramState) captured by the control loop or rollups (ProgramRollup) of the states,
+        ordered by timestamp. Empty if history is not recorded
+        :rtype: list
+        :raises ProgramError: if the program was not found
+        """
+        self.__lock.acquire()
+        try:
+            program_index = self.find_program_index(program_id, self.__programs)
+            if program_index < 0:
+                raise ProgramError(None, "Program with the given ID not found:{}".format(program_id),
+                                   ProgramError.ERROR_CODE_INVALID_ID)
+            program = self.__programs[program_index]
         finally:
             self.__lock.release()
+        if self.__history is None:
+            return []
+        records = self.__history.query(program.sensor_id, start, end, resolution_secs)
+        if self.__history.select_tier(resolution_secs) is not None:
+            return [ProgramRollup(program.program_id, record.timestamp, record.resolution_secs,
+                                  record.min_temperature, record.max_temperature, record.mean_temperature,
+                                  record.count, record.get_relay_on_secs(program.heating_relay_index),
+                                  record.get_relay_on_secs(program.cooling_relay_index))
+                    for record in records]
+        return [ProgramState(program.program_id, record.temperature, program.program_crc,
+                             record.is_relay_active(program.heating_relay_index),
+                             record.is_relay_active(program.cooling_relay_index), None, record.timestamp)
+                for record in records]
+
+    def __get_published_state(self, program):
+        state = self.__states.get(program.program_id)
+        if state is None:
+            return ProgramState(program.program_id, None, program.program_crc)
+        return state
 
 
 class ProgramError(Exception):
@@ -404,3 +827,19 @@ class ProgramError(Exception):
     def to_json(self):
         data = self.to_json_data()
         return json.dumps(data)
+
+
+class ProgramOperationsError(ProgramError):
+    """Exception class for rejected program operations, holds results of all the operations"""
+
+    def __init__(self, results, message="", error_code=ProgramError.ERROR_CODE_INVALID_OPERATION):
+        super().__init__(None, message, error_code)
+        self.results = results
+
+    def get_results(self):
+        return self.results
+
+    def to_json_data(self):
+        error = super().to_json_data()
+        error["results"] = [result.to_json_data() for result in self.results]
+        return error
@@ -0,0 +1,285 @@
+import json
+import threading
+import time
+from collections import deque
+
+from app.utils import EventBus
+
+EVENT_SNAPSHOT = "snapshot"
+EVENT_STATES = "states"
+EVENT_RELAYS = "relays"
+
+
+class StreamEvent(object):
+    """
+    Immutable event of the stream, serialized once and shared by all clients
+    """
+
+    __slots__ = ("__event_id", "__event_type", "__data")
+
+    def __init__(self, event_id, event_type, data):
+        """
+        Creates event instance.
+        :param event_id: Sequence number of the event
+        :type event_id: int
+        :param event_type: EVENT_SNAPSHOT, EVENT_STATES or EVENT_RELAYS
+        :type event_type: str
+        :param data: JSON serializable data of the event
+        """
+        self.__event_id = event_id
+        self.__event_type = event_type
+        self.__data = "id: {}\nevent: {}\ndata: {}\n\n".format(event_id, event_type, json.dumps(data)).encode("utf-8")
+
+    @property
+    def event_id(self):
+        return self.__event_id
+
+    @property
+    def event_type(self):
+        return self.__event_type
+
+    def to_sse(self):
+        """
+        Returns the event in Server-Sent Events format
+        :rtype: bytes
+        """
+        return self.__data
+
+    def __str__(self):
+        return "StreamEvent [event_id:{} event_type:{}]".format(self.event_id, self.event_type)
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class EventSubscription(object):
+    """
+    Events of the stream for a single client, see EventStream.subscribe
+    """
+
+    def __init__(self, stream, condition, queue_size):
+        super().__init__()
+        self.__stream = stream
+        self.__condition = condition
+        self.queue = deque()
+        self.queue_size = queue_size
+        self.overflowed = False
+        self.closed = False
+
+    def get(self, timeout=None):
+        """
+        Waits for events
+        :param timeout: Maximum time to wait in seconds, forever if not given
+        :type timeout: float
+        :return: Events in the order they were published, empty list on timeout, None when the subscription is
+        closed. If the client didn't keep up and some events were dropped, a snapshot of the whole state is returned
+        instead of them
+        :rtype: list
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self.__condition.acquire()
+        try:
+            # woken up by events published for other clients as well
+            while not self.queue and not self.overflowed and not self.closed:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self.__condition.wait(remaining)
+            if self.closed:
+                return None
+            if self.overflowed:
+                self.overflowed = False
+                self.queue.clear()
+                return [self.__stream.create_snapshot()]
+            events = list(self.queue)
+            self.queue.clear()
+            return events
+        finally:
+            self.__condition.release()
+
+    def close(self):
+        self.__stream.unsubscribe(self)
+
+
+class EventStream(object):
+    """
+    Stream of changes of program states and relays for Server-Sent Events clients. The controller publishes states
+    after each check and relay states when they change (see attach), the stream turns them into events with changes
+    only. Events are serialized once for all clients, so a client costs no hardware access nor serialization.
+
+    The last events are kept in a backlog, a reconnecting client gets the events it missed since its last event id.
+    A client that is new, or missed more than the backlog holds, gets a snapshot of the whole state first. Each
+    client has a bounded queue, a client that doesn't keep up has its queue dropped and gets a snapshot instead, so
+    slow clients never hold up the controller
+    """
+
+    def __init__(self, backlog_size=256, client_queue_size=64, max_clients=None):
+        """
+        Creates event stream instance.
+        :param backlog_size: Number of last events kept for reconnecting clients
+        :type backlog_size: int
+        :param client_queue_size: Maximum number of events waiting to be sent to a client
+        :type client_queue_size: int
+        :param max_clients: Maximum number of connected clients, unlimited if not given
+        :type max_clients: int
+        """
+        super().__init__()
+        self.__client_queue_size = client_queue_size
+        self.__max_clients = max_clients
+        self.__closed = False
+        self.__condition = threading.Condition()
+        self.__backlog = deque(maxlen=backlog_size)
+        self.__subscriptions = []
+        self.__last_event_id = 0
+        # state of the clients after processing all events, sent in snapshots
+        self.__states = {}
+        self.__relays = []
+        self.__snapshot = None
+        self.__overflow_count = 0
+
+    def attach(self):
+        """
+        Subscribes to states and relay changes published by the controller on the event bus
+        """
+        bus = EventBus()
+        bus.on('states_published')(self.publish_states)
+        bus.on('relays_changed')(self.publish_relays)
+
+    def get_metrics(self):
+        """
+        Returns number of connected clients and how many times a client's queue overflowed
+        :rtype: dict
+        """
+        self.__condition.acquire()
+        try:
+            return {"clients": len(self.__subscriptions), "overflow_count": self.__overflow_count}
+        finally:
+            self.__condition.release()
+
+    def publish_states(self, states):
+        """
+        Publishes an event with states that changed since the last call and ids of removed programs, if there are
+        any. Changes of timestamps only are not published
+        :param states: States of all programs by program id
+        :type states: dict
+        """
+        self.__condition.acquire()
+        try:
+            states = {program_id: state.to_json_data() for program_id, state in states.items()}
+            changed = [data for program_id, data in states.items()
+                       if not EventStream.__is_same_state(self.__states.get(program_id), data)]
+            removed = [program_id for program_id in self.__states if program_id not in states]
+            if not changed and not removed:
+                return
+            for data in changed:
+                self.__states[data["program_id"]] = data
+            for program_id in removed:
+                del self.__states[program_id]
+            self.__publish(EVENT_STATES, {"states": changed, "removed": removed})
+        finally:
+            self.__condition.release()
+
+    def publish_relays(self, relay_states):
+        """
+        Publishes an event with states of all relays, if they changed
+        :param relay_states: States of all relays (0|1) by relay index
+        :type relay_states: list
+        """
+        self.__condition.acquire()
+        try:
+            relay_states = list(relay_states)
+            if relay_states == self.__relays:
+                return
+            self.__relays = relay_states
+            self.__publish(EVENT_RELAYS, {"relays": relay_states})
+        finally:
+            self.__condition.release()
+
+    def subscribe(self, last_event_id=None):
+        """
+        Subscribes a client to the events, returns None if the stream is closed or has max_clients connected
+        :param last_event_id: Id of the last event the client got before reconnecting, eg. Last-Event-ID header
+        :type last_event_id: str
+        :rtype: EventSubscription
+        """
+        try:
+            last_event_id = int(last_event_id) if last_event_id is not None else None
+        except ValueError:
+            last_event_id = None
+        self.__condition.acquire()
+        try:
+            if self.__closed or \
+                    (self.__max_clients is not None and len(self.__subscriptions) >= self.__max_clients):
+                return None
+            subscription = EventSubscription(self, self.__condition, self.__client_queue_size)
+            if last_event_id is not None and last_event_id == self.__last_event_id:
+                pass
+            elif last_event_id is not None and self.__backlog and \
+                    self.__backlog[0].event_id - 1 <= last_event_id < self.__last_event_id:
+                subscription.queue.extend(event for event in self.__backlog if event.event_id > last_event_id)
+            else:
+                subscription.queue.append(self.create_snapshot())
+            self.__subscriptions.append(subscription)
+            return subscription
+        finally:
+            self.__condition.release()
+
+    def unsubscribe(self, subscription):
+        self.__condition.acquire()
+        try:
+            subscription.closed = True
+            if subscription in self.__subscriptions:
+                self.__subscriptions.remove(subscription)
+            self.__condition.notify_all()
+        finally:
+            self.__condition.release()
+
+    def create_snapshot(self):
+        """
+        Returns event with the whole state, its id is the id of the last published event
+        :rtype: StreamEvent
+        """
+        self.__condition.acquire()
+        try:
+            if self.__snapshot is None:
+                self.__snapshot = StreamEvent(self.__last_event_id, EVENT_SNAPSHOT,
+                                              {"states": list(self.__states.values()), "relays": self.__relays})
+            return self.__snapshot
+        finally:
+            self.__condition.release()
+
+    def close(self):
+        """
+        Closes all subscriptions, waiting clients are woken up. New clients are refused afterwards
+        """
+        self.__condition.acquire()
+        try:
+            self.__closed = True
+            for subscription in self.__subscriptions:
+                subscription.closed = True
+            self.__subscriptions = []
+            self.__condition.notify_all()
+        finally:
+            self.__condition.release()
+
+    def __publish(self, event_type, data):
+        self.__last_event_id += 1
+        self.__snapshot = None
+        event = StreamEvent(self.__last_event_id, event_type, data)
+        self.__backlog.append(event)
+        for subscription in self.__subscriptions:
+            if subscription.overflowed:
+                continue
+            if len(subscription.queue) >= subscription.queue_size:
+                subscription.overflowed = True
+                subscription.queue.clear()
+                self.__overflow_count += 1
+            else:
+                subscription.queue.append(event)
+        self.__condition.notify_all()
+
+    @staticmethod
+    def __is_same_state(previous, current):
+        if previous is None:
+            return False
+        return all(previous[key] == value for key, value in current.items() if key != "timestamp")
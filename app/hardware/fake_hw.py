@@ -3,6 +3,8 @@ from app.utils import EventBus
 from app.hardware.relay_api import RelayApi
 from app.program import Program
 from app.storage import Storage
+from app.sqlite_storage import SqliteStorage
+import app.hardware.hw_config as hw_config
 from datetime import datetime
 
 _bus = EventBus()
@@ -46,7 +48,10 @@ class FakeHardware(object):
 
     @property
     def storage(self):
-        storage = Storage(programs_file_name="fake_programs", sensors_file_name="fake_sensors")
+        if hw_config.STORAGE_BACKEND == hw_config.STORAGE_BACKEND_SQLITE:
+            storage = SqliteStorage(database_file_name="fake_brewery.db")
+        else:
+            storage = Storage(programs_file_name="fake_programs", sensors_file_name="fake_sensors")
         existing_fake_programs = storage.load_programs()
         if len(existing_fake_programs) == 0:
             Logger.info("FAKE creating initial fake programs")
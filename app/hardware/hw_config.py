@@ -1,5 +1,106 @@
 import os
+import tempfile
 
 RUN_ON_RASPBERRY = True
 if 'RUN_ON_RASPBERRY' in os.environ and os.environ['RUN_ON_RASPBERRY'] == '0':
     RUN_ON_RASPBERRY = False
+
+# Backend storing programs and sensors - "json" (a file for each) or "sqlite" (single SQLite database in WAL mode)
+STORAGE_BACKEND_JSON = 'json'
+STORAGE_BACKEND_SQLITE = 'sqlite'
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', STORAGE_BACKEND_JSON)
+# Changes are written to the storage once they haven't changed for STORAGE_DEBOUNCE_SECS, but not later than
+# STORAGE_MAX_DELAY_SECS after the first change, to reduce SD card wear. Changes are written immediately if
+# STORAGE_DEBOUNCE_SECS is 0
+STORAGE_DEBOUNCE_SECS = float(os.environ.get('STORAGE_DEBOUNCE_SECS', '2'))
+STORAGE_MAX_DELAY_SECS = float(os.environ.get('STORAGE_MAX_DELAY_SECS', '10'))
+
+
+def parse_shared_relays(value):
+    """
+    Parses shared relays definition in format "<shared relay>:<dependent relay>,<dependent relay>;..."
+    :return: List of tuples (shared relay index, list of dependent relay indexes)
+    :rtype: list
+    """
+    shared_relays = []
+    for definition in value.split(";"):
+        if not definition.strip():
+            continue
+        relay_index, dependent_relay_indexes = definition.split(":")
+        shared_relays.append((int(relay_index), [int(index) for index in dependent_relay_indexes.split(",")]))
+    return shared_relays
+
+
+# Relays driving devices shared by several programs, eg. glycol chiller pump feeding several fermenters, each having
+# its own cooling solenoid. SHARED_RELAYS=7:0,1,2 means that relay 7 is activated whenever relay 0, 1 or 2 is active
+SHARED_RELAYS = parse_shared_relays(os.environ.get('SHARED_RELAYS', ''))
+SHARED_RELAY_MIN_ON_SECS = float(os.environ.get('SHARED_RELAY_MIN_ON_SECS', '60'))
+SHARED_RELAY_MIN_OFF_SECS = float(os.environ.get('SHARED_RELAY_MIN_OFF_SECS', '60'))
+
+
+def parse_relay_power_ratings(value):
+    """
+    Parses relay power ratings definition in format "<relay>:<watts>,<relay>:<watts>..."
+    :return: Power ratings (watts) by relay index
+    :rtype: dict
+    """
+    relay_power_ratings = {}
+    for definition in value.split(","):
+        if not definition.strip():
+            continue
+        relay_index, watts = definition.split(":")
+        relay_power_ratings[int(relay_index)] = float(watts)
+    return relay_power_ratings
+
+
+# Power of devices attached to relays and total power available for them, eg. several heating pads on one circuit.
+# RELAY_POWER_RATINGS=0:400,1:400,2:400 with POWER_BUDGET_WATTS=1000 allows at most two of the pads active at once.
+# Activations of rated relays are staggered by POWER_STAGGER_SECS to limit inrush current. Power is not scheduled if
+# RELAY_POWER_RATINGS is empty
+RELAY_POWER_RATINGS = parse_relay_power_ratings(os.environ.get('RELAY_POWER_RATINGS', ''))
+POWER_BUDGET_WATTS = float(os.environ.get('POWER_BUDGET_WATTS', '0'))
+POWER_STAGGER_SECS = float(os.environ.get('POWER_STAGGER_SECS', '5'))
+
+
+# Journal holding relay and program states, written by the controller every JOURNAL_INTERVAL_SECS and restored after
+# restart if not older than JOURNAL_MAX_AGE_SECS. Kept in memory backed /dev/shm if available, it has to survive
+# restarts of the process only
+JOURNAL_FILE = os.environ.get('JOURNAL_FILE', os.path.join('/dev/shm' if os.path.isdir('/dev/shm') else
+                                                           tempfile.gettempdir(), 'brewery-journal.json'))
+JOURNAL_INTERVAL_SECS = float(os.environ.get('JOURNAL_INTERVAL_SECS', '5'))
+JOURNAL_MAX_AGE_SECS = float(os.environ.get('JOURNAL_MAX_AGE_SECS', '300'))
+
+# Number of log entries kept in memory and optionally their approximate total size in bytes, the oldest entries are
+# dropped first
+LOG_MAX_ENTRIES = int(os.environ.get('LOG_MAX_ENTRIES', '10000'))
+LOG_MAX_BYTES = int(os.environ['LOG_MAX_BYTES']) if os.environ.get('LOG_MAX_BYTES') else None
+
+# Maximum number of log entries waiting to be written to stdout, the oldest are dropped if the output stalls
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+
+# Directory of persistent log files, total size of the files and size of a single file in bytes. Logs are not
+# written to files if the total size is 0
+LOG_DIR = os.environ.get('LOG_DIR', os.path.join(os.path.expanduser("~"), ".brewery", "logs"))
+LOG_FILES_MAX_BYTES = int(os.environ.get('LOG_FILES_MAX_BYTES', str(20 * 1024 * 1024)))
+LOG_FILE_SEGMENT_BYTES = int(os.environ.get('LOG_FILE_SEGMENT_BYTES', str(1024 * 1024)))
+
+# Repeats of a log message within the window are collapsed into a single "repeated N times" message, 0 disables it
+LOG_REPEAT_WINDOW_SECS = float(os.environ.get('LOG_REPEAT_WINDOW_SECS', '60'))
+
+# HTTP server - "development" (Werkzeug) or "waitress" (production WSGI server, see requirements.txt), number of
+# worker threads, maximum number of open connections, idle connection timeout and time given to requests being
+# handled at exit
+HTTP_SERVER = os.environ.get('HTTP_SERVER', 'development')
+HTTP_THREADS = int(os.environ.get('HTTP_THREADS', '4'))
+HTTP_CONNECTION_LIMIT = int(os.environ.get('HTTP_CONNECTION_LIMIT', '100'))
+HTTP_CHANNEL_TIMEOUT_SECS = float(os.environ.get('HTTP_CHANNEL_TIMEOUT_SECS', '30'))
+HTTP_SHUTDOWN_TIMEOUT_SECS = float(os.environ.get('HTTP_SHUTDOWN_TIMEOUT_SECS', '5'))
+
+# Maximum number of event stream clients, more are refused with 503. Each client holds a worker thread while
+# connected, so the limit must stay below HTTP_THREADS to leave threads for the other requests
+STREAM_MAX_CLIENTS = int(os.environ.get('STREAM_MAX_CLIENTS', str(max(HTTP_THREADS - 2, 1))))
+
+# Fraction of successful HTTP requests written to the access log, failed requests are logged always. In debug mode
+# all requests are logged with their bodies
+ACCESS_LOG_SAMPLE_RATE = float(os.environ.get('ACCESS_LOG_SAMPLE_RATE', '0.1'))
+ACCESS_LOG_DEBUG = os.environ.get('ACCESS_LOG_DEBUG', '0') == '1'
@@ -8,15 +8,28 @@ if hw_config.RUN_ON_RASPBERRY:
 class RelayApi(object):
     RELAY_GPIO_CHANNELS = [17, 27, 22, 23, 24, 25, 16, 26]
 
-    def __init__(self, low_voltage_control=True) -> None:
+    def __init__(self, low_voltage_control=True, initial_states=None) -> None:
+        """
+        Creates relay api instance and sets up GPIO channels of the relays.
+        :param low_voltage_control: True if relays are activated with low voltage
+        :type low_voltage_control: bool
+        :param initial_states: States (0|1) the relays are set up with, by relay index, eg. restored after restart.
+        All relays are set up inactive if not given
+        :type initial_states: list
+        """
         super().__init__()
         self.low_voltage_control = low_voltage_control
-        self.__init_gpio()
+        self.__init_gpio(initial_states)
 
-    def __init_gpio(self):
+    def __init_gpio(self, initial_states):
         GPIO.setwarnings(False)
         GPIO.setmode(GPIO.BCM)
-        GPIO.setup(self.RELAY_GPIO_CHANNELS, GPIO.OUT, initial=GPIO.HIGH if self.low_voltage_control else GPIO.LOW)
+        if initial_states is None:
+            GPIO.setup(self.RELAY_GPIO_CHANNELS, GPIO.OUT, initial=GPIO.HIGH if self.low_voltage_control else GPIO.LOW)
+            return
+        for relay_index, gpio in enumerate(self.RELAY_GPIO_CHANNELS):
+            active = relay_index < len(initial_states) and initial_states[relay_index] == 1
+            GPIO.setup(gpio, GPIO.OUT, initial=GPIO.LOW if active == self.low_voltage_control else GPIO.HIGH)
 
     def get_relay_state(self, relay_index):
         """
@@ -56,11 +69,11 @@ class RelayApi(object):
         else:
             gpio_state = GPIO.HIGH if state == 1 else GPIO.LOW
         GPIO.output(gpio, gpio_state)
-        Logger.info("GPIO {} set to {}".format(gpio, gpio_state))
+        Logger.info("GPIO {} set to {}", gpio, gpio_state)
 
         # Validate that the state was actually set
         gpio_read_state = GPIO.input(gpio)
         if gpio_state != gpio_read_state:
-            Logger.error("GPIO {} was set to {} but current value that was read is {}"
-                         .format(gpio, gpio_state, gpio_read_state))
+            Logger.error("GPIO {} was set to {} but current value that was read is {}",
+                         gpio, gpio_state, gpio_read_state)
         return gpio_read_state
@@ -0,0 +1,687 @@
+import bisect
+import json
+import math
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+
+from app.logger import Logger
+
+
+class HistoryRecord(object):
+    """
+    Single history sample - temperature measured by a sensor and states of all relays at that time
+    """
+
+    __slots__ = ("__timestamp", "__sensor_id", "__temperature", "__relay_mask")
+
+    def __init__(self, timestamp, sensor_id, temperature, relay_mask):
+        """
+        Creates history record instance.
+        :param timestamp: Time of the sample, seconds since epoch
+        :type timestamp: float
+        :param sensor_id: Id of the sensor the temperature was measured by
+        :type sensor_id: str
+        :param temperature: Measured temperature or None if it could not be measured
+        :type temperature: float
+        :param relay_mask: States of the relays, bit N is set when relay N was active
+        :type relay_mask: int
+        """
+        self.__timestamp = timestamp
+        self.__sensor_id = sensor_id
+        self.__temperature = temperature
+        self.__relay_mask = relay_mask
+
+    @property
+    def timestamp(self):
+        return self.__timestamp
+
+    @property
+    def sensor_id(self):
+        return self.__sensor_id
+
+    @property
+    def temperature(self):
+        return self.__temperature
+
+    @property
+    def relay_mask(self):
+        return self.__relay_mask
+
+    def is_relay_active(self, relay_index):
+        return relay_index >= 0 and bool(self.__relay_mask & (1 << relay_index))
+
+    def __eq__(self, other):
+        if not isinstance(other, HistoryRecord):
+            return False
+        return self.__key() == other.__key()
+
+    def __hash__(self):
+        return hash(self.__key())
+
+    def __key(self):
+        return self.timestamp, self.sensor_id, self.temperature, self.relay_mask
+
+    def __str__(self):
+        return "HistoryRecord [timestamp:{} sensor_id:{} temperature:{} relay_mask:{:#x}]".format(
+            self.timestamp, self.sensor_id, self.temperature, self.relay_mask)
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class RollupRecord(object):
+    """
+    Aggregate of the history samples of a sensor within a time period of fixed length (resolution)
+    """
+
+    __slots__ = ("__timestamp", "__sensor_id", "__resolution_secs", "__min_temperature", "__max_temperature",
+                 "__mean_temperature", "__count", "__relay_on_secs")
+
+    def __init__(self, timestamp, sensor_id, resolution_secs, min_temperature, max_temperature, mean_temperature,
+                 count, relay_on_secs):
+        """
+        Creates rollup record instance.
+        :param timestamp: Beginning of the period, seconds since epoch
+        :type timestamp: float
+        :param sensor_id: Id of the sensor the temperatures were measured by
+        :type sensor_id: str
+        :param resolution_secs: Length of the period
+        :type resolution_secs: int
+        :param min_temperature: Minimum temperature within the period, None if no temperature was measured
+        :type min_temperature: float
+        :param max_temperature: Maximum temperature within the period, None if no temperature was measured
+        :type max_temperature: float
+        :param mean_temperature: Mean temperature within the period, None if no temperature was measured
+        :type mean_temperature: float
+        :param count: Number of measured temperatures
+        :type count: int
+        :param relay_on_secs: Seconds each relay was active within the period, by relay index
+        :type relay_on_secs: tuple
+        """
+        self.__timestamp = timestamp
+        self.__sensor_id = sensor_id
+        self.__resolution_secs = resolution_secs
+        self.__min_temperature = min_temperature
+        self.__max_temperature = max_temperature
+        self.__mean_temperature = mean_temperature
+        self.__count = count
+        self.__relay_on_secs = tuple(relay_on_secs)
+
+    @property
+    def timestamp(self):
+        return self.__timestamp
+
+    @property
+    def sensor_id(self):
+        return self.__sensor_id
+
+    @property
+    def resolution_secs(self):
+        return self.__resolution_secs
+
+    @property
+    def min_temperature(self):
+        return self.__min_temperature
+
+    @property
+    def max_temperature(self):
+        return self.__max_temperature
+
+    @property
+    def mean_temperature(self):
+        return self.__mean_temperature
+
+    @property
+    def count(self):
+        return self.__count
+
+    @property
+    def relay_on_secs(self):
+        return self.__relay_on_secs
+
+    def get_relay_on_secs(self, relay_index):
+        return self.__relay_on_secs[relay_index] if 0 <= relay_index < len(self.__relay_on_secs) else 0.0
+
+    def merge(self, other):
+        """
+        Returns rollup of both this and the other rollup of the same period, eg. when the period was interrupted by
+        a restart and stored twice
+        :rtype: RollupRecord
+        """
+        count = self.count + other.count
+        temperatures = [rollup for rollup in (self, other) if rollup.count > 0]
+        return RollupRecord(
+            self.timestamp, self.sensor_id, self.resolution_secs,
+            min(rollup.min_temperature for rollup in temperatures) if temperatures else None,
+            max(rollup.max_temperature for rollup in temperatures) if temperatures else None,
+            sum(rollup.mean_temperature * rollup.count for rollup in temperatures) / count if temperatures else None,
+            count,
+            [secs + other_secs for secs, other_secs in zip(self.relay_on_secs, other.relay_on_secs)])
+
+    def __eq__(self, other):
+        if not isinstance(other, RollupRecord):
+            return False
+        return self.__key() == other.__key()
+
+    def __hash__(self):
+        return hash(self.__key())
+
+    def __key(self):
+        return self.timestamp, self.sensor_id, self.resolution_secs, self.min_temperature, self.max_temperature, \
+            self.mean_temperature, self.count, self.relay_on_secs
+
+    def __str__(self):
+        return "RollupRecord [timestamp:{} sensor_id:{} resolution_secs:{} min_temperature:{} max_temperature:{} " \
+               "mean_temperature:{} count:{}]".format(self.timestamp, self.sensor_id, self.resolution_secs,
+                                                      self.min_temperature, self.max_temperature,
+                                                      self.mean_temperature, self.count)
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class _Segment(object):
+    # Segment file with a sparse index - timestamp of every INDEX_STRIDE-th record
+
+    __slots__ = ("path", "record_count", "index")
+
+    def __init__(self, path):
+        self.path = path
+        self.record_count = 0
+        self.index = []
+
+
+class _SegmentLog(object):
+    """
+    Append-only sequence of segment files with fixed-width records, the first field of each record is its
+    timestamp. Records are appended by a single writer thread and read by any thread
+    """
+
+    INDEX_STRIDE = 256
+    SEGMENT_FILE_SUFFIX = ".seg"
+
+    def __init__(self, log_dir, record_format, segment_records):
+        super().__init__()
+        self.__log_dir = log_dir
+        self.__record_format = record_format
+        self.__segment_records = segment_records
+        self.__lock = threading.Lock()
+        self.__output_stream = None
+        self.last_timestamp = None
+        os.makedirs(log_dir, exist_ok=True)
+        self.__segments = self.__load_segments()
+
+    def append(self, records):
+        """
+        Writes the records and makes them visible to readers. Timestamps of the records must not decrease
+        """
+        segment = self.__get_writable_segment()
+        timestamps = []
+        for record in records:
+            if segment.record_count + len(timestamps) >= self.__segment_records:
+                self.__commit_records(segment, timestamps)
+                timestamps = []
+                segment = self.__start_segment()
+            self.__output_stream.write(self.__record_format.pack(*record))
+            timestamps.append(record[0])
+        self.__commit_records(segment, timestamps)
+        if timestamps:
+            self.last_timestamp = timestamps[-1]
+
+    def scan(self, start, end):
+        """
+        Yields unpacked records with timestamp within the range (inclusive), ordered by timestamp
+        """
+        self.__lock.acquire()
+        try:
+            segments = [(segment.path, segment.record_count, list(segment.index)) for segment in self.__segments
+                        if segment.record_count > 0]
+        finally:
+            self.__lock.release()
+
+        record_size = self.__record_format.size
+        for position, (path, record_count, index) in enumerate(segments):
+            if index[0] > end:
+                return
+            if position + 1 < len(segments) and segments[position + 1][2][0] < start:
+                # the whole segment is older than the range
+                continue
+            first_record = max(bisect.bisect_left(index, start) - 1, 0) * _SegmentLog.INDEX_STRIDE
+            try:
+                input_stream = open(path, "rb")
+            except FileNotFoundError:
+                # expired meanwhile
+                continue
+            with input_stream, mmap.mmap(input_stream.fileno(), record_count * record_size,
+                                         access=mmap.ACCESS_READ) as data:
+                for offset in range(first_record * record_size, record_count * record_size, record_size):
+                    record = self.__record_format.unpack_from(data, offset)
+                    if record[0] > end:
+                        return
+                    if record[0] >= start:
+                        yield record
+
+    def expire(self, timestamp):
+        """
+        Removes segments that contain only records older than the given timestamp. The segment being written is
+        never removed
+        """
+        while len(self.__segments) > 1 and self.__segments[1].record_count > 0 and \
+                self.__segments[1].index[0] < timestamp:
+            self.__lock.acquire()
+            try:
+                segment = self.__segments.pop(0)
+            finally:
+                self.__lock.release()
+            os.remove(segment.path)
+            Logger.info("History segment {} expired".format(segment.path))
+
+    def close(self):
+        if self.__output_stream is not None:
+            self.__output_stream.close()
+            self.__output_stream = None
+
+    def __commit_records(self, segment, timestamps):
+        self.__output_stream.flush()
+        self.__lock.acquire()
+        try:
+            for timestamp in timestamps:
+                if segment.record_count % _SegmentLog.INDEX_STRIDE == 0:
+                    segment.index.append(timestamp)
+                segment.record_count += 1
+        finally:
+            self.__lock.release()
+
+    def __get_writable_segment(self):
+        if not self.__segments or self.__segments[-1].record_count >= self.__segment_records:
+            return self.__start_segment()
+        if self.__output_stream is None:
+            self.__output_stream = open(self.__segments[-1].path, "ab")
+        return self.__segments[-1]
+
+    def __start_segment(self):
+        self.close()
+        sequence = int(os.path.basename(self.__segments[-1].path)[:-len(_SegmentLog.SEGMENT_FILE_SUFFIX)]) + 1 \
+            if self.__segments else 0
+        segment = _Segment(os.path.join(self.__log_dir, "{:08d}{}".format(sequence, _SegmentLog.SEGMENT_FILE_SUFFIX)))
+        self.__output_stream = open(segment.path, "ab")
+        self.__lock.acquire()
+        try:
+            self.__segments.append(segment)
+        finally:
+            self.__lock.release()
+        return segment
+
+    def __load_segments(self):
+        segments = []
+        record_size = self.__record_format.size
+        file_names = sorted(file_name for file_name in os.listdir(self.__log_dir)
+                            if file_name.endswith(_SegmentLog.SEGMENT_FILE_SUFFIX))
+        for file_name in file_names:
+            segment = _Segment(os.path.join(self.__log_dir, file_name))
+            size = os.path.getsize(segment.path)
+            if size % record_size != 0:
+                # the last record was not written completely, eg. because of a power cut
+                Logger.error("History segment {} truncated to whole records".format(segment.path))
+                size -= size % record_size
+                os.truncate(segment.path, size)
+            segment.record_count = size // record_size
+            if segment.record_count > 0:
+                with open(segment.path, "rb") as input_stream:
+                    with mmap.mmap(input_stream.fileno(), size, access=mmap.ACCESS_READ) as data:
+                        segment.index = [self.__record_format.unpack_from(data, offset)[0]
+                                         for offset in range(0, size, record_size * _SegmentLog.INDEX_STRIDE)]
+                        self.last_timestamp = self.__record_format.unpack_from(data, size - record_size)[0]
+            segments.append(segment)
+        return segments
+
+
+class _Rollup(object):
+    # Aggregate of the samples of a sensor within the period being rolled up
+
+    __slots__ = ("min_temperature", "max_temperature", "temperature_sum", "count", "relay_on_secs")
+
+    def __init__(self):
+        self.min_temperature = math.inf
+        self.max_temperature = -math.inf
+        self.temperature_sum = 0.0
+        self.count = 0
+        self.relay_on_secs = [0.0] * HistoryStore.RELAYS_COUNT
+
+    def add(self, temperature, relay_mask, elapsed_secs):
+        if temperature is not None:
+            self.min_temperature = min(self.min_temperature, temperature)
+            self.max_temperature = max(self.max_temperature, temperature)
+            self.temperature_sum += temperature
+            self.count += 1
+        relay_index = 0
+        while relay_mask:
+            if relay_mask & 1:
+                self.relay_on_secs[relay_index] += elapsed_secs
+            relay_mask >>= 1
+            relay_index += 1
+
+    def to_packed_fields(self, timestamp, sensor_index):
+        if self.count == 0:
+            return (timestamp, sensor_index, math.nan, math.nan, math.nan, 0) + tuple(self.relay_on_secs)
+        return (timestamp, sensor_index, self.min_temperature, self.max_temperature,
+                self.temperature_sum / self.count, self.count) + tuple(self.relay_on_secs)
+
+
+class _Tier(object):
+    # Rollups of one resolution, all sensors share the period being rolled up
+
+    __slots__ = ("resolution_secs", "retention_secs", "log", "period_start", "rollups")
+
+    def __init__(self, resolution_secs, retention_secs, log):
+        self.resolution_secs = resolution_secs
+        self.retention_secs = retention_secs
+        self.log = log
+        self.period_start = None
+        self.rollups = {}
+
+
+class HistoryStore(object):
+    """
+    Append-only store of temperature and relay history. Samples have fixed width and are appended to segment
+    files, a new segment is started once the current one is full. Samples are written by a background thread, so
+    appending never blocks the caller. Reads map segment files to memory and use sparse time index to find the first
+    record of the requested range, so range queries don't parse whole segments.
+
+    Besides the samples the store keeps rollups (min, max, mean and count of temperatures, seconds each relay was
+    active) of several resolutions, each of them updated incrementally as samples are written. Samples and rollups
+    expire after their retention period, so the history of long periods is kept at coarse resolution only.
+
+    Timestamps never decrease within the store, a sample older than the previous one (eg. after the system clock was
+    set back) is stored with the timestamp of the previous one
+    """
+
+    # timestamp float64, sensor index uint16, temperature float32 (NaN when unknown), relay bitmask uint16
+    RECORD_FORMAT = struct.Struct("<dHfH")
+    RELAYS_COUNT = 16
+    # period start float64, sensor index uint16, min, max and mean temperature float32 (NaN when unknown),
+    # count uint32, active seconds of each relay float32
+    ROLLUP_RECORD_FORMAT = struct.Struct("<dHfffI{}f".format(RELAYS_COUNT))
+    INDEX_STRIDE = _SegmentLog.INDEX_STRIDE
+    SEGMENT_FILE_SUFFIX = _SegmentLog.SEGMENT_FILE_SUFFIX
+    SENSORS_FILE_NAME = "sensors.json"
+    RAW_DIR_NAME = "raw"
+    ROLLUP_DIR_NAME = "rollup-{}"
+    DAY_SECS = 24 * 3600
+    # (resolution, retention) of rollup tiers, retention None means forever
+    DEFAULT_TIERS = ((60, 90 * DAY_SECS), (15 * 60, 2 * 365 * DAY_SECS), (3600, None))
+    # gap between samples longer than this is considered an outage, relays are not counted active during it
+    MAX_SAMPLE_GAP_SECS = 60.0
+
+    def __init__(self, history_dir, segment_records=65536, queue_size=4096, raw_retention_secs=7 * DAY_SECS,
+                 tiers=DEFAULT_TIERS):
+        """
+        Creates history store instance, existing segments in the directory are indexed.
+        :param history_dir: Directory segment files are stored in, created if needed
+        :type history_dir: str
+        :param segment_records: Maximum number of records in a segment file
+        :type segment_records: int
+        :param queue_size: Maximum number of samples waiting to be written, samples appended to a full queue are
+        dropped
+        :type queue_size: int
+        :param raw_retention_secs: How long the samples are kept, None means forever
+        :type raw_retention_secs: float
+        :param tiers: Resolution and retention (seconds) of each rollup tier, retention None means forever
+        :type tiers: list
+        """
+        super().__init__()
+        self.__history_dir = history_dir
+        self.__queue = queue.Queue(maxsize=queue_size)
+        self.__lock = threading.Lock()
+        self.__thread = None
+        self.__dropped_count = 0
+        self.__raw_retention_secs = raw_retention_secs
+        os.makedirs(history_dir, exist_ok=True)
+        self.__sensor_ids = self.__load_sensor_ids()
+        self.__sensor_indexes = {sensor_id: index for index, sensor_id in enumerate(self.__sensor_ids)}
+        self.__raw_log = _SegmentLog(os.path.join(history_dir, HistoryStore.RAW_DIR_NAME),
+                                     HistoryStore.RECORD_FORMAT, segment_records)
+        self.__last_timestamp = self.__raw_log.last_timestamp if self.__raw_log.last_timestamp is not None \
+            else -math.inf
+        self.__tiers = [_Tier(resolution_secs, retention_secs,
+                              _SegmentLog(os.path.join(history_dir,
+                                                       HistoryStore.ROLLUP_DIR_NAME.format(resolution_secs)),
+                                          HistoryStore.ROLLUP_RECORD_FORMAT, segment_records))
+                        for resolution_secs, retention_secs in sorted(tiers)]
+        # last sample (timestamp, relay mask) of each sensor, to count active relay seconds
+        self.__last_samples = {}
+
+    @property
+    def dropped_count(self):
+        return self.__dropped_count
+
+    @property
+    def tier_resolutions(self):
+        return [tier.resolution_secs for tier in self.__tiers]
+
+    def start(self):
+        """
+        Starts the writer thread
+        """
+        if self.__thread is not None:
+            raise RuntimeError("History writer already running")
+        self.__thread = threading.Thread(target=self.__write_loop, name="history-writer", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """
+        Writes all appended samples and rollups of the periods in progress and stops the writer thread
+        """
+        if self.__thread is None:
+            return
+        self.__queue.put(None)
+        self.__thread.join()
+        self.__thread = None
+
+    def append(self, sensor_id, temperature, relay_mask, timestamp=None):
+        """
+        Queues the sample to be written by the writer thread, never blocks
+        :param sensor_id: Id of the sensor the temperature was measured by
+        :type sensor_id: str
+        :param temperature: Measured temperature or None if it could not be measured
+        :type temperature: float
+        :param relay_mask: States of the relays, bit N is set when relay N is active
+        :type relay_mask: int
+        :param timestamp: Time of the sample, seconds since epoch. Current time if not given
+        :type timestamp: float
+        """
+        try:
+            self.__queue.put_nowait((time.time() if timestamp is None else timestamp, sensor_id, temperature,
+                                     relay_mask))
+        except queue.Full:
+            self.__dropped_count += 1
+
+    def flush(self):
+        """
+        Blocks until all appended samples are written
+        """
+        if self.__thread is not None:
+            self.__queue.join()
+
+    def select_tier(self, resolution_secs=None):
+        """
+        Returns resolution of the coarsest rollup tier that is not coarser than requested
+        :param resolution_secs: Requested resolution, samples are requested if not given
+        :type resolution_secs: float
+        :return: Resolution of the tier or None if samples have to be used
+        :rtype: int
+        """
+        selected = None
+        for tier in self.__tiers:
+            if resolution_secs is not None and tier.resolution_secs <= resolution_secs:
+                selected = tier.resolution_secs
+        return selected
+
+    def query(self, sensor_id, start=None, end=None, resolution_secs=None):
+        """
+        Returns history of the sensor within the time range
+        :param sensor_id: Id of the sensor
+        :type sensor_id: str
+        :param start: Beginning of the range (inclusive), seconds since epoch. Unbounded if not given
+        :type start: float
+        :param end: End of the range (inclusive), seconds since epoch. Unbounded if not given
+        :type end: float
+        :param resolution_secs: Requested resolution, see select_tier
+        :type resolution_secs: float
+        :return: Samples (HistoryRecord) if no rollup tier was selected, rollups (RollupRecord) of the selected tier
+        otherwise, ordered by timestamp
+        :rtype: list
+        """
+        start = -math.inf if start is None else start
+        end = math.inf if end is None else end
+        tier_resolution_secs = self.select_tier(resolution_secs)
+        self.__lock.acquire()
+        try:
+            sensor_index = self.__sensor_indexes.get(sensor_id)
+            tier = None
+            rollup = None
+            for candidate in self.__tiers:
+                if candidate.resolution_secs == tier_resolution_secs:
+                    tier = candidate
+                    rollup = candidate.rollups.get(sensor_index)
+                    if rollup is not None:
+                        rollup = rollup.to_packed_fields(candidate.period_start, sensor_index)
+        finally:
+            self.__lock.release()
+        if sensor_index is None:
+            return []
+
+        if tier is None:
+            return [HistoryRecord(timestamp, sensor_id, None if math.isnan(temperature) else temperature, relay_mask)
+                    for timestamp, index, temperature, relay_mask in self.__raw_log.scan(start, end)
+                    if index == sensor_index]
+
+        records = []
+        fields = [fields for fields in tier.log.scan(start - tier.resolution_secs, end) if fields[1] == sensor_index]
+        if rollup is not None and start - tier.resolution_secs <= rollup[0] <= end:
+            # the period in progress, not written yet
+            fields.append(rollup)
+        for timestamp, _, min_temperature, max_temperature, mean_temperature, count, *relay_on_secs in fields:
+            if timestamp + tier.resolution_secs <= start:
+                continue
+            record = RollupRecord(timestamp, sensor_id, tier.resolution_secs,
+                                  None if count == 0 else min_temperature, None if count == 0 else max_temperature,
+                                  None if count == 0 else mean_temperature, count, relay_on_secs)
+            if records and records[-1].timestamp == timestamp:
+                # the period was interrupted by a restart
+                record = records.pop().merge(record)
+            records.append(record)
+        return records
+
+    def __write_loop(self):
+        while True:
+            samples = [self.__queue.get()]
+            # write everything queued so far at once
+            while True:
+                try:
+                    samples.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in samples
+            try:
+                self.__write_samples([sample for sample in samples if sample is not None])
+                if stop:
+                    self.__write_rollups_in_progress()
+            except Exception as e:
+                Logger.error("History write error {}".format(str(e)))
+            finally:
+                for _ in samples:
+                    self.__queue.task_done()
+            if stop:
+                self.__raw_log.close()
+                for tier in self.__tiers:
+                    tier.log.close()
+                return
+
+    def __write_samples(self, samples):
+        if not samples:
+            return
+        records = []
+        for timestamp, sensor_id, temperature, relay_mask in samples:
+            timestamp = max(timestamp, self.__last_timestamp)
+            self.__last_timestamp = timestamp
+            records.append((timestamp, self.__get_sensor_index(sensor_id),
+                            math.nan if temperature is None else temperature, relay_mask))
+        self.__raw_log.append(records)
+        for record in records:
+            self.__roll_up(*record)
+        if self.__raw_retention_secs is not None:
+            self.__raw_log.expire(self.__last_timestamp - self.__raw_retention_secs)
+        for tier in self.__tiers:
+            if tier.retention_secs is not None:
+                tier.log.expire(self.__last_timestamp - tier.retention_secs)
+
+    def __roll_up(self, timestamp, sensor_index, temperature, relay_mask):
+        # relays are counted active from the previous sample of the sensor until this one
+        last_sample = self.__last_samples.get(sensor_index)
+        self.__last_samples[sensor_index] = (timestamp, relay_mask)
+        elapsed_secs = 0.0
+        last_relay_mask = 0
+        if last_sample is not None and timestamp - last_sample[0] <= HistoryStore.MAX_SAMPLE_GAP_SECS:
+            elapsed_secs = timestamp - last_sample[0]
+            last_relay_mask = last_sample[1]
+        temperature = None if math.isnan(temperature) else temperature
+
+        for tier in self.__tiers:
+            period_start = timestamp - timestamp % tier.resolution_secs
+            if tier.period_start is not None and period_start > tier.period_start:
+                self.__write_rollups(tier)
+            self.__lock.acquire()
+            try:
+                tier.period_start = period_start
+                rollup = tier.rollups.get(sensor_index)
+                if rollup is None:
+                    rollup = tier.rollups[sensor_index] = _Rollup()
+                rollup.add(temperature, last_relay_mask, elapsed_secs)
+            finally:
+                self.__lock.release()
+
+    def __write_rollups(self, tier):
+        tier.log.append([rollup.to_packed_fields(tier.period_start, sensor_index)
+                         for sensor_index, rollup in sorted(tier.rollups.items())])
+        self.__lock.acquire()
+        try:
+            tier.rollups = {}
+        finally:
+            self.__lock.release()
+
+    def __write_rollups_in_progress(self):
+        # the rest of the period, if any, is written separately after restart and merged when queried
+        for tier in self.__tiers:
+            if tier.rollups:
+                self.__write_rollups(tier)
+
+    def __get_sensor_index(self, sensor_id):
+        sensor_index = self.__sensor_indexes.get(sensor_id)
+        if sensor_index is not None:
+            return sensor_index
+        sensor_ids = self.__sensor_ids + [sensor_id]
+        sensors_file = os.path.join(self.__history_dir, HistoryStore.SENSORS_FILE_NAME)
+        with open(sensors_file + ".tmp", "w") as output_stream:
+            output_stream.write(json.dumps(sensor_ids))
+            output_stream.flush()
+            os.fsync(output_stream.fileno())
+        os.replace(sensors_file + ".tmp", sensors_file)
+        self.__lock.acquire()
+        try:
+            self.__sensor_ids = sensor_ids
+            self.__sensor_indexes[sensor_id] = len(sensor_ids) - 1
+        finally:
+            self.__lock.release()
+        return len(sensor_ids) - 1
+
+    def __load_sensor_ids(self):
+        sensors_file = os.path.join(self.__history_dir, HistoryStore.SENSORS_FILE_NAME)
+        if not os.path.exists(sensors_file):
+            return []
+        with open(sensors_file, "r") as input_stream:
+            return json.loads(input_stream.read())
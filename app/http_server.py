@@ -1,45 +1,195 @@
+import gzip
 import json
+import random
+import time
+import uuid
+from datetime import datetime
 
-from flask import Flask, Response, request
+from flask import Flask, Response, g, request
 import threading
 import sys
 
+from app.codec import JSON_CODEC, negotiate_codec
 from app.logger import Logger
-from app.controller import Controller, ProgramError
+from app.metrics import CONTENT_TYPE_PROMETHEUS, METRIC_TYPE_COUNTER, Histogram
+from app.controller import Controller, ProgramError, ProgramOperationsError
 from app.hardware.therm_sensor_api import NoSensorFoundError, SensorNotReadyError
-from app.program import Program
+from app.program import Program, ProgramOperation
 
 this_module = sys.modules[__name__]
 __controller = None
+__event_stream = None
 __server_running = False
+__server = None
+__etag_epoch = uuid.uuid4().hex[:8]
+# serialized responses by resource, see get_cached_content
+__response_cache = {}
+__access_log_sample_rate = 1.0
+__access_log_debug = False
+__random = random.random
+__metrics = None
+# durations by method and route, and response counts by method, route and status
+__request_durations = {}
+__response_counts = {}
+__request_metrics_lock = threading.Lock()
 app = Flask("BreweryRestAPI")
 SERVER_HOST = "0.0.0.0"
 SERVER_PORT = 8080
+# Werkzeug development server
+SERVER_MODE_DEVELOPMENT = "development"
+# waitress, production WSGI server with a pool of worker threads
+SERVER_MODE_WAITRESS = "waitress"
+SERVER_MODES = (SERVER_MODE_DEVELOPMENT, SERVER_MODE_WAITRESS)
 URL_PATH = "/brewery/api/v1.0/"
 URL_RESOURCE_SENSORS = "therm_sensors"
 URL_RESOURCE_PROGRAMS = "programs"
+URL_RESOURCE_PROGRAMS_BATCH = "programs/batch"
+URL_RESOURCE_HISTORY = "history"
 URL_RESOURCE_STATES = "states"
 URL_RESOURCE_LOGS = "logs"
+URL_RESOURCE_STREAM = "stream"
+URL_RESOURCE_SNAPSHOT = "snapshot"
+# scraped by Prometheus, outside of the API
+URL_METRICS = "/metrics"
+SNAPSHOT_FIELD_SENSORS = "sensors"
+SNAPSHOT_FIELD_PROGRAMS = "programs"
+SNAPSHOT_FIELD_STATES = "states"
+SNAPSHOT_FIELD_RELAYS = "relays"
+SNAPSHOT_FIELD_LOGS = "logs"
+SNAPSHOT_FIELDS = (SNAPSHOT_FIELD_SENSORS, SNAPSHOT_FIELD_PROGRAMS, SNAPSHOT_FIELD_STATES, SNAPSHOT_FIELD_RELAYS,
+                   SNAPSHOT_FIELD_LOGS)
+# versions of the controller each field depends on, relays are published by the loop together with the states
+SNAPSHOT_FIELD_VERSIONS = {SNAPSHOT_FIELD_SENSORS: (Controller.VERSION_SENSORS,),
+                           SNAPSHOT_FIELD_PROGRAMS: (Controller.VERSION_PROGRAMS,),
+                           SNAPSHOT_FIELD_STATES: (Controller.VERSION_PROGRAMS, Controller.VERSION_STATES),
+                           SNAPSHOT_FIELD_RELAYS: (Controller.VERSION_STATES,),
+                           SNAPSHOT_FIELD_LOGS: ()}
+SNAPSHOT_LOG_LIMIT = 50
+# a comment is sent to idle clients, so proxies don't close the connection
+STREAM_KEEP_ALIVE_SECS = 15
+# seconds a client refused by the stream should wait before reconnecting
+STREAM_RETRY_AFTER_SECS = 30
+# smaller responses are not compressed
+GZIP_MIN_BYTES = 1024
 
 @app.before_request
-def log_request():
-    print("Request {} {}".format(request.method, request.url))
-    print("Body: {}".format(request.get_data().decode("utf-8")))
+def start_request_timer():
+    g.request_start_time = time.monotonic()
+
+
+@app.after_request
+def log_access(response):
+    """
+    Logs method, path, status, size of the response and duration of sampled requests, and of all failed requests.
+    Bodies are logged for failed requests, or for all sampled requests in debug mode. Bodies of streamed responses
+    are never logged, reading them would buffer them
+    """
+    failed = response.status_code >= 400
+    if not failed and not this_module.__access_log_debug and \
+            this_module.__random() >= this_module.__access_log_sample_rate:
+        return response
+    duration_ms = (time.monotonic() - g.request_start_time) * 1000 if "request_start_time" in g else -1.0
+    content_length = None if response.is_streamed else response.calculate_content_length()
+    message = "Access method={} path={} status={} bytes={} duration_ms={:.1f}".format(
+        request.method, request.full_path if request.query_string else request.path, response.status_code,
+        "-" if content_length is None else content_length, duration_ms)
+    if failed or this_module.__access_log_debug:
+        message += " request_body={}".format(
+            format_logged_body(request.get_data(), request.mimetype, request.content_encoding))
+        if not response.is_streamed:
+            message += " response_body={}".format(
+                format_logged_body(response.get_data(), response.mimetype, response.content_encoding))
+    if failed:
+        Logger.error(message)
+    else:
+        Logger.info(message)
+    return response
+
+
+def format_logged_body(data, mimetype, content_encoding):
+    """
+    Returns the body as logged by log_access. Compressed bodies and bodies of binary content types (eg. MessagePack)
+    are logged by their length and encoding only
+    :type data: bytes
+    """
+    if data and (content_encoding or not (mimetype.startswith("text/") or mimetype == JSON_CODEC.content_type or
+                                          mimetype.endswith("+json"))):
+        return "<{} bytes {}>".format(len(data), content_encoding or mimetype or "unknown")
+    return repr(data.decode("utf-8", errors="replace"))
+
 
 @app.after_request
-def log_response(response):
-    print("Response {}".format(response.status))
-    print("Body: {}".format(response.get_data().decode("utf-8")))
+def record_request_metrics(response):
+    if "request_start_time" not in g:
+        return response
+    duration_secs = time.monotonic() - g.request_start_time
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    key = (request.method, route)
+    this_module.__request_metrics_lock.acquire()
+    try:
+        durations = this_module.__request_durations.get(key)
+        if durations is None:
+            durations = this_module.__request_durations[key] = Histogram()
+        count_key = (request.method, route, response.status_code)
+        this_module.__response_counts[count_key] = this_module.__response_counts.get(count_key, 0) + 1
+    finally:
+        this_module.__request_metrics_lock.release()
+    durations.observe(duration_secs)
     return response
 
 
+def collect_metrics(writer):
+    """
+    Adds durations of the requests and counts of the responses to the writer, see MetricsRegistry
+    :type writer: MetricsWriter
+    """
+    this_module.__request_metrics_lock.acquire()
+    try:
+        request_durations = sorted(this_module.__request_durations.items())
+        response_counts = sorted(this_module.__response_counts.items())
+    finally:
+        this_module.__request_metrics_lock.release()
+    for (method, route), durations in request_durations:
+        writer.add_histogram("brewery_http_request_duration_seconds", durations, {"method": method, "route": route},
+                             help_text="Duration of the requests until the response was returned")
+    for (method, route, status), count in response_counts:
+        writer.add("brewery_http_responses_total", METRIC_TYPE_COUNTER, count,
+                   {"method": method, "route": route, "status": status}, help_text="Number of the responses")
+
+
+@app.route(URL_METRICS, methods=['GET'])
+def get_metrics():
+    metrics = this_module.__metrics
+    if metrics is None:
+        return invalid_request_response(404)
+    return Response(metrics.collect(), content_type=CONTENT_TYPE_PROMETHEUS)
+
+
+def configure_access_log(sample_rate=1.0, debug=False, random_function=random.random):
+    """
+    :param sample_rate: Fraction of successful requests that are logged, failed requests are logged always
+    :type sample_rate: float
+    :param debug: Logs all requests with their bodies
+    :type debug: bool
+    :param random_function: Function returning a random number in [0, 1) deciding whether a request is sampled
+    """
+    this_module.__access_log_sample_rate = sample_rate
+    this_module.__access_log_debug = debug
+    this_module.__random = random_function
+
+
 @app.route(URL_PATH + URL_RESOURCE_SENSORS, methods=['GET'])
 def get_therm_sensors():
-    sensors = __controller.get_therm_sensors()
-    response = []
-    for sensor in sensors:
-        response.append(sensor.to_json_data())
-    return valid_request_response(json.dumps(response))
+    codec = negotiate_codec(request.accept_mimetypes)
+    etag = create_etag(Controller.VERSION_SENSORS, codec=codec)
+    if request.if_none_match.contains(etag):
+        return not_modified_response(etag)
+
+    def serialize():
+        return [sensor.to_json_data() for sensor in __controller.get_therm_sensors()], None
+
+    content = get_cached_content(URL_RESOURCE_SENSORS, etag, codec, serialize)
+    return tagged_response(cached_content_response(content, codec), etag)
 
 
 @app.route(URL_PATH + URL_RESOURCE_SENSORS + "/<sensor_id>", methods=['GET'])
@@ -48,7 +198,7 @@ def get_therm_sensor_temperature(sensor_id):
         temperature = __controller.get_therm_sensor_temperature(sensor_id)
         # todo: refactor to remove json assembling here
         response = {"id": sensor_id, "temperature": temperature}
-        return valid_request_response(json.dumps(response))
+        return encoded_response(response)
     except NoSensorFoundError as e:
         return invalid_request_response(404, content=str(e))
     except SensorNotReadyError as e:
@@ -64,14 +214,19 @@ def programs():
 
 
 def get_programs():
-    response = []
-    for program in __controller.get_programs():
-        response.append(program.to_json_data())
-    return valid_request_response(json.dumps(response))
+    codec = negotiate_codec(request.accept_mimetypes)
+    etag = create_etag(Controller.VERSION_PROGRAMS, codec=codec)
+    if request.if_none_match.contains(etag):
+        return not_modified_response(etag)
+
+    def serialize():
+        return [program.to_json_data() for program in __controller.get_programs()], None
+
+    content = get_cached_content(URL_RESOURCE_PROGRAMS, etag, codec, serialize)
+    return tagged_response(cached_content_response(content, codec), etag)
 
 
 def create_program(req):
-    print("Json: {}".format(req.json))
     program = Program.from_json_data(req.json)
     try:
         created_program = __controller.create_program(program)
@@ -80,6 +235,26 @@ def create_program(req):
         return invalid_request_response(e.get_http_status(), content=e.to_json())
 
 
+@app.route(URL_PATH + URL_RESOURCE_PROGRAMS_BATCH, methods=['POST'])
+def apply_program_operations():
+    data = request.get_json(silent=True)
+    if not is_list_of_program_operations(data):
+        error = ProgramOperationsError([], "Program operations must be a list of objects")
+        return invalid_request_response(400, content=error.to_json())
+    operations = [ProgramOperation.from_json_data(operation_data) for operation_data in data]
+    try:
+        results = __controller.apply_program_operations(operations)
+        return valid_request_response(json.dumps([result.to_json_data() for result in results]))
+    except ProgramOperationsError as e:
+        return invalid_request_response(e.get_http_status(), content=e.to_json())
+
+
+def is_list_of_program_operations(data):
+    return isinstance(data, list) and all(isinstance(operation_data, dict) and
+                                          isinstance(operation_data.get("program", {}), dict)
+                                          for operation_data in data)
+
+
 @app.route(URL_PATH + URL_RESOURCE_PROGRAMS + "/<program_id>", methods=['PUT', 'DELETE'])
 def modify_program(program_id):
     if request.method == 'PUT':
@@ -105,31 +280,266 @@ def delete_program(program_id):
         return invalid_request_response(e.get_http_status(), content=e.to_json())
 
 
+@app.route(URL_PATH + URL_RESOURCE_PROGRAMS + "/<program_id>/" + URL_RESOURCE_HISTORY, methods=['GET'])
+def get_program_history(program_id):
+    try:
+        history = __controller.get_program_history(program_id, request.args.get("from", type=float),
+                                                   request.args.get("to", type=float),
+                                                   request.args.get("resolution", type=float))
+        return encoded_response([entry.to_json_data() for entry in history])
+    except ProgramError as e:
+        return invalid_request_response(e.get_http_status(), content=e.to_json())
+
+
 @app.route(URL_PATH + URL_RESOURCE_STATES, methods=['GET'])
 def get_program_states():
+    codec = negotiate_codec(request.accept_mimetypes)
+    etag = create_etag(Controller.VERSION_PROGRAMS, Controller.VERSION_STATES, codec=codec)
+    if request.if_none_match.contains(etag):
+        return not_modified_response(etag)
+
+    def serialize():
+        states = __controller.get_program_states()
+        return [state.to_json_data() for state in states], states
+
     try:
-        response = []
-        for state in __controller.get_program_states():
-            response.append(state.to_json_data())
-        return valid_request_response(json.dumps(response))
+        content = get_cached_content(URL_RESOURCE_STATES, etag, codec, serialize)
+        return tagged_response(program_states_response(cached_content_response(content, codec), content.context),
+                               etag)
     except ProgramError as e:
         return invalid_request_response(e.get_http_status(), content=e.to_json())
 
 
 @app.route(URL_PATH + URL_RESOURCE_STATES + "/<program_id>", methods=['GET'])
 def get_program_state(program_id):
+    codec = negotiate_codec(request.accept_mimetypes)
+    etag = create_etag(Controller.VERSION_PROGRAMS, Controller.VERSION_STATES, codec=codec)
+    if request.if_none_match.contains(etag):
+        return not_modified_response(etag)
     try:
         state = __controller.get_program_state(program_id)
-        return valid_request_response(json.dumps(state.to_json_data()))
+        return tagged_response(program_states_response(encoded_response(state.to_json_data(), codec), [state]), etag)
     except ProgramError as e:
         return invalid_request_response(e.get_http_status(), content=e.to_json())
 
 
+@app.route(URL_PATH + URL_RESOURCE_STREAM, methods=['GET'])
+def get_event_stream():
+    event_stream = this_module.__event_stream
+    if event_stream is None:
+        return invalid_request_response(404)
+    subscription = event_stream.subscribe(request.headers.get("Last-Event-ID"))
+    if subscription is None:
+        # each client holds a worker thread, refused so the other resources stay available
+        response = invalid_request_response(503)
+        response.headers["Retry-After"] = str(STREAM_RETRY_AFTER_SECS)
+        return response
+
+    def generate():
+        try:
+            while True:
+                events = subscription.get(STREAM_KEEP_ALIVE_SECS)
+                if events is None:
+                    return
+                if not events:
+                    yield b": keep-alive\n\n"
+                for event in events:
+                    yield event.to_sse()
+        finally:
+            # also when the client disconnects
+            subscription.close()
+
+    response = Response(generate(), content_type="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def program_states_response(response, states):
+    """
+    Program states are captured by the controller's loop, the Age header tells how many seconds ago the oldest of
+    the returned states was captured
+    """
+    ages = [state.get_age() for state in states]
+    ages = [age for age in ages if age is not None]
+    if ages:
+        response.headers["Age"] = str(int(max(ages)))
+    return response
+
+
+@app.route(URL_PATH + URL_RESOURCE_SNAPSHOT, methods=['GET'])
+def get_snapshot():
+    fields = SNAPSHOT_FIELDS
+    if "fields" in request.args:
+        selected = set(field.strip() for field in request.args["fields"].split(","))
+        fields = [field for field in SNAPSHOT_FIELDS if field in selected]
+    if not fields:
+        return invalid_request_response(400, content=json.dumps(
+            {"error_code": "invalid_fields", "message": "No valid fields selected:{}".format(request.args["fields"])}))
+    log_limit = request.args.get("log_limit", SNAPSHOT_LOG_LIMIT, type=int)
+    snapshot = __controller.get_snapshot()
+    logs, log_cursor = Logger.get_recent_logs(log_limit) if SNAPSHOT_FIELD_LOGS in fields else ([], None)
+
+    codec = negotiate_codec(request.accept_mimetypes)
+    version_names = sorted(set(name for field in fields for name in SNAPSHOT_FIELD_VERSIONS[field]))
+    etag = "{}-{}".format(create_etag(*version_names, codec=codec, versions=snapshot.versions), ".".join(fields))
+    if log_cursor is not None:
+        etag += "-{}.{}".format(log_limit, log_cursor)
+    if request.if_none_match.contains(etag):
+        return not_modified_response(etag)
+
+    def serialize():
+        data = {}
+        if SNAPSHOT_FIELD_SENSORS in fields:
+            data[SNAPSHOT_FIELD_SENSORS] = [sensor.to_json_data() for sensor in snapshot.sensors]
+        if SNAPSHOT_FIELD_PROGRAMS in fields:
+            data[SNAPSHOT_FIELD_PROGRAMS] = [program.to_json_data() for program in snapshot.programs]
+        if SNAPSHOT_FIELD_STATES in fields:
+            data[SNAPSHOT_FIELD_STATES] = [state.to_json_data() for state in snapshot.program_states]
+        if SNAPSHOT_FIELD_RELAYS in fields:
+            data[SNAPSHOT_FIELD_RELAYS] = snapshot.relay_states
+        if SNAPSHOT_FIELD_LOGS in fields:
+            data[SNAPSHOT_FIELD_LOGS] = [log_entry_json_data(log_id, log) for log_id, log in logs]
+        return data, None
+
+    # the tag covers the selected fields, a client polling with the same selection gets the cached content
+    content = get_cached_content(URL_RESOURCE_SNAPSHOT, etag, codec, serialize)
+    response = cached_content_response(content, codec)
+    if SNAPSHOT_FIELD_STATES in fields:
+        program_states_response(response, snapshot.program_states)
+    return tagged_response(response, etag)
+
+
 @app.route(URL_PATH + URL_RESOURCE_LOGS, methods=['GET'])
 def get_logs():
-    logs = Logger.get_logs()
-    response = [log.to_json_data() for log in logs]
-    return valid_request_response(json.dumps(response))
+    since = request.args.get("since", type=int)
+    start = request.args.get("from", type=float)
+    end = request.args.get("to", type=float)
+    logs = Logger.query_logs(None if since is None else since + 1, request.args.get("level"),
+                             None if start is None else datetime.fromtimestamp(start),
+                             None if end is None else datetime.fromtimestamp(end),
+                             request.args.get("contains"), request.args.get("limit", type=int))
+    entries = (log_entry_json_data(log_id, log) for log_id, log in logs)
+    codec = negotiate_codec(request.accept_mimetypes)
+    if codec is not JSON_CODEC:
+        # binary formats are encoded at once, the number of entries is bounded by the log buffer and the limit
+        return encoded_response(list(entries), codec)
+    response = valid_request_response(json_array_stream(entries))
+    response.vary.add("Accept")
+    return response
+
+
+def log_entry_json_data(log_id, log):
+    data = log.to_json_data()
+    if log_id is not None:
+        data["id"] = log_id
+    return data
+
+
+def json_array_stream(items, chunk_size=256):
+    """
+    Serializes the items into JSON array in chunks, so large responses are not built in memory at once
+    """
+    chunk = []
+    separator = ""
+    yield "["
+    for item in items:
+        chunk.append(json.dumps(item))
+        if len(chunk) >= chunk_size:
+            yield separator + ",".join(chunk)
+            separator = ","
+            chunk = []
+    if chunk:
+        yield separator + ",".join(chunk)
+    yield "]"
+
+
+def create_etag(*version_names, codec=JSON_CODEC, versions=None):
+    """
+    Creates entity tag from the controller's versions of the given data. Versions are read before the data, if the
+    data changes meanwhile the tag is older than the data and the client just gets the data again next time.
+    Versions start from 0 on every start, the epoch tells versions of different runs apart
+    :param codec: Codec of the response, each representation of the data has its own tag
+    :type codec: Codec
+    :param versions: Versions captured with the data, eg. ControllerSnapshot.versions. Current versions of the
+    controller if not given
+    :type versions: dict
+    """
+    if versions is None:
+        versions = __controller.get_versions()
+    etag = "{}-{}".format(this_module.__etag_epoch, "-".join(str(versions[name]) for name in version_names))
+    if codec is not JSON_CODEC:
+        etag += "-" + codec.name
+    return etag
+
+
+class CachedContent(object):
+    """
+    Serialized response of a resource for a single version of the data, compressed on first request accepting gzip
+    """
+
+    __slots__ = ("etag", "data", "context", "__gzip_data")
+
+    def __init__(self, etag, data, context=None):
+        self.etag = etag
+        self.data = data
+        self.context = context
+        self.__gzip_data = None
+
+    def get_gzip_data(self):
+        if self.__gzip_data is None:
+            self.__gzip_data = gzip.compress(self.data)
+        return self.__gzip_data
+
+
+def get_cached_content(resource, etag, codec, serialize):
+    """
+    Returns content of the resource encoded by the codec for the given version (etag), serialized only if the version
+    changed since the previous request. Versions change when programs are updated or states are published by the
+    controller, so no explicit invalidation is needed
+    :type codec: Codec
+    :param serialize: Function returning tuple of JSON data and context kept with it, eg. the program states
+    :rtype: CachedContent
+    """
+    key = (resource, codec.content_type)
+    content = this_module.__response_cache.get(key)
+    if content is None or content.etag != etag:
+        data, context = serialize()
+        content = CachedContent(etag, codec.encode(data), context)
+        # concurrent requests may serialize the same version twice, either result is valid
+        this_module.__response_cache[key] = content
+    return content
+
+
+def cached_content_response(content, codec):
+    response = Response(content.data, content_type=codec.content_type)
+    response.vary.add("Accept")
+    if len(content.data) >= GZIP_MIN_BYTES:
+        response.vary.add("Accept-Encoding")
+        if "gzip" in request.accept_encodings:
+            response.set_data(content.get_gzip_data())
+            response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+def tagged_response(response, etag):
+    response.set_etag(etag)
+    return response
+
+
+def not_modified_response(etag):
+    return tagged_response(Response(status=304), etag)
+
+
+def encoded_response(data, codec=None):
+    """
+    Returns response with the JSON data encoded by the codec, the codec the client prefers if not given
+    :type codec: Codec
+    """
+    if codec is None:
+        codec = negotiate_codec(request.accept_mimetypes)
+    response = Response(codec.encode(data), content_type=codec.content_type)
+    response.vary.add("Accept")
+    return response
 
 
 def valid_request_response(content=""):
@@ -140,17 +550,79 @@ def invalid_request_response(status, content=""):
     return Response(content, status=status, content_type="application/json")
 
 
-def start_server():
+def start_server(mode=SERVER_MODE_DEVELOPMENT, threads=4, connection_limit=100, channel_timeout_secs=30):
+    """
+    Serves the API, blocks until the server is stopped, see stop_server.
+    :param mode: SERVER_MODE_DEVELOPMENT or SERVER_MODE_WAITRESS
+    :type mode: str
+    :param threads: Number of worker threads handling requests (waitress only)
+    :type threads: int
+    :param connection_limit: Maximum number of open connections, including idle keep-alive ones (waitress only)
+    :type connection_limit: int
+    :param channel_timeout_secs: Connections inactive for this time are closed (waitress only)
+    :type channel_timeout_secs: float
+    """
     if this_module.__server_running:
         raise RuntimeError("Server already running")
-    app.run(debug=False, use_reloader=False, host=SERVER_HOST, port=SERVER_PORT)
-
-
-def start_server_in_separate_thread():
+    if mode not in SERVER_MODES:
+        raise ValueError("Invalid server mode: {}".format(mode))
+    this_module.__server_running = True
+    if mode == SERVER_MODE_WAITRESS:
+        # optional dependency, needed only in this mode
+        from waitress import create_server
+        server = create_server(app, host=SERVER_HOST, port=SERVER_PORT, threads=threads,
+                               connection_limit=connection_limit, channel_timeout=channel_timeout_secs)
+        this_module.__server = server
+        Logger.info("Serving on {}:{} by waitress with {} threads".format(SERVER_HOST, SERVER_PORT, threads))
+        server.run()
+    else:
+        app.run(debug=False, use_reloader=False, host=SERVER_HOST, port=SERVER_PORT)
+
+
+def stop_server(timeout_secs=5):
+    """
+    Stops accepting connections and waits for requests being handled to complete, applies to waitress only. Must be
+    called before the controller is cleaned up, so requests don't change relays after they are deactivated
+    :param timeout_secs: Time requests being handled are given to complete
+    :type timeout_secs: float
+    """
+    server = this_module.__server
+    if server is None:
+        return
+    this_module.__server = None
+    Logger.info("Stopping server")
+    server.close()
+    server.task_dispatcher.shutdown(cancel_pending=False, timeout=timeout_secs)
+
+
+def start_server_in_separate_thread(**kwargs):
+    """
+    Starts the server in a daemon thread, so it doesn't keep the process running at exit, see start_server
+    """
     if this_module.__server_running:
         raise RuntimeError("Server already running")
-    threading.Thread(target=start_server).start()
-
-
-def init(controller: Controller):
+    threading.Thread(target=start_server, kwargs=kwargs, name="http-server", daemon=True).start()
+
+
+def init(controller: Controller, event_stream=None, metrics=None):
+    """
+    :param controller: Controller the API is served for
+    :param event_stream: Stream of program states and relay changes, see EventStream. The stream resource is not
+    available if not given
+    :param metrics: Metrics served for Prometheus, see MetricsRegistry. Request metrics of the server are collected
+    by collect_metrics. The metrics resource is not available if not given
+    :type metrics: MetricsRegistry
+    """
     this_module.__controller = controller
+    this_module.__event_stream = event_stream
+    this_module.__metrics = metrics
+    this_module.__request_metrics_lock.acquire()
+    try:
+        # allocated upfront for all routes, so requests only update them
+        this_module.__request_durations = {(method, rule.rule): Histogram() for rule in app.url_map.iter_rules()
+                                           for method in rule.methods - {"HEAD", "OPTIONS"}}
+        this_module.__response_counts = {}
+    finally:
+        this_module.__request_metrics_lock.release()
+    # versions of another controller would match the cached ones
+    this_module.__response_cache = {}
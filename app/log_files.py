@@ -0,0 +1,259 @@
+import bisect
+import os
+import re
+import struct
+import threading
+from datetime import datetime
+
+from app.logger import LogEntry
+
+# timestamp and byte offset of a log line
+INDEX_RECORD_FORMAT = struct.Struct("<dQ")
+
+ESCAPE_PATTERN = re.compile(r"[\\\n\r]")
+UNESCAPE_PATTERN = re.compile(r"\\(.)")
+ESCAPES = {"\\": "\\\\", "\n": "\\n", "\r": "\\r"}
+UNESCAPES = {"n": "\n", "r": "\r"}
+
+
+def format_log_line(entry):
+    """
+    Formats the entry as a single line - timestamp, level and message separated by tabs, new lines in the message
+    are escaped
+    :rtype: bytes
+    """
+    message = ESCAPE_PATTERN.sub(lambda match: ESCAPES[match.group(0)], entry.message)
+    return "{:.6f}\t{}\t{}\n".format(entry.date.timestamp(), entry.level, message).encode("utf-8")
+
+
+def parse_log_line(line):
+    """
+    Parses line formatted by format_log_line
+    :return: Tuple of timestamp and log entry
+    :rtype: tuple
+    :raises ValueError: Line is not valid
+    """
+    timestamp, level, message = line.decode("utf-8").rstrip("\n").split("\t", 2)
+    timestamp = float(timestamp)
+    message = UNESCAPE_PATTERN.sub(lambda match: UNESCAPES.get(match.group(1), match.group(1)), message)
+    return timestamp, LogEntry(datetime.fromtimestamp(timestamp), level, message)
+
+
+class _LogSegment(object):
+    # Log file with a sidecar index file - timestamp and offset of a line every INDEX_INTERVAL_BYTES
+
+    __slots__ = ("log_path", "index_path", "size", "index_size", "first_timestamp", "last_indexed_offset")
+
+    def __init__(self, log_path, index_path):
+        self.log_path = log_path
+        self.index_path = index_path
+        self.size = 0
+        self.index_size = 0
+        self.first_timestamp = None
+        self.last_indexed_offset = None
+
+
+class LogFileStore(object):
+    """
+    Keeps log entries in size rotated segment files, so logs survive restarts of the process. Each segment has a
+    small sidecar index of timestamps and byte offsets, so queries of a time range read only the segments and parts
+    of the segments within the range. The oldest segments are removed when the total size of the files exceeds the
+    limit.
+
+    Entries are appended by a single writer thread (see AsyncLogSink) and read by any thread. Files are flushed
+    after each append but not synced, logs are meant to survive crashes of the process rather than power cuts
+    """
+
+    INDEX_INTERVAL_BYTES = 4096
+    LOG_FILE_SUFFIX = ".log"
+    INDEX_FILE_SUFFIX = ".idx"
+
+    def __init__(self, log_dir, segment_bytes=1024 * 1024, max_total_bytes=20 * 1024 * 1024):
+        """
+        Creates log file store instance, existing segments are kept and a new segment is started.
+        :param log_dir: Directory of the segment files
+        :type log_dir: str
+        :param segment_bytes: Size of a segment file after which a new one is started
+        :type segment_bytes: int
+        :param max_total_bytes: Maximum total size of the files, the oldest segments are removed when exceeded
+        :type max_total_bytes: int
+        """
+        super().__init__()
+        self.__log_dir = log_dir
+        self.__segment_bytes = segment_bytes
+        self.__max_total_bytes = max_total_bytes
+        self.__lock = threading.Lock()
+        self.__log_stream = None
+        self.__index_stream = None
+        os.makedirs(log_dir, exist_ok=True)
+        self.__segments = self.__load_segments()
+
+    @property
+    def total_bytes(self):
+        self.__lock.acquire()
+        try:
+            return sum(segment.size + segment.index_size for segment in self.__segments)
+        finally:
+            self.__lock.release()
+
+    def append(self, entries):
+        """
+        Writes the entries, dates of the entries should not decrease
+        :param entries: Log entries
+        :type entries: list
+        :raises OSError: Entries could not be written
+        """
+        if not entries:
+            return
+        segment = self.__get_writable_segment()
+        for entry in entries:
+            line = format_log_line(entry)
+            timestamp = entry.date.timestamp()
+            if segment.last_indexed_offset is None or \
+                    segment.size - segment.last_indexed_offset >= LogFileStore.INDEX_INTERVAL_BYTES:
+                self.__index_stream.write(INDEX_RECORD_FORMAT.pack(timestamp, segment.size))
+                self.__lock.acquire()
+                try:
+                    if segment.first_timestamp is None:
+                        segment.first_timestamp = timestamp
+                    segment.last_indexed_offset = segment.size
+                    segment.index_size += INDEX_RECORD_FORMAT.size
+                finally:
+                    self.__lock.release()
+            self.__log_stream.write(line)
+            segment.size += len(line)
+            if segment.size >= self.__segment_bytes:
+                self.__flush()
+                segment = self.__start_segment()
+        self.__flush()
+        self.__remove_oldest_segments()
+
+    def query(self, start=None, end=None, level=None, contains=None, limit=None):
+        """
+        Returns entries within the time range (inclusive) matching the given conditions, the oldest first
+        :param start: Minimum date of the entries
+        :type start: datetime
+        :param end: Maximum date of the entries
+        :type end: datetime
+        :param level: Level of the entries
+        :type level: str
+        :param contains: Text the message contains, case insensitive
+        :type contains: str
+        :param limit: Maximum number of entries to return
+        :type limit: int
+        :rtype: list
+        """
+        start = float("-inf") if start is None else start.timestamp()
+        end = float("inf") if end is None else end.timestamp()
+        contains = contains.lower() if contains else None
+        self.__lock.acquire()
+        try:
+            segments = [(segment.log_path, segment.index_path, segment.size, segment.first_timestamp)
+                        for segment in self.__segments if segment.first_timestamp is not None]
+        finally:
+            self.__lock.release()
+
+        result = []
+        for position, (log_path, index_path, size, first_timestamp) in enumerate(segments):
+            if first_timestamp > end:
+                break
+            if position + 1 < len(segments) and segments[position + 1][3] < start:
+                # the whole segment is older than the range
+                continue
+            try:
+                offset = self.__find_offset(index_path, start)
+                with open(log_path, "rb") as input_stream:
+                    input_stream.seek(offset)
+                    data = input_stream.read(size - offset)
+            except FileNotFoundError:
+                # removed meanwhile
+                continue
+            for line in data.splitlines(keepends=True):
+                if not line.endswith(b"\n"):
+                    # not written completely
+                    break
+                try:
+                    timestamp, entry = parse_log_line(line)
+                except ValueError:
+                    continue
+                if timestamp > end:
+                    return result
+                if timestamp < start or level is not None and entry.level != level or \
+                        contains is not None and contains not in entry.message.lower():
+                    continue
+                result.append(entry)
+                if limit is not None and len(result) >= limit:
+                    return result
+        return result
+
+    def close(self):
+        for stream in (self.__log_stream, self.__index_stream):
+            if stream is not None:
+                stream.close()
+        self.__log_stream = None
+        self.__index_stream = None
+
+    @staticmethod
+    def __find_offset(index_path, start):
+        # offset of the last indexed line older than start, so no line within the range is skipped
+        with open(index_path, "rb") as input_stream:
+            data = input_stream.read()
+        index = [INDEX_RECORD_FORMAT.unpack_from(data, offset)
+                 for offset in range(0, len(data) - len(data) % INDEX_RECORD_FORMAT.size, INDEX_RECORD_FORMAT.size)]
+        position = bisect.bisect_left([timestamp for timestamp, _ in index], start) - 1
+        return index[position][1] if position >= 0 else 0
+
+    def __flush(self):
+        self.__log_stream.flush()
+        self.__index_stream.flush()
+
+    def __get_writable_segment(self):
+        if self.__log_stream is None:
+            return self.__start_segment()
+        return self.__segments[-1]
+
+    def __start_segment(self):
+        self.close()
+        sequence = int(os.path.basename(self.__segments[-1].log_path)[:-len(LogFileStore.LOG_FILE_SUFFIX)]) + 1 \
+            if self.__segments else 0
+        name = os.path.join(self.__log_dir, "{:08d}".format(sequence))
+        segment = _LogSegment(name + LogFileStore.LOG_FILE_SUFFIX, name + LogFileStore.INDEX_FILE_SUFFIX)
+        self.__log_stream = open(segment.log_path, "ab")
+        self.__index_stream = open(segment.index_path, "ab")
+        self.__lock.acquire()
+        try:
+            self.__segments.append(segment)
+        finally:
+            self.__lock.release()
+        return segment
+
+    def __remove_oldest_segments(self):
+        # the segment being written is never removed
+        while len(self.__segments) > 1 and self.total_bytes > self.__max_total_bytes:
+            self.__lock.acquire()
+            try:
+                segment = self.__segments.pop(0)
+            finally:
+                self.__lock.release()
+            for path in (segment.log_path, segment.index_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def __load_segments(self):
+        segments = []
+        file_names = sorted(file_name for file_name in os.listdir(self.__log_dir)
+                            if file_name.endswith(LogFileStore.LOG_FILE_SUFFIX))
+        for file_name in file_names:
+            name = os.path.join(self.__log_dir, file_name[:-len(LogFileStore.LOG_FILE_SUFFIX)])
+            segment = _LogSegment(name + LogFileStore.LOG_FILE_SUFFIX, name + LogFileStore.INDEX_FILE_SUFFIX)
+            segment.size = os.path.getsize(segment.log_path)
+            if os.path.exists(segment.index_path):
+                segment.index_size = os.path.getsize(segment.index_path)
+                if segment.index_size >= INDEX_RECORD_FORMAT.size:
+                    with open(segment.index_path, "rb") as input_stream:
+                        segment.first_timestamp = INDEX_RECORD_FORMAT.unpack(
+                            input_stream.read(INDEX_RECORD_FORMAT.size))[0]
+            segments.append(segment)
+        return segments
@@ -1,21 +1,511 @@
-from datetime import datetime
+import atexit
+import bisect
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
 from threading import Lock
 
 LEVEL_INFO = 'info'
 LEVEL_ERROR = 'error'
 
 
+class _SequenceIndex(object):
+    """
+    Ascending sequence numbers of the entries of one level. Dropped sequences are skipped by an offset and removed
+    in bulk, so both appending and dropping take constant amortized time
+    """
+
+    __slots__ = ("__sequences", "__offset")
+
+    COMPACT_THRESHOLD = 1024
+
+    def __init__(self):
+        self.__sequences = []
+        self.__offset = 0
+
+    def append(self, sequence):
+        self.__sequences.append(sequence)
+
+    def drop_oldest(self):
+        self.__offset += 1
+        if self.__offset >= _SequenceIndex.COMPACT_THRESHOLD and self.__offset * 2 >= len(self.__sequences):
+            del self.__sequences[:self.__offset]
+            self.__offset = 0
+
+    def get_range(self, start, end):
+        """
+        Returns iterator over the sequences from start (inclusive) to end (exclusive)
+        """
+        low = bisect.bisect_left(self.__sequences, start, self.__offset)
+        high = bisect.bisect_left(self.__sequences, end, low)
+        return (self.__sequences[index] for index in range(low, high))
+
+
+class LogBuffer(object):
+    """
+    Log entries kept in a ring buffer of fixed capacity, limited by the number of entries and optionally by their
+    approximate size in bytes. The oldest entries are dropped when the buffer is full. Each entry gets a sequence
+    number used as a cursor, so readers can take the entries appended since their previous read without copying
+    the others. Entries are expected to be appended in the order of their dates and are indexed by level, so
+    queries only visit entries of the requested level and time range. Not thread safe
+    """
+
+    # approximate size of a log entry with its date, excluding the message
+    ENTRY_OVERHEAD_BYTES = 150
+
+    def __init__(self, max_entries, max_bytes=None):
+        """
+        Creates log buffer instance.
+        :param max_entries: Maximum number of entries
+        :type max_entries: int
+        :param max_bytes: Maximum approximate size of the entries, unlimited if not given
+        :type max_bytes: int
+        """
+        super().__init__()
+        if max_entries < 1:
+            raise ValueError("Invalid log buffer capacity: {}".format(max_entries))
+        self.__max_entries = max_entries
+        self.__max_bytes = max_bytes
+        self.__entries = [None] * max_entries
+        self.__sizes = [0] * max_entries
+        self.__first_sequence = 0
+        self.__next_sequence = 0
+        self.__bytes = 0
+        self.__dropped_count = 0
+        self.__level_indexes = {}
+
+    @property
+    def first_cursor(self):
+        return self.__first_sequence
+
+    @property
+    def next_cursor(self):
+        return self.__next_sequence
+
+    @property
+    def bytes(self):
+        return self.__bytes
+
+    @property
+    def dropped_count(self):
+        return self.__dropped_count
+
+    def __len__(self):
+        return self.__next_sequence - self.__first_sequence
+
+    def append(self, entry):
+        """
+        Appends the entry, dropping the oldest entries if needed
+        :return: Sequence number of the entry
+        :rtype: int
+        """
+        size = LogBuffer.ENTRY_OVERHEAD_BYTES + len(entry.message)
+        while len(self) > 0 and (len(self) >= self.__max_entries or
+                                 self.__max_bytes is not None and self.__bytes + size > self.__max_bytes):
+            self.__drop_oldest()
+        sequence = self.__next_sequence
+        slot = sequence % self.__max_entries
+        self.__entries[slot] = entry
+        self.__sizes[slot] = size
+        self.__bytes += size
+        self.__next_sequence += 1
+        if entry.level not in self.__level_indexes:
+            self.__level_indexes[entry.level] = _SequenceIndex()
+        self.__level_indexes[entry.level].append(sequence)
+        return sequence
+
+    def get_entries(self, cursor=None, limit=None):
+        """
+        Returns entries starting from the cursor
+        :param cursor: Sequence number of the first entry to return, eg. the cursor returned by the previous call.
+        The oldest available entry if not given or if the entry was already dropped
+        :type cursor: int
+        :param limit: Maximum number of entries to return
+        :type limit: int
+        :return: Tuple of entries and the cursor of the entry following the last returned one
+        :rtype: tuple
+        """
+        start = self.__first_sequence if cursor is None else min(max(cursor, self.__first_sequence),
+                                                                 self.__next_sequence)
+        end = self.__next_sequence if limit is None else min(self.__next_sequence, start + max(limit, 0))
+        entries = [self.__entries[sequence % self.__max_entries] for sequence in range(start, end)]
+        return entries, end
+
+    def query(self, cursor=None, level=None, start=None, end=None, contains=None, limit=None):
+        """
+        Returns entries matching all the given conditions, the oldest first
+        :param cursor: Sequence number of the first entry to consider
+        :type cursor: int
+        :param level: Level of the entries
+        :type level: str
+        :param start: Minimum date of the entries (inclusive)
+        :type start: datetime
+        :param end: Maximum date of the entries (inclusive)
+        :type end: datetime
+        :param contains: Text the message contains, case insensitive
+        :type contains: str
+        :param limit: Maximum number of entries to return
+        :type limit: int
+        :return: List of tuples of sequence number and entry
+        :rtype: list
+        """
+        first = self.__first_sequence if cursor is None else min(max(cursor, self.__first_sequence),
+                                                                 self.__next_sequence)
+        last = self.__next_sequence
+        if start is not None:
+            first = max(first, self.__find_sequence(lambda date: date >= start))
+        if end is not None:
+            last = min(last, self.__find_sequence(lambda date: date > end))
+        if level is None:
+            sequences = range(first, last)
+        elif level in self.__level_indexes:
+            sequences = self.__level_indexes[level].get_range(first, last)
+        else:
+            sequences = []
+        contains = contains.lower() if contains else None
+        result = []
+        for sequence in sequences:
+            if limit is not None and len(result) >= limit:
+                break
+            entry = self.__entries[sequence % self.__max_entries]
+            if contains is None or contains in entry.message.lower():
+                result.append((sequence, entry))
+        return result
+
+    def clear(self):
+        """
+        Drops all entries, sequence numbers of new entries continue from the dropped ones
+        """
+        while len(self) > 0:
+            self.__drop_oldest()
+        self.__dropped_count = 0
+        self.__level_indexes = {}
+
+    def set_capacity(self, max_entries, max_bytes=None):
+        """
+        Changes capacity of the buffer, keeping the most recent entries that fit
+        """
+        if max_entries < 1:
+            raise ValueError("Invalid log buffer capacity: {}".format(max_entries))
+        entries, next_sequence = self.get_entries()
+        self.__max_entries = max_entries
+        self.__max_bytes = max_bytes
+        self.__entries = [None] * max_entries
+        self.__sizes = [0] * max_entries
+        self.__first_sequence = self.__next_sequence = next_sequence - len(entries)
+        self.__bytes = 0
+        self.__level_indexes = {}
+        for entry in entries:
+            self.append(entry)
+
+    def __find_sequence(self, predicate):
+        # binary search for the first entry whose date satisfies the predicate, dates are ascending
+        low, high = self.__first_sequence, self.__next_sequence
+        while low < high:
+            middle = (low + high) // 2
+            if predicate(self.__entries[middle % self.__max_entries].date):
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def __drop_oldest(self):
+        slot = self.__first_sequence % self.__max_entries
+        self.__level_indexes[self.__entries[slot].level].drop_oldest()
+        self.__bytes -= self.__sizes[slot]
+        self.__entries[slot] = None
+        self.__sizes[slot] = 0
+        self.__first_sequence += 1
+        self.__dropped_count += 1
+
+
+class AsyncLogSink(object):
+    """
+    Writes log entries to a stream (stdout by default) from a background thread, so a stalled stream (eg. a full
+    pipe to syslog) doesn't block threads that log. Entries are queued in a bounded deque, which needs no lock to
+    append to. When the queue is full the oldest entries are dropped, the number of dropped entries is counted and
+    reported in the output. Entries are written to log files as well if given
+    """
+
+    def __init__(self, queue_size=10000, stream=None, log_files=None):
+        """
+        Creates sink instance.
+        :param queue_size: Maximum number of entries waiting to be written
+        :type queue_size: int
+        :param stream: Stream the entries are written to, sys.stdout if not given
+        :param log_files: Persistent store the entries are written to, eg. LogFileStore
+        """
+        super().__init__()
+        self.__queue = deque(maxlen=queue_size)
+        self.__stream = stream
+        self.__log_files = log_files
+        self.__event = threading.Event()
+        self.__write_lock = Lock()
+        self.__thread = None
+        self.__stopped = False
+        self.__dropped_count = 0
+        self.__reported_dropped_count = 0
+
+    @property
+    def dropped_count(self):
+        return self.__dropped_count
+
+    def get_metrics(self):
+        """
+        Returns number of entries waiting to be written and number of dropped entries
+        :rtype: dict
+        """
+        return {"queue_depth": len(self.__queue), "dropped_count": self.__dropped_count}
+
+    def start(self):
+        """
+        Starts the writer thread and registers writing of pending entries at exit
+        """
+        if self.__thread is not None:
+            raise RuntimeError("Log sink already running")
+        atexit.register(self.flush)
+        self.__thread = threading.Thread(target=self.__write_loop, name="log-sink", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """
+        Stops the writer thread and writes pending entries
+        """
+        self.__stopped = True
+        self.__event.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+        self.flush()
+
+    def emit(self, entry):
+        """
+        Queues the entry to be written, never blocks
+        """
+        # the check is racy, the count might be off by a few under contention which is fine for a statistic
+        if len(self.__queue) == self.__queue.maxlen:
+            self.__dropped_count += 1
+        self.__queue.append(entry)
+        if not self.__event.is_set():
+            self.__event.set()
+
+    def flush(self):
+        """
+        Writes all queued entries in the calling thread
+        """
+        self.__write_lock.acquire()
+        try:
+            entries = []
+            while True:
+                try:
+                    entries.append(self.__queue.popleft())
+                except IndexError:
+                    break
+            lines = [str(entry) for entry in entries]
+            dropped_count = self.__dropped_count - self.__reported_dropped_count
+            if dropped_count > 0:
+                self.__reported_dropped_count += dropped_count
+                lines.append("{} log entries dropped".format(dropped_count))
+            if lines:
+                stream = self.__stream or sys.stdout
+                try:
+                    stream.write("\n".join(lines) + "\n")
+                    stream.flush()
+                except (OSError, ValueError):
+                    # nowhere to report it, the entries are still available in the Logger's buffer
+                    pass
+            if entries and self.__log_files is not None:
+                try:
+                    self.__log_files.append(entries)
+                except OSError as e:
+                    # not logged, the error would be written to the same files
+                    print("Log files write error {}".format(str(e)), file=sys.stderr)
+        finally:
+            self.__write_lock.release()
+
+    def __write_loop(self):
+        while not self.__stopped:
+            self.__event.wait()
+            self.__event.clear()
+            self.flush()
+
+
+class _RepeatWindow(object):
+    __slots__ = ("end", "count")
+
+    def __init__(self, end):
+        self.end = end
+        self.count = 0
+
+
+class LogSuppressor(object):
+    """
+    Collapses repeats of a message. Messages are keyed by level, source (module and function logging the message)
+    and the formatted message, so only identical messages collapse. The first message of a key is logged and starts
+    a window, repeats within the window are only counted. When the window ends a single "repeated N times" message is
+    logged instead of the repeats. Totals of suppressed messages are kept per level, source and template (the message
+    before formatting)
+    """
+
+    MAX_COUNTERS = 1000
+
+    def __init__(self, window_secs=60.0, clock=time.monotonic):
+        """
+        Creates suppressor instance.
+        :param window_secs: Length of the window repeats are collapsed within
+        :type window_secs: float
+        :param clock: Function returning current time in seconds
+        """
+        super().__init__()
+        self.__window_secs = window_secs
+        self.__clock = clock
+        self.__lock = Lock()
+        self.__windows = {}
+        self.__counters = {}
+        self.__next_sweep_time = None
+
+    def suppress(self, level, source, template, args):
+        """
+        Counts the message if it's a repeat within the window
+        :return: Tuple of True if the message should not be logged, and list of (level, message) tuples of repeat
+        summaries of the windows that have ended
+        :rtype: tuple
+        """
+        key = (level, source, format_message(template, args))
+        now = self.__clock()
+        self.__lock.acquire()
+        try:
+            window = self.__windows.get(key)
+            if window is not None and now < window.end:
+                window.count += 1
+                counter_key = (level, source, template)
+                if counter_key in self.__counters or len(self.__counters) < LogSuppressor.MAX_COUNTERS:
+                    self.__counters[counter_key] = self.__counters.get(counter_key, 0) + 1
+                return True, []
+            summaries = []
+            if window is not None:
+                del self.__windows[key]
+                self.__add_summary(summaries, key, window)
+            if self.__next_sweep_time is None or now >= self.__next_sweep_time:
+                self.__next_sweep_time = now + self.__window_secs
+                for expired_key in [other_key for other_key, other_window in self.__windows.items()
+                                    if other_window.end <= now]:
+                    self.__add_summary(summaries, expired_key, self.__windows.pop(expired_key))
+            self.__windows[key] = _RepeatWindow(now + self.__window_secs)
+            return False, summaries
+        finally:
+            self.__lock.release()
+
+    def get_counters(self):
+        """
+        Returns totals of suppressed messages, the most suppressed first
+        :rtype: list
+        """
+        self.__lock.acquire()
+        try:
+            counters = list(self.__counters.items())
+        finally:
+            self.__lock.release()
+        return [{"level": level, "source": source, "template": template, "suppressed": count}
+                for (level, source, template), count in sorted(counters, key=lambda item: -item[1])]
+
+    @staticmethod
+    def __add_summary(summaries, key, window):
+        if window.count > 0:
+            level, _, message = key
+            summaries.append((level, "{} (repeated {} times)".format(message, window.count)))
+
+
+def format_message(template, args):
+    return template.format(*args) if args else template
+
+
 class Logger(object):
-    __logs = []
+    DEFAULT_MAX_ENTRIES = 10000
+
+    __logs = LogBuffer(DEFAULT_MAX_ENTRIES)
     __lock = Lock()
+    __sink = None
+    __log_files = None
+    __suppressor = None
+
+    @staticmethod
+    def info(msg: str, *args):
+        """
+        :param msg: Message, or template of the message formatted with args. Repeats are collapsed by template
+        """
+        Logger.__append_log(LEVEL_INFO, msg, args)
+
+    @staticmethod
+    def error(msg: str, *args):
+        """
+        :param msg: Message, or template of the message formatted with args. Repeats are collapsed by template
+        """
+        Logger.__append_log(LEVEL_ERROR, msg, args)
+
+    @staticmethod
+    def set_repeat_window(window_secs, clock=time.monotonic):
+        """
+        Collapses repeats of a message within the window, see LogSuppressor. Disabled if the window is 0 or None
+        """
+        Logger.__suppressor = LogSuppressor(window_secs, clock) if window_secs else None
+
+    @staticmethod
+    def get_suppressed_counters():
+        """
+        Returns totals of suppressed repeats of messages, see LogSuppressor.get_counters
+        :rtype: list
+        """
+        suppressor = Logger.__suppressor
+        return [] if suppressor is None else suppressor.get_counters()
+
+    @staticmethod
+    def get_metrics():
+        """
+        Returns number and size of the entries kept in memory, number of entries dropped from memory and of
+        suppressed repeats, and metrics of the sink prefixed with "sink_" if it has any, see AsyncLogSink.get_metrics
+        :rtype: dict
+        """
+        Logger.__lock.acquire()
+        try:
+            metrics = {"entries": len(Logger.__logs), "bytes": Logger.__logs.bytes,
+                       "dropped_count": Logger.__logs.dropped_count}
+        finally:
+            Logger.__lock.release()
+        metrics["suppressed_count"] = sum(counter["suppressed"] for counter in Logger.get_suppressed_counters())
+        get_sink_metrics = getattr(Logger.__sink, "get_metrics", None)
+        if get_sink_metrics is not None:
+            for key, value in get_sink_metrics().items():
+                metrics["sink_" + key] = value
+        return metrics
+
+    @staticmethod
+    def set_capacity(max_entries, max_bytes=None):
+        """
+        Limits the number of kept log entries and optionally their approximate size in bytes, see LogBuffer
+        """
+        Logger.__lock.acquire()
+        try:
+            Logger.__logs.set_capacity(max_entries, max_bytes)
+        finally:
+            Logger.__lock.release()
 
     @staticmethod
-    def info(msg: str):
-        Logger.__append_log(LEVEL_INFO, msg)
+    def set_sink(sink):
+        """
+        Sets the sink log entries are written to, eg. AsyncLogSink. Entries are printed synchronously if None
+        """
+        Logger.__sink = sink
 
     @staticmethod
-    def error(msg: str):
-        Logger.__append_log(LEVEL_ERROR, msg)
+    def set_log_files(log_files):
+        """
+        Sets the persistent store queried for entries older than the ones kept in memory, eg. LogFileStore. Entries
+        are written to it by the sink
+        """
+        Logger.__log_files = log_files
 
     @staticmethod
     def clear():
@@ -29,34 +519,140 @@ class Logger(object):
     def get_logs():
         Logger.__lock.acquire()
         try:
-            return Logger.__logs.copy()
+            return Logger.__logs.get_entries()[0]
+        finally:
+            Logger.__lock.release()
+
+    @staticmethod
+    def get_logs_since(cursor=None, limit=None):
+        """
+        Returns log entries starting from the cursor, see LogBuffer.get_entries
+        :return: Tuple of entries and the cursor to pass to get entries appended since this call
+        :rtype: tuple
+        """
+        Logger.__lock.acquire()
+        try:
+            return Logger.__logs.get_entries(cursor, limit)
+        finally:
+            Logger.__lock.release()
+
+    @staticmethod
+    def get_recent_logs(limit):
+        """
+        Returns the last log entries kept in memory
+        :param limit: Maximum number of entries to return
+        :type limit: int
+        :return: Tuple of list of tuples of sequence number and entry, the oldest first, and the cursor following
+        the last entry
+        :rtype: tuple
+        """
+        Logger.__lock.acquire()
+        try:
+            first = max(Logger.__logs.next_cursor - max(limit, 0), Logger.__logs.first_cursor)
+            entries, cursor = Logger.__logs.get_entries(first)
+            return [(first + index, entry) for index, entry in enumerate(entries)], cursor
         finally:
             Logger.__lock.release()
 
     @staticmethod
-    def __append_log(level: str, msg: str):
+    def query_logs(cursor=None, level=None, start=None, end=None, contains=None, limit=None):
+        """
+        Returns log entries matching all the given conditions, see LogBuffer.query. When a time range is given
+        without a cursor, entries older than the ones kept in memory are read from the log files if set
+        :return: List of tuples of sequence number (None for entries read from the log files) and entry
+        :rtype: list
+        """
         Logger.__lock.acquire()
         try:
-            entry = LogEntry(datetime.now(), level, msg)
-            Logger.__logs.append(entry)
-            print(str(entry))
+            result = Logger.__logs.query(cursor, level, start, end, contains, limit)
+            oldest_entries = Logger.__logs.get_entries(limit=1)[0]
         finally:
             Logger.__lock.release()
+        log_files = Logger.__log_files
+        if log_files is None or cursor is not None or start is None and end is None:
+            return result
+        files_end = end
+        if oldest_entries:
+            # entries kept in memory are in the files as well
+            files_end = oldest_entries[0].date - timedelta(microseconds=1)
+            if end is not None:
+                files_end = min(end, files_end)
+        if start is not None and files_end is not None and start > files_end:
+            return result
+        older_entries = log_files.query(start, files_end, level, contains, limit)
+        result = [(None, entry) for entry in older_entries] + result
+        return result if limit is None else result[:limit]
+
+    @staticmethod
+    def __append_log(level: str, msg: str, args=()):
+        messages = [(level, msg, args)]
+        suppressor = Logger.__suppressor
+        if suppressor is not None:
+            # frame of the caller of info/error
+            frame = sys._getframe(2)
+            source = "{}:{}".format(frame.f_globals.get("__name__"), frame.f_code.co_name)
+            suppressed, summaries = suppressor.suppress(level, source, msg, args)
+            if suppressed:
+                return
+            messages = [(summary_level, summary, ()) for summary_level, summary in summaries] + messages
+        for message_level, template, message_args in messages:
+            message = format_message(template, message_args)
+            Logger.__lock.acquire()
+            try:
+                # created under the lock, so the entries are appended in the order of their dates
+                entry = LogEntry(datetime.now(), message_level, message)
+                Logger.__logs.append(entry)
+            finally:
+                Logger.__lock.release()
+            sink = Logger.__sink
+            if sink is not None:
+                sink.emit(entry)
+            else:
+                print(str(entry))
 
 
 class LogEntry(object):
+    """
+    Immutable record of a single log message
+    """
+
+    __slots__ = ("__date", "__level", "__message")
+
     DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
 
     def __init__(self, date, level, message):
-        self.date = date
-        self.level = level
-        self.message = message
+        self.__date = date
+        self.__level = level
+        self.__message = message
+
+    @property
+    def date(self):
+        return self.__date
+
+    @property
+    def level(self):
+        return self.__level
+
+    @property
+    def message(self):
+        return self.__message
 
     def to_json_data(self):
         return {"date": self.date.strftime(LogEntry.DATE_FORMAT),
                 "level": self.level,
                 "msg": self.message}
 
+    def __eq__(self, other):
+        if type(other) is type(self):
+            return self.date == other.date and \
+                   self.level == other.level and \
+                   self.message == other.message
+
+        return False
+
+    def __hash__(self):
+        return hash((self.date, self.level, self.message))
+
     def __str__(self) -> str:
         return "{0} {1} {2}".format(self.date, self.level, self.message)
 
@@ -1,8 +1,23 @@
+import atexit
+import os
+import signal
+import sys
+
 from app.controller import Controller
+from app.logger import AsyncLogSink, Logger
+from app.log_files import LogFileStore
 import app.http_server as server
 
 import app.hardware.hw_config as hw_config
-from app.storage import Storage
+from app.storage import Storage, get_storage_root_dir_path
+from app.sqlite_storage import SqliteStorage
+from app.write_behind_storage import WriteBehindStorage
+from app.state_journal import StateJournal
+from app.history import HistoryStore
+from app.event_stream import EventStream
+from app.metrics import MetricsRegistry
+from app.shared_relay import SharedRelay
+from app.power_scheduler import PowerScheduler
 
 if hw_config.RUN_ON_RASPBERRY:
     from app.hardware.therm_sensor_api import ThermSensorApi
@@ -11,21 +26,80 @@ else:
     from app.hardware.fake_hw import FakeHardware
 
 
+def exit_on_signal(signum, frame):
+    # raises SystemExit in the main thread, so the shutdown path below and the clean up registered with atexit run
+    Logger.info("Received signal {}, exiting".format(signum))
+    sys.exit(0)
+
+
 def main():
+    signal.signal(signal.SIGTERM, exit_on_signal)
+    Logger.set_capacity(hw_config.LOG_MAX_ENTRIES, hw_config.LOG_MAX_BYTES)
+    Logger.set_repeat_window(hw_config.LOG_REPEAT_WINDOW_SECS)
+    log_files = None
+    if hw_config.LOG_FILES_MAX_BYTES > 0:
+        log_files = LogFileStore(hw_config.LOG_DIR, hw_config.LOG_FILE_SEGMENT_BYTES, hw_config.LOG_FILES_MAX_BYTES)
+        Logger.set_log_files(log_files)
+    log_sink = AsyncLogSink(hw_config.LOG_QUEUE_SIZE, log_files=log_files)
+    log_sink.start()
+    Logger.set_sink(log_sink)
+
+    journal = StateJournal(hw_config.JOURNAL_FILE, hw_config.JOURNAL_INTERVAL_SECS, hw_config.JOURNAL_MAX_AGE_SECS)
+    snapshot = journal.restore()
+
     if hw_config.RUN_ON_RASPBERRY:
         therm_sensor_api = ThermSensorApi()
-        relay_api = RelayApi()
-        storage = Storage()
+        relay_api = RelayApi(initial_states=None if snapshot is None else snapshot.relay_states)
+        if hw_config.STORAGE_BACKEND == hw_config.STORAGE_BACKEND_SQLITE:
+            storage = SqliteStorage()
+            # registered before the write behind storage starts, so pending changes are written before (LIFO)
+            atexit.register(storage.close)
+        else:
+            storage = Storage()
     else:
         fake_hw = FakeHardware()
         therm_sensor_api = fake_hw.therm_sensor_api
         relay_api = fake_hw.relay_api
         storage = fake_hw.storage
 
-    controller = Controller(therm_sensor_api, relay_api, storage)
-    server.init(controller)
-    server.start_server_in_separate_thread()
-    controller.run()
+    if hw_config.STORAGE_DEBOUNCE_SECS > 0:
+        storage = WriteBehindStorage(storage, hw_config.STORAGE_DEBOUNCE_SECS, hw_config.STORAGE_MAX_DELAY_SECS)
+        storage.start()
+
+    shared_relays = [SharedRelay(relay_index, dependent_relay_indexes,
+                                 hw_config.SHARED_RELAY_MIN_ON_SECS, hw_config.SHARED_RELAY_MIN_OFF_SECS)
+                     for relay_index, dependent_relay_indexes in hw_config.SHARED_RELAYS]
+
+    power_scheduler = None
+    if hw_config.RELAY_POWER_RATINGS:
+        power_scheduler = PowerScheduler(hw_config.RELAY_POWER_RATINGS, hw_config.POWER_BUDGET_WATTS, relay_api,
+                                         hw_config.POWER_STAGGER_SECS)
+
+    history = HistoryStore(os.path.join(get_storage_root_dir_path(), "history"))
+    history.start()
+
+    controller = Controller(therm_sensor_api, relay_api, storage, shared_relays, power_scheduler, history, journal)
+    event_stream = EventStream(max_clients=hw_config.STREAM_MAX_CLIENTS)
+    event_stream.attach()
+    metrics = MetricsRegistry()
+    metrics.add_collector(controller.collect_metrics)
+    metrics.add_collector(server.collect_metrics)
+    metrics.add_values("brewery_log", Logger.get_metrics)
+    metrics.add_values("brewery_stream", event_stream.get_metrics)
+    if isinstance(storage, WriteBehindStorage):
+        metrics.add_values("brewery_storage", storage.get_metrics)
+    server.init(controller, event_stream, metrics)
+    server.configure_access_log(hw_config.ACCESS_LOG_SAMPLE_RATE, hw_config.ACCESS_LOG_DEBUG)
+    server.start_server_in_separate_thread(mode=hw_config.HTTP_SERVER, threads=hw_config.HTTP_THREADS,
+                                           connection_limit=hw_config.HTTP_CONNECTION_LIMIT,
+                                           channel_timeout_secs=hw_config.HTTP_CHANNEL_TIMEOUT_SECS)
+    try:
+        controller.run()
+    finally:
+        # requests are stopped before the controller's clean up and the flushes of storage and logs, which run at exit.
+        # Stream clients are ended first, they would hold their worker threads until the timeout
+        event_stream.close()
+        server.stop_server(hw_config.HTTP_SHUTDOWN_TIMEOUT_SECS)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,321 @@
+import bisect
+import math
+import threading
+
+# request, hardware read and control loop durations
+DEFAULT_BUCKETS_SECS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_TYPE_COUNTER = "counter"
+METRIC_TYPE_GAUGE = "gauge"
+METRIC_TYPE_HISTOGRAM = "histogram"
+
+CONTENT_TYPE_PROMETHEUS = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram(object):
+    """
+    Distribution of observed values in buckets fixed upfront, so observing a value allocates nothing
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS_SECS):
+        """
+        Creates histogram instance.
+        :param buckets: Upper bounds of the buckets, ascending. Values greater than the last bound are counted in
+        the +Inf bucket only
+        :type buckets: tuple
+        """
+        super().__init__()
+        self.__buckets = tuple(buckets)
+        self.__counts = [0] * (len(self.__buckets) + 1)
+        self.__sum = 0.0
+        self.__lock = threading.Lock()
+
+    @property
+    def buckets(self):
+        return self.__buckets
+
+    def observe(self, value):
+        self.__lock.acquire()
+        try:
+            self.__counts[bisect.bisect_left(self.__buckets, value)] += 1
+            self.__sum += value
+        finally:
+            self.__lock.release()
+
+    def get_values(self):
+        """
+        Returns cumulative counts of the buckets, the last one is the +Inf bucket, sum and count of the values
+        :rtype: tuple
+        """
+        self.__lock.acquire()
+        try:
+            counts = list(self.__counts)
+            total = self.__sum
+        finally:
+            self.__lock.release()
+        cumulative = []
+        count = 0
+        for bucket_count in counts:
+            count += bucket_count
+            cumulative.append(count)
+        return cumulative, total, count
+
+
+class MetricsWriter(object):
+    """
+    Builds Prometheus text exposition of the samples added by the collectors, see MetricsRegistry
+    """
+
+    def __init__(self):
+        super().__init__()
+        # samples by metric name, in the order the metrics were added
+        self.__metrics = {}
+        self.__names = []
+
+    def add(self, name, metric_type, value, labels=None, help_text=None):
+        """
+        Adds sample of a counter or gauge, samples with no value are skipped
+        :param name: Name of the metric, counters should end with _total
+        :type name: str
+        :param metric_type: METRIC_TYPE_COUNTER or METRIC_TYPE_GAUGE
+        :type metric_type: str
+        :param value: Value of the sample, booleans are written as 0 or 1
+        :param labels: Labels of the sample
+        :type labels: dict
+        :param help_text: Description of the metric
+        :type help_text: str
+        """
+        if value is None:
+            return
+        self.__get_samples(name, metric_type, help_text).append((name, labels, value))
+
+    def add_histogram(self, name, histogram, labels=None, help_text=None):
+        """
+        Adds buckets, sum and count samples of the histogram
+        :type histogram: Histogram
+        """
+        samples = self.__get_samples(name, METRIC_TYPE_HISTOGRAM, help_text)
+        counts, total, count = histogram.get_values()
+        labels = labels or {}
+        for bound, bucket_count in zip(histogram.buckets + (math.inf,), counts):
+            bucket_labels = dict(labels)
+            bucket_labels["le"] = MetricsWriter.__format_value(bound)
+            samples.append((name + "_bucket", bucket_labels, bucket_count))
+        samples.append((name + "_sum", labels, total))
+        samples.append((name + "_count", labels, count))
+
+    def add_values(self, prefix, values):
+        """
+        Adds numeric values of a dict returned by get_metrics of a component, eg. WriteBehindStorage.get_metrics.
+        Values with keys ending with _count are added as counters named prefix_key_total (without _count), the
+        others as gauges named prefix_key. Other values (eg. lists) are skipped
+        :param prefix: Prefix of the metric names
+        :type prefix: str
+        :type values: dict
+        """
+        for key, value in sorted((values or {}).items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            if key.endswith("_count"):
+                self.add("{}_{}_total".format(prefix, key[:-len("_count")]), METRIC_TYPE_COUNTER, value)
+            else:
+                self.add("{}_{}".format(prefix, key), METRIC_TYPE_GAUGE, value)
+
+    def to_text(self):
+        lines = []
+        for name in self.__names:
+            metric_type, help_text, samples = self.__metrics[name]
+            if help_text:
+                lines.append("# HELP {} {}".format(name, help_text.replace("\\", "\\\\").replace("\n", "\\n")))
+            lines.append("# TYPE {} {}".format(name, metric_type))
+            for sample_name, labels, value in samples:
+                lines.append("{}{} {}".format(sample_name, MetricsWriter.__format_labels(labels),
+                                              MetricsWriter.__format_value(value)))
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def __get_samples(self, name, metric_type, help_text):
+        if name not in self.__metrics:
+            self.__metrics[name] = (metric_type, help_text, [])
+            self.__names.append(name)
+        return self.__metrics[name][2]
+
+    @staticmethod
+    def __format_labels(labels):
+        if not labels:
+            return ""
+        return "{" + ",".join('{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace("\"", "\\\"")
+                                                .replace("\n", "\\n"))
+                              for key, value in sorted(labels.items())) + "}"
+
+    @staticmethod
+    def __format_value(value):
+        if isinstance(value, bool):
+            return "1" if value else "0"
+        if isinstance(value, float):
+            if math.isinf(value):
+                return "+Inf" if value > 0 else "-Inf"
+            if math.isnan(value):
+                return "NaN"
+        return repr(value)
+
+
+class MetricsRegistry(object):
+    """
+    Metrics of the components in Prometheus text format. Components are registered as collectors - functions adding
+    their metrics to a MetricsWriter. Collectors are called on every scrape, so they must only read values the
+    components keep in memory and never access hardware
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.__collectors = []
+        self.__lock = threading.Lock()
+
+    def add_collector(self, collector):
+        """
+        :param collector: Function taking MetricsWriter
+        """
+        self.__lock.acquire()
+        try:
+            self.__collectors.append(collector)
+        finally:
+            self.__lock.release()
+
+    def add_values(self, prefix, get_values):
+        """
+        Registers numeric values of a component's metrics dict, see MetricsWriter.add_values
+        :param prefix: Prefix of the metric names, eg. "brewery_storage"
+        :type prefix: str
+        :param get_values: Function returning the dict, eg. WriteBehindStorage.get_metrics
+        """
+        self.add_collector(lambda writer: writer.add_values(prefix, get_values()))
+
+    def collect(self):
+        """
+        Returns metrics of all the collectors in Prometheus text exposition format
+        :rtype: str
+        """
+        self.__lock.acquire()
+        try:
+            collectors = list(self.__collectors)
+        finally:
+            self.__lock.release()
+        writer = MetricsWriter()
+        for collector in collectors:
+            collector(writer)
+        return writer.to_text()
+
+
+class ControllerMetrics(object):
+    """
+    Metrics recorded by the control loop - durations and lag of the loop's ticks, sensor reads and relay toggles.
+    Everything is allocated upfront or on the first read of a sensor
+    """
+
+    def __init__(self, relays_count):
+        """
+        Creates controller metrics instance.
+        :param relays_count: Number of relays
+        :type relays_count: int
+        """
+        super().__init__()
+        self.__lock = threading.Lock()
+        self.__tick_durations = Histogram()
+        self.__tick_count = 0
+        self.__tick_lag_secs = 0.0
+        self.__relay_states = [0] * relays_count
+        self.__relay_toggle_counts = [0] * relays_count
+        self.__relay_states_known = False
+        # by sensor id
+        self.__sensor_temperatures = {}
+        self.__sensor_read_durations = {}
+        self.__sensor_error_counts = {}
+
+    def record_tick(self, duration_secs, lag_secs):
+        """
+        :param duration_secs: Time the tick took
+        :type duration_secs: float
+        :param lag_secs: How late the tick started compared to the loop's interval
+        :type lag_secs: float
+        """
+        self.__tick_durations.observe(duration_secs)
+        self.__lock.acquire()
+        try:
+            self.__tick_count += 1
+            self.__tick_lag_secs = max(lag_secs, 0.0)
+        finally:
+            self.__lock.release()
+
+    def record_sensor_read(self, sensor_id, temperature, duration_secs):
+        """
+        :param temperature: Temperature read, None if the read failed
+        :type temperature: float
+        :param duration_secs: Time the read took
+        :type duration_secs: float
+        """
+        self.__lock.acquire()
+        try:
+            if sensor_id not in self.__sensor_read_durations:
+                self.__sensor_read_durations[sensor_id] = Histogram()
+                self.__sensor_error_counts[sensor_id] = 0
+            if temperature is None:
+                self.__sensor_error_counts[sensor_id] += 1
+            else:
+                self.__sensor_temperatures[sensor_id] = temperature
+            durations = self.__sensor_read_durations[sensor_id]
+        finally:
+            self.__lock.release()
+        durations.observe(duration_secs)
+
+    def record_relay_states(self, relay_states):
+        """
+        Counts toggles of the relays since the previously recorded states
+        :param relay_states: States of all relays (0|1) by relay index
+        :type relay_states: list
+        """
+        self.__lock.acquire()
+        try:
+            for relay_index, state in enumerate(relay_states):
+                if self.__relay_states_known and state != self.__relay_states[relay_index]:
+                    self.__relay_toggle_counts[relay_index] += 1
+                self.__relay_states[relay_index] = state
+            self.__relay_states_known = True
+        finally:
+            self.__lock.release()
+
+    def collect(self, writer):
+        """
+        :type writer: MetricsWriter
+        """
+        self.__lock.acquire()
+        try:
+            tick_count = self.__tick_count
+            tick_lag_secs = self.__tick_lag_secs
+            relay_states = list(self.__relay_states) if self.__relay_states_known else []
+            relay_toggle_counts = list(self.__relay_toggle_counts)
+            sensor_temperatures = dict(self.__sensor_temperatures)
+            sensor_read_durations = dict(self.__sensor_read_durations)
+            sensor_error_counts = dict(self.__sensor_error_counts)
+        finally:
+            self.__lock.release()
+        writer.add_histogram("brewery_loop_tick_duration_seconds", self.__tick_durations,
+                             help_text="Duration of the control loop's ticks")
+        writer.add("brewery_loop_ticks_total", METRIC_TYPE_COUNTER, tick_count,
+                   help_text="Number of the control loop's ticks")
+        writer.add("brewery_loop_lag_seconds", METRIC_TYPE_GAUGE, tick_lag_secs,
+                   help_text="How late the last tick started compared to the loop's interval")
+        for relay_index, state in enumerate(relay_states):
+            writer.add("brewery_relay_state", METRIC_TYPE_GAUGE, state, {"relay": relay_index},
+                       help_text="State of the relay published by the control loop")
+        for relay_index, toggle_count in enumerate(relay_toggle_counts):
+            writer.add("brewery_relay_toggles_total", METRIC_TYPE_COUNTER, toggle_count, {"relay": relay_index},
+                       help_text="Number of relay toggles seen by the control loop")
+        for sensor_id in sorted(sensor_temperatures):
+            writer.add("brewery_sensor_temperature_celsius", METRIC_TYPE_GAUGE, sensor_temperatures[sensor_id],
+                       {"sensor": sensor_id}, help_text="Last temperature read from the sensor")
+        for sensor_id in sorted(sensor_read_durations):
+            writer.add_histogram("brewery_sensor_read_duration_seconds", sensor_read_durations[sensor_id],
+                                 {"sensor": sensor_id}, help_text="Duration of the sensor reads")
+        for sensor_id in sorted(sensor_error_counts):
+            writer.add("brewery_sensor_read_errors_total", METRIC_TYPE_COUNTER, sensor_error_counts[sensor_id],
+                       {"sensor": sensor_id}, help_text="Number of failed sensor reads")
@@ -1,3 +1,4 @@
+import time
 from app.program import Program, ProgramState
 from app.hardware.therm_sensor_api import ThermSensorApi, NoSensorFoundError, ThermSensorError, SensorNotReadyError
 from app.logger import Logger
@@ -11,41 +12,55 @@ class Monitor(object):
     taking actions if current temperature is out of valid range
     """
 
-    def __init__(self, program: Program, therm_sensor_api=None, relay_api=None):
+    def __init__(self, program: Program, therm_sensor_api=None, relay_api=None, power_scheduler=None, metrics=None):
         """
         Creates controller instance.
         :param therm_sensor_api: Api to obtain therm sensors and their measurements
         :type therm_sensor_api: ThermSensorApi
         :param relay_api: Api to read and modify relay states
         :type relay_api: RelayApi
+        :param power_scheduler: Scheduler that activates relays with power rating within the power budget. If not
+        given all relays are activated immediately
+        :type power_scheduler: PowerScheduler
+        :param metrics: Metrics the sensor reads are recorded to
+        :type metrics: ControllerMetrics
         """
         super().__init__()
         self.__program = program
         self.__therm_sensor_api = therm_sensor_api
         self.__relay_api = relay_api
+        self.__power_scheduler = power_scheduler
+        self.__metrics = metrics
+        self.error = None
+        self.__state = None
 
     def check(self):
         """
         Validates given program temperature. If it's out of allowed range it will trigger actions, either
         turn on cooling or heating. This function should be called repeatedly in short intervals to keep the
-        correct temperature of the program
+        correct temperature of the program. After each check the state of the program gets published and can be
+        obtained with get_state()
         """
+        current_temperature = self.__check()
+        self.__publish_state(current_temperature)
+
+    def __check(self):
         if not self.__program.active:
             self.__ensure_relays_are_disabled()
-            return
+            return self.__read_temperature_of_inactive_program()
 
         try:
-            current_temperature = self.__therm_sensor_api.get_sensor_temperature(self.__program.sensor_id)
+            current_temperature = self.__read_sensor_temperature()
         except SensorNotReadyError as e:
-            Logger.error("Program check skipped - sensor not ready - program: {}".format(str(self)))
+            Logger.error("Program check skipped - sensor not ready - program: {}", str(self))
             self.__set_error(e)
             self.__ensure_relays_are_disabled()
-            return
+            return None
         except NoSensorFoundError as e:
-            Logger.error("Program check error - no sensor found - program: {}".format(str(self)))
+            Logger.error("Program check error - no sensor found - program: {}", str(self))
             self.__set_error(e)
             self.__ensure_relays_are_disabled()
-            return
+            return None
 
         self.__set_error(None)
 
@@ -61,7 +76,7 @@ class Monitor(object):
                 cooling_necessary = current_temperature > program_middle_temp
             else:
                 cooling_necessary = current_temperature > program_max_temp
-            self.__set_cooling(cooling_necessary)
+            self.__set_cooling(cooling_necessary, current_temperature - program_middle_temp)
 
         heating_available = self.__heating_available()
         if heating_available:
@@ -71,13 +86,56 @@ class Monitor(object):
                 heating_necessary = current_temperature < program_middle_temp
             else:
                 heating_necessary = current_temperature < program_min_temp
-            self.__set_heating(heating_necessary)
+            self.__set_heating(heating_necessary, program_middle_temp - current_temperature)
+
+        return current_temperature
+
+    def __read_temperature_of_inactive_program(self):
+        # Inactive program does not control relays, the temperature is read only to be reported in program state
+        try:
+            current_temperature = self.__read_sensor_temperature()
+            self.__set_error(None)
+            return current_temperature
+        except ThermSensorError as e:
+            self.__set_error(e)
+            return None
+
+    def __read_sensor_temperature(self):
+        start_time = time.monotonic()
+        temperature = None
+        try:
+            temperature = self.__therm_sensor_api.get_sensor_temperature(self.__program.sensor_id)
+            return temperature
+        finally:
+            if self.__metrics is not None:
+                self.__metrics.record_sensor_read(self.__program.sensor_id, temperature,
+                                                  time.monotonic() - start_time)
+
+    def __publish_state(self, current_temperature):
+        error = self.get_error()
+        self.__state = ProgramState(self.__program.program_id,
+                                    current_temperature,
+                                    self.__program.program_crc,
+                                    self.__heating_available() and self.__is_heating(),
+                                    self.__cooling_available() and self.__is_cooling(),
+                                    None if error is None else str(error),
+                                    time.time())
+
+    def get_state(self):
+        """
+        Returns the state of the program captured during the last check
+        :return: State of the program or None if the program has not been checked yet
+        :rtype: ProgramState
+        """
+        return self.__state
+
+    @property
+    def program(self):
+        return self.__program
 
     def __ensure_relays_are_disabled(self):
-        if self.__cooling_available() and self.__is_cooling():
-            self.__set_cooling(False)
-        if self.__heating_available() and self.__is_heating():
-            self.__set_heating(False)
+        self.__set_cooling(False)
+        self.__set_heating(False)
 
     def __set_error(self, error):
         self.error = error
@@ -91,16 +149,8 @@ class Monitor(object):
     def __is_cooling(self):
         return self.__relay_api.get_relay_state(self.__program.cooling_relay_index)
 
-    def __set_cooling(self, cooling):
-        cooling_relay_index = self.__program.cooling_relay_index
-        if cooling_relay_index == -1:
-            return
-        relay_state = 1 if cooling else 0
-        if self.__relay_api.get_relay_state(cooling_relay_index) != relay_state:
-            Logger.info("{} cooling relay:{} {}".format(
-                "Activating" if relay_state == 1 else "Deactivating",
-                cooling_relay_index, self.__program))
-            self.__relay_api.set_relay_state(cooling_relay_index, relay_state)
+    def __set_cooling(self, cooling, priority=0.0):
+        self.__set_relay_state(self.__program.cooling_relay_index, 1 if cooling else 0, "cooling", priority)
 
     def __heating_available(self):
         return self.__program.heating_relay_index != -1
@@ -108,13 +158,21 @@ class Monitor(object):
     def __is_heating(self):
         return self.__relay_api.get_relay_state(self.__program.heating_relay_index)
 
-    def __set_heating(self, heating):
-        heating_relay_index = self.__program.heating_relay_index
-        if heating_relay_index == -1:
+    def __set_heating(self, heating, priority=0.0):
+        self.__set_relay_state(self.__program.heating_relay_index, 1 if heating else 0, "heating", priority)
+
+    def __set_relay_state(self, relay_index, relay_state, device, priority):
+        if relay_index == -1:
             return
-        relay_state = 1 if heating else 0
-        if self.__relay_api.get_relay_state(heating_relay_index) != relay_state:
-            Logger.info("{} heating relay:{} {}".format(
+        scheduled = self.__power_scheduler is not None and self.__power_scheduler.is_scheduled(relay_index)
+        if self.__relay_api.get_relay_state(relay_index) != relay_state:
+            if scheduled and relay_state == 1:
+                # the scheduler activates the relay when there is enough power available
+                self.__power_scheduler.request(relay_index, priority)
+                return
+            Logger.info("{} {} relay:{} {}".format(
                 "Activating" if relay_state == 1 else "Deactivating",
-                heating_relay_index, self.__program))
-            self.__relay_api.set_relay_state(heating_relay_index, relay_state)
+                device, relay_index, self.__program))
+            self.__relay_api.set_relay_state(relay_index, relay_state)
+        if scheduled and relay_state == 0:
+            self.__power_scheduler.cancel(relay_index)
@@ -0,0 +1,142 @@
+import threading
+import time
+
+from app.logger import Logger
+
+
+class PowerScheduler(object):
+    """
+    Keeps total power of active relays within the budget. Activation of a relay with power rating is not done
+    immediately, it's requested instead and granted by schedule() called once per controller loop iteration.
+    Requests are served in order of their priority (programs furthest from the setpoint first), activations are
+    staggered to limit inrush current and requests that cannot be served are kept queued until they can be served
+    or get cancelled. Requests are made by the controller's loop, cancelled also by threads changing programs
+    """
+
+    def __init__(self, relay_power_ratings, budget_watts, relay_api, stagger_secs=0.0, clock=time.monotonic):
+        """
+        Creates power scheduler instance.
+        :param relay_power_ratings: Power (watts) of the devices attached to relays, by relay index. Relays not
+        present here are not scheduled
+        :type relay_power_ratings: dict
+        :param budget_watts: Maximum total power of active relays
+        :type budget_watts: float
+        :param relay_api: Api to read and modify relay states
+        :type relay_api: RelayApi
+        :param stagger_secs: Minimum time between two subsequent activations
+        :type stagger_secs: float
+        :param clock: Function returning current time in seconds
+        """
+        super().__init__()
+        self.__relay_power_ratings = dict(relay_power_ratings)
+        self.__budget_watts = budget_watts
+        self.__relay_api = relay_api
+        self.__stagger_secs = stagger_secs
+        self.__clock = clock
+        self.__requests = {}
+        self.__lock = threading.Lock()
+        self.__last_activation_time = None
+        self.__used_watts = 0.0
+        self.__granted_count = 0
+        self.__denied_count = 0
+        self.__staggered_count = 0
+
+    def is_scheduled(self, relay_index):
+        """
+        Returns True if activation of the relay has to be requested instead of activating it directly
+        """
+        return relay_index in self.__relay_power_ratings
+
+    def request(self, relay_index, priority):
+        """
+        Requests activation of the relay. Repeated requests for the same relay update its priority but keep its
+        position among requests of the same priority
+        :param relay_index: Index of the relay to activate
+        :type relay_index: int
+        :param priority: The higher the priority the sooner the request is served, eg. distance from the setpoint
+        :type priority: float
+        """
+        self.__lock.acquire()
+        try:
+            request = self.__requests.get(relay_index)
+            self.__requests[relay_index] = (priority, self.__clock() if request is None else request[1])
+        finally:
+            self.__lock.release()
+
+    def cancel(self, relay_index):
+        """
+        Cancels pending activation request of the relay, if any
+        """
+        self.__lock.acquire()
+        try:
+            self.__requests.pop(relay_index, None)
+        finally:
+            self.__lock.release()
+
+    def retain(self, relay_indexes):
+        """
+        Cancels pending activation requests of relays other than the given ones
+        :param relay_indexes: Relays whose requests are kept, eg. relays of the current programs
+        :type relay_indexes: set
+        """
+        self.__lock.acquire()
+        try:
+            for relay_index in [relay_index for relay_index in self.__requests if relay_index not in relay_indexes]:
+                del self.__requests[relay_index]
+        finally:
+            self.__lock.release()
+
+    def schedule(self):
+        """
+        Activates requested relays within the power budget. Should be called once per controller loop iteration,
+        after all programs were checked
+        """
+        self.__lock.acquire()
+        try:
+            self.__schedule()
+        finally:
+            self.__lock.release()
+
+    def __schedule(self):
+        self.__used_watts = sum(watts for relay_index, watts in self.__relay_power_ratings.items()
+                                if self.__relay_api.get_relay_state(relay_index))
+        if not self.__requests:
+            return
+
+        now = self.__clock()
+        # highest priority first, the longest waiting first among requests of the same priority
+        requests = sorted(self.__requests.items(), key=lambda item: (-item[1][0], item[1][1]))
+        for relay_index, _ in requests:
+            if self.__relay_api.get_relay_state(relay_index):
+                self.__requests.pop(relay_index, None)
+                continue
+            watts = self.__relay_power_ratings[relay_index]
+            if self.__used_watts + watts > self.__budget_watts:
+                self.__denied_count += 1
+                continue
+            if self.__last_activation_time is not None and now - self.__last_activation_time < self.__stagger_secs:
+                self.__staggered_count += 1
+                continue
+            Logger.info("Power budget granted for relay:{} {}W used:{}W budget:{}W".format(
+                relay_index, watts, self.__used_watts, self.__budget_watts))
+            self.__relay_api.set_relay_state(relay_index, 1)
+            self.__requests.pop(relay_index, None)
+            self.__used_watts += watts
+            self.__last_activation_time = now
+            self.__granted_count += 1
+
+    def get_metrics(self):
+        """
+        Returns scheduler decisions and current power usage
+        :rtype: dict
+        """
+        self.__lock.acquire()
+        try:
+            return {"budget_watts": self.__budget_watts,
+                    "used_watts": self.__used_watts,
+                    "queued_relays": sorted(self.__requests.keys()),
+                    "granted_count": self.__granted_count,
+                    "denied_count": self.__denied_count,
+                    "staggered_count": self.__staggered_count}
+        finally:
+            self.__lock.release()
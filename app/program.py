@@ -1,12 +1,17 @@
+import hashlib
 import json
+import time
 
 
 class Program(object):
     """
     Represents a single program that defines thermal sensor and up to two relays that enable cooling or heating
-    in order to keep temperature at defined level
+    in order to keep temperature at defined level. Program is immutable, use modify_with to obtain a modified copy
     """
 
+    __slots__ = ("__program_id", "__program_name", "__sensor_id", "__heating_relay_index", "__cooling_relay_index",
+                 "__min_temperature", "__max_temperature", "__active", "__program_crc")
+
     UNDEFINED_ID = ""
     UNDEFINED_SENSOR_ID = ""
     UNDEFINED_NAME = ""
@@ -53,7 +58,26 @@ class Program(object):
         self.__min_temperature = min_temperature
         self.__max_temperature = max_temperature
         self.__active = active
-
+        self.__program_crc = Program.__compute_crc(program_id, program_name, sensor_id,
+                                                   cooling_relay_index, heating_relay_index,
+                                                   min_temperature, max_temperature, active)
+
+    @staticmethod
+    def __compute_crc(program_id, program_name, sensor_id, cooling_relay_index, heating_relay_index,
+                      min_temperature, max_temperature, active):
+        # Digest of canonical JSON representation of program fields. Unlike built-in hash() it doesn't depend on
+        # PYTHONHASHSEED, so it stays the same across restarts and can be used by clients to detect program changes
+        canonical_fields = [program_id, program_name, sensor_id, cooling_relay_index, heating_relay_index,
+                            Program.__canonical_temperature(min_temperature),
+                            Program.__canonical_temperature(max_temperature),
+                            active]
+        canonical_json = json.dumps(canonical_fields, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha1(canonical_json.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def __canonical_temperature(temperature):
+        # 18 and 18.0 is the same temperature, JSON clients may send either
+        return float(temperature) if type(temperature) is int else temperature
 
     @property
     def active(self):
@@ -69,9 +93,11 @@ class Program(object):
 
     @property
     def program_crc(self):
-        return str(hash((self.program_id, self.program_name, self.sensor_id,
-                    self.cooling_relay_index, self.heating_relay_index,
-                    self.min_temperature, self.max_temperature, self.active)))
+        """
+        Stable digest of all program fields computed once when the program is created. Programs with the same
+        fields have the same crc, also after the server restarts
+        """
+        return self.__program_crc
 
     @property
     def sensor_id(self):
@@ -93,18 +119,6 @@ class Program(object):
     def max_temperature(self):
         return self.__max_temperature
 
-    def create_program_state(self, therm_sensor_api, relay_api):
-        heating_activated = False
-        if self.heating_relay_index != Program.UNDEFINED_HEATING_RELAY_INDEX:
-            heating_activated = relay_api.get_relay_state(self.heating_relay_index)
-        cooling_activated = False
-        if self.cooling_relay_index != Program.UNDEFINED_HEATING_RELAY_INDEX:
-            cooling_activated = relay_api.get_relay_state(self.cooling_relay_index)
-        return ProgramState(self.program_id,
-                            therm_sensor_api.get_sensor_temperature(self.sensor_id),
-                            self.program_crc,
-                            heating_activated, cooling_activated)
-
     def modify_with(self, program, program_name=None, sensor_id=None,
                     heating_relay_index=None, cooling_relay_index=None,
                     min_temperature=None, max_temperature=None, active=None):
@@ -157,6 +171,9 @@ class Program(object):
 
         return False
 
+    def __hash__(self):
+        return hash(self.program_crc)
+
     def __str__(self):
         return "Program [program_id:{} program_name:{} program_crc:{} " \
                "sensor_id:{} heating_relay_index:{} cooling_relay_index:{} min_temp:{} " \
@@ -169,13 +186,22 @@ class Program(object):
         return self.__str__()
 
 
-class ProgramState:
+class ProgramState(object):
+    """
+    Immutable record describing the state of a program captured during program check
+    """
+
+    __slots__ = ("__program_id", "__current_temperature", "__program_crc", "__heating_activated",
+                 "__cooling_activated", "__error", "__timestamp")
+
     def __init__(self,
                  program_id,
                  current_temperature,
                  program_crc,
                  heating_activated=False,
-                 cooling_activated=False):
+                 cooling_activated=False,
+                 error=None,
+                 timestamp=None):
         """
         Creates program state instance.
         :param program_id: Id of the program in UUID format that state refers to
@@ -188,6 +214,10 @@ class ProgramState:
         :type heating_activated: bool
         :param cooling_activated: True if cooling for the program is active now
         :type cooling_activated: bool
+        :param error: Description of the error that occurred during the last program check, None if there was none
+        :type error: str
+        :param timestamp: Time (seconds since the epoch) when the state was captured, None if not captured yet
+        :type timestamp: float
         """
         super().__init__()
         self.__program_id = program_id
@@ -195,6 +225,8 @@ class ProgramState:
         self.__program_crc = program_crc
         self.__heating_activated = True if heating_activated else False
         self.__cooling_activated = True if cooling_activated else False
+        self.__error = error
+        self.__timestamp = timestamp
 
     @property
     def program_id(self):
@@ -216,13 +248,285 @@ class ProgramState:
     def cooling_activated(self):
         return self.__cooling_activated
 
+    @property
+    def error(self):
+        return self.__error
+
+    @property
+    def timestamp(self):
+        return self.__timestamp
+
+    def get_age(self, now=None):
+        """
+        Returns the number of seconds that passed since the state was captured
+        :param now: Current time (seconds since the epoch), taken from the clock if not given
+        :type now: float
+        :return: Age of the state in seconds or None if the state has not been captured yet
+        :rtype: float
+        """
+        if self.__timestamp is None:
+            return None
+        if now is None:
+            now = time.time()
+        return max(0.0, now - self.__timestamp)
+
     def to_json_data(self):
         return {"program_id": self.program_id,
                 "current_temperature": self.current_temperature,
                 "program_crc": self.program_crc,
                 "heating_activated": self.heating_activated,
-                "cooling_activated": self.cooling_activated}
+                "cooling_activated": self.cooling_activated,
+                "error": self.error,
+                "timestamp": self.timestamp}
 
     def to_json(self):
         data = self.to_json_data()
         return json.dumps(data)
+
+    @classmethod
+    def from_json_data(cls, data):
+        return ProgramState(program_id=data["program_id"],
+                            current_temperature=data.get("current_temperature"),
+                            program_crc=data.get("program_crc"),
+                            heating_activated=data.get("heating_activated", False),
+                            cooling_activated=data.get("cooling_activated", False),
+                            error=data.get("error"),
+                            timestamp=data.get("timestamp"))
+
+    def __key(self):
+        return (self.__program_id, self.__current_temperature, self.__program_crc, self.__heating_activated,
+                self.__cooling_activated, self.__error, self.__timestamp)
+
+    def __eq__(self, other):
+        if type(other) is type(self):
+            return self.__key() == other.__key()
+
+        return False
+
+    def __hash__(self):
+        return hash(self.__key())
+
+    def __str__(self):
+        return "ProgramState [program_id:{} current_temperature:{} program_crc:{} heating_activated:{} " \
+               "cooling_activated:{} error:{} timestamp:{}]".format(*self.__key())
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class ProgramRollup(object):
+    """
+    Immutable record summarizing the states of a program within a period of its history
+    """
+
+    __slots__ = ("__program_id", "__timestamp", "__resolution_secs", "__min_temperature", "__max_temperature",
+                 "__mean_temperature", "__count", "__heating_secs", "__cooling_secs")
+
+    def __init__(self, program_id, timestamp, resolution_secs, min_temperature, max_temperature, mean_temperature,
+                 count, heating_secs, cooling_secs):
+        """
+        Creates program rollup instance.
+        :param program_id: Id of the program in UUID format that rollup refers to
+        :type program_id: str
+        :param timestamp: Beginning of the period (seconds since the epoch)
+        :type timestamp: float
+        :param resolution_secs: Length of the period
+        :type resolution_secs: int
+        :param min_temperature: Minimum temperature within the period, None if no temperature was measured
+        :type min_temperature: float
+        :param max_temperature: Maximum temperature within the period, None if no temperature was measured
+        :type max_temperature: float
+        :param mean_temperature: Mean temperature within the period, None if no temperature was measured
+        :type mean_temperature: float
+        :param count: Number of temperature measurements within the period
+        :type count: int
+        :param heating_secs: Seconds the heating was active within the period
+        :type heating_secs: float
+        :param cooling_secs: Seconds the cooling was active within the period
+        :type cooling_secs: float
+        """
+        super().__init__()
+        self.__program_id = program_id
+        self.__timestamp = timestamp
+        self.__resolution_secs = resolution_secs
+        self.__min_temperature = min_temperature
+        self.__max_temperature = max_temperature
+        self.__mean_temperature = mean_temperature
+        self.__count = count
+        self.__heating_secs = heating_secs
+        self.__cooling_secs = cooling_secs
+
+    @property
+    def program_id(self):
+        return self.__program_id
+
+    @property
+    def timestamp(self):
+        return self.__timestamp
+
+    @property
+    def resolution_secs(self):
+        return self.__resolution_secs
+
+    @property
+    def min_temperature(self):
+        return self.__min_temperature
+
+    @property
+    def max_temperature(self):
+        return self.__max_temperature
+
+    @property
+    def mean_temperature(self):
+        return self.__mean_temperature
+
+    @property
+    def count(self):
+        return self.__count
+
+    @property
+    def heating_secs(self):
+        return self.__heating_secs
+
+    @property
+    def cooling_secs(self):
+        return self.__cooling_secs
+
+    def to_json_data(self):
+        return {"program_id": self.program_id,
+                "timestamp": self.timestamp,
+                "resolution": self.resolution_secs,
+                "min_temperature": self.min_temperature,
+                "max_temperature": self.max_temperature,
+                "mean_temperature": self.mean_temperature,
+                "count": self.count,
+                "heating_secs": self.heating_secs,
+                "cooling_secs": self.cooling_secs}
+
+    def __key(self):
+        return (self.__program_id, self.__timestamp, self.__resolution_secs, self.__min_temperature,
+                self.__max_temperature, self.__mean_temperature, self.__count, self.__heating_secs,
+                self.__cooling_secs)
+
+    def __eq__(self, other):
+        if type(other) is type(self):
+            return self.__key() == other.__key()
+
+        return False
+
+    def __hash__(self):
+        return hash(self.__key())
+
+    def __str__(self):
+        return "ProgramRollup [program_id:{} timestamp:{} resolution_secs:{} min_temperature:{} max_temperature:{} " \
+               "mean_temperature:{} count:{} heating_secs:{} cooling_secs:{}]".format(*self.__key())
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class ProgramOperation(object):
+    """
+    Single operation on programs - creation, modification or deletion of a program, used to modify several
+    programs at once
+    """
+
+    __slots__ = ("__kind", "__program_id", "__program")
+
+    CREATE = "create"
+    MODIFY = "modify"
+    DELETE = "delete"
+    KINDS = (CREATE, MODIFY, DELETE)
+
+    def __init__(self, kind, program_id=Program.UNDEFINED_ID, program=None):
+        """
+        Creates program operation instance.
+        :param kind: Kind of the operation, one of CREATE, MODIFY, DELETE
+        :type kind: str
+        :param program_id: Id of the program to modify or delete, ignored for CREATE
+        :type program_id: str
+        :param program: Program to create or program the existing one will be replaced with, ignored for DELETE
+        :type program: Program
+        """
+        self.__kind = kind
+        self.__program_id = program_id
+        self.__program = program
+
+    @property
+    def kind(self):
+        return self.__kind
+
+    @property
+    def program_id(self):
+        return self.__program_id
+
+    @property
+    def program(self):
+        return self.__program
+
+    def to_json_data(self):
+        data = {"op": self.kind}
+        if self.program_id:
+            data["id"] = self.program_id
+        if self.program is not None:
+            data["program"] = self.program.to_json_data()
+        return data
+
+    @classmethod
+    def from_json_data(cls, data):
+        program_data = data.get("program")
+        return ProgramOperation(kind=data.get("op"),
+                                program_id=data.get("id", Program.UNDEFINED_ID),
+                                program=None if program_data is None else Program.from_json_data(program_data))
+
+    def __str__(self):
+        return "ProgramOperation [kind:{} program_id:{} program:{}]".format(self.kind, self.program_id, self.program)
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class ProgramOperationResult(object):
+    """
+    Result of a single program operation. Contains either resulting program (created, modified or deleted one) or
+    an error that caused the operation to be rejected
+    """
+
+    __slots__ = ("__operation", "__program", "__error")
+
+    def __init__(self, operation, program=None, error=None):
+        """
+        Creates program operation result instance.
+        :param operation: Operation the result refers to
+        :type operation: ProgramOperation
+        :param program: Created, modified or deleted program, None if the operation was rejected
+        :type program: Program
+        :param error: Error that caused the operation to be rejected, None if there was none
+        :type error: ProgramError
+        """
+        self.__operation = operation
+        self.__program = program
+        self.__error = error
+
+    @property
+    def operation(self):
+        return self.__operation
+
+    @property
+    def program(self):
+        return self.__program
+
+    @property
+    def error(self):
+        return self.__error
+
+    def to_json_data(self):
+        data = {"op": self.operation.kind}
+        if self.program is not None:
+            data["id"] = self.program.program_id
+            data["program"] = self.program.to_json_data()
+        elif self.operation.program_id:
+            data["id"] = self.operation.program_id
+        if self.error is not None:
+            data["error"] = self.error.to_json_data()
+        return data
@@ -0,0 +1,131 @@
+import time
+
+from app.logger import Logger
+
+
+class SharedRelay(object):
+    """
+    Relay driving a device shared by several programs, eg. a glycol chiller pump feeding several fermenters,
+    each of them having its own cooling solenoid attached to a separate relay. Shared relay is activated whenever any
+    of its dependent relays is active
+    """
+
+    __slots__ = ("__relay_index", "__dependent_relay_indexes", "__min_on_secs", "__min_off_secs")
+
+    def __init__(self, relay_index, dependent_relay_indexes, min_on_secs=0.0, min_off_secs=0.0):
+        """
+        Creates shared relay instance.
+        :param relay_index: Index of the shared relay
+        :type relay_index: int
+        :param dependent_relay_indexes: Indexes of the relays (used by programs) that need the shared relay active
+        :type dependent_relay_indexes: list
+        :param min_on_secs: Minimum time the shared relay stays active once activated
+        :type min_on_secs: float
+        :param min_off_secs: Minimum time the shared relay stays inactive once deactivated
+        :type min_off_secs: float
+        """
+        self.__relay_index = relay_index
+        self.__dependent_relay_indexes = frozenset(dependent_relay_indexes)
+        self.__min_on_secs = min_on_secs
+        self.__min_off_secs = min_off_secs
+
+    @property
+    def relay_index(self):
+        return self.__relay_index
+
+    @property
+    def dependent_relay_indexes(self):
+        return self.__dependent_relay_indexes
+
+    @property
+    def min_on_secs(self):
+        return self.__min_on_secs
+
+    @property
+    def min_off_secs(self):
+        return self.__min_off_secs
+
+    def __str__(self):
+        return "SharedRelay [relay_index:{} dependent_relay_indexes:{} min_on_secs:{} min_off_secs:{}]".format(
+            self.relay_index, sorted(self.dependent_relay_indexes), self.min_on_secs, self.min_off_secs)
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class SharedRelayScheduler(object):
+    """
+    Drives shared relays based on the states of their dependent relays, respecting minimum on/off time of each
+    shared relay to protect the shared device from short cycling
+    """
+
+    def __init__(self, shared_relays, relay_api, clock=time.monotonic):
+        """
+        Creates scheduler instance.
+        :param shared_relays: Shared relays to drive
+        :type shared_relays: list
+        :param relay_api: Api to read and modify relay states
+        :type relay_api: RelayApi
+        :param clock: Function returning current time in seconds, used to measure relay on/off time
+        """
+        super().__init__()
+        self.__shared_relays = list(shared_relays)
+        self.__relay_api = relay_api
+        self.__clock = clock
+        self.__last_switch_time = {shared_relay.relay_index: None for shared_relay in self.__shared_relays}
+
+    @property
+    def shared_relay_indexes(self):
+        return [shared_relay.relay_index for shared_relay in self.__shared_relays]
+
+    def is_shared(self, relay_index):
+        return relay_index in self.__last_switch_time
+
+    def update(self, programs, states):
+        """
+        Activates shared relays whose dependent relays are active and deactivates the ones that are not needed
+        anymore. Should be called once per controller loop iteration, after all programs were checked
+        :param programs: Existing programs
+        :type programs: list
+        :param states: Program states published after the check, by program id
+        :type states: dict
+        """
+        if not self.__shared_relays:
+            return
+
+        # single pass over programs to collect relays that are active at the moment
+        active_relay_indexes = set()
+        for program in programs:
+            state = states.get(program.program_id)
+            if state is None:
+                continue
+            if state.cooling_activated:
+                active_relay_indexes.add(program.cooling_relay_index)
+            if state.heating_activated:
+                active_relay_indexes.add(program.heating_relay_index)
+
+        now = self.__clock()
+        for shared_relay in self.__shared_relays:
+            demanded = not shared_relay.dependent_relay_indexes.isdisjoint(active_relay_indexes)
+            self.__drive(shared_relay, 1 if demanded else 0, now)
+
+    def deactivate_all(self):
+        """
+        Deactivates all shared relays immediately, regardless of their minimum on time
+        """
+        for shared_relay in self.__shared_relays:
+            if self.__relay_api.get_relay_state(shared_relay.relay_index):
+                self.__relay_api.set_relay_state(shared_relay.relay_index, 0)
+            self.__last_switch_time[shared_relay.relay_index] = None
+
+    def __drive(self, shared_relay, relay_state, now):
+        relay_index = shared_relay.relay_index
+        if self.__relay_api.get_relay_state(relay_index) == relay_state:
+            return
+        last_switch_time = self.__last_switch_time[relay_index]
+        min_secs = shared_relay.min_off_secs if relay_state == 1 else shared_relay.min_on_secs
+        if last_switch_time is not None and now - last_switch_time < min_secs:
+            return
+        Logger.info("{} shared relay:{}".format("Activating" if relay_state == 1 else "Deactivating", relay_index))
+        self.__relay_api.set_relay_state(relay_index, relay_state)
+        self.__last_switch_time[relay_index] = now
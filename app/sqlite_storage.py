@@ -0,0 +1,213 @@
+import os
+import sqlite3
+from datetime import datetime
+from threading import Lock
+
+from app.history import HistoryRecord
+from app.logger import LogEntry
+from app.program import Program
+from app.storage import get_storage_root_dir_path
+from app.therm_sensor import ThermSensor
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS programs (program_id TEXT PRIMARY KEY, position INTEGER NOT NULL, name TEXT, "
+    "sensor_id TEXT, heating_relay_index INTEGER, cooling_relay_index INTEGER, min_temperature REAL, "
+    "max_temperature REAL, active INTEGER)",
+    "CREATE TABLE IF NOT EXISTS sensors (sensor_id TEXT PRIMARY KEY, position INTEGER NOT NULL, name TEXT)",
+    "CREATE TABLE IF NOT EXISTS logs (log_id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT, level TEXT, message TEXT)",
+    "CREATE TABLE IF NOT EXISTS history (timestamp REAL NOT NULL, sensor_id TEXT NOT NULL, temperature REAL, "
+    "relay_mask INTEGER NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS history_sensor_timestamp ON history (sensor_id, timestamp)",
+]
+
+# Statements are kept constant, so the connection's statement cache prepares each of them once
+SQL_DELETE_PROGRAMS = "DELETE FROM programs"
+SQL_DELETE_PROGRAM = "DELETE FROM programs WHERE program_id = ?"
+SQL_INSERT_PROGRAM = "INSERT INTO programs (program_id, position, name, sensor_id, heating_relay_index, " \
+                     "cooling_relay_index, min_temperature, max_temperature, active) " \
+                     "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+SQL_APPEND_PROGRAM = "INSERT INTO programs (program_id, position, name, sensor_id, heating_relay_index, " \
+                     "cooling_relay_index, min_temperature, max_temperature, active) " \
+                     "SELECT ?, COALESCE(MAX(position) + 1, 0), ?, ?, ?, ?, ?, ?, ? FROM programs"
+SQL_UPDATE_PROGRAM = "UPDATE programs SET name = ?, sensor_id = ?, heating_relay_index = ?, cooling_relay_index = ?, " \
+                     "min_temperature = ?, max_temperature = ?, active = ? WHERE program_id = ?"
+SQL_SELECT_PROGRAMS = "SELECT program_id, name, sensor_id, heating_relay_index, cooling_relay_index, " \
+                      "min_temperature, max_temperature, active FROM programs ORDER BY position"
+SQL_DELETE_SENSORS = "DELETE FROM sensors"
+SQL_INSERT_SENSOR = "INSERT INTO sensors (sensor_id, position, name) VALUES (?, ?, ?)"
+SQL_APPEND_SENSOR = "INSERT INTO sensors (sensor_id, position, name) " \
+                    "SELECT ?, COALESCE(MAX(position) + 1, 0), ? FROM sensors"
+SQL_UPDATE_SENSOR = "UPDATE sensors SET name = ? WHERE sensor_id = ?"
+SQL_SELECT_SENSORS = "SELECT sensor_id, name FROM sensors ORDER BY position"
+SQL_INSERT_LOG = "INSERT INTO logs (date, level, message) VALUES (?, ?, ?)"
+SQL_SELECT_LOGS = "SELECT date, level, message FROM (SELECT log_id, date, level, message FROM logs " \
+                  "ORDER BY log_id DESC LIMIT ?) ORDER BY log_id"
+SQL_INSERT_HISTORY = "INSERT INTO history (timestamp, sensor_id, temperature, relay_mask) VALUES (?, ?, ?, ?)"
+SQL_SELECT_HISTORY = "SELECT timestamp, sensor_id, temperature, relay_mask FROM history " \
+                     "WHERE sensor_id = ? AND timestamp >= ? AND timestamp <= ? ORDER BY timestamp"
+
+
+class SqliteStorage(object):
+    """
+    Use to persistently store data in a single SQLite database in WAL mode. Has the same contract as Storage, plus
+    row level updates of programs and sensors, so a change of one program doesn't rewrite the others. Every store
+    is a single transaction. The database can hold logs and history as well.
+
+    One connection is kept open for the lifetime of the storage and shared by all threads, access is serialized.
+    The connection should be closed at exit, see close
+    """
+
+    LOG_DATE_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+    def __init__(self, storage_root_dir=get_storage_root_dir_path(), database_file_name="brewery.db"):
+        """
+        Creates storage instance, the database is created if needed.
+        :param storage_root_dir: Directory the database is stored in
+        :type storage_root_dir: str
+        :param database_file_name: Name of the database file
+        :type database_file_name: str
+        """
+        super().__init__()
+        self.storage_root_dir = storage_root_dir
+        self.database_file = database_file_name
+        # size of the values of the written rows, pages and indexes written by SQLite are not included
+        self.bytes_written = 0
+        self.__lock = Lock()
+        os.makedirs(storage_root_dir, exist_ok=True)
+        # transactions are started explicitly, see __execute_in_transaction
+        self.__connection = sqlite3.connect(os.path.join(storage_root_dir, database_file_name),
+                                            check_same_thread=False, isolation_level=None)
+        self.__connection.execute("PRAGMA journal_mode=WAL")
+        self.__connection.execute("PRAGMA synchronous=FULL")
+        for statement in SCHEMA:
+            self.__connection.execute(statement)
+
+    def close(self):
+        self.__lock.acquire()
+        try:
+            self.__connection.close()
+        finally:
+            self.__lock.release()
+
+    def store_programs(self, programs):
+        rows = [(program.program_id, position) + self.__program_values(program)
+                for position, program in enumerate(programs)]
+
+        def store(cursor):
+            cursor.execute(SQL_DELETE_PROGRAMS)
+            cursor.executemany(SQL_INSERT_PROGRAM, rows)
+        self.__execute_in_transaction(store, rows)
+
+    def load_programs(self):
+        rows = self.__execute_in_transaction(lambda cursor: cursor.execute(SQL_SELECT_PROGRAMS).fetchall())
+        return [Program(program_id, name, sensor_id, heating_relay_index, cooling_relay_index, min_temperature,
+                        max_temperature, bool(active))
+                for program_id, name, sensor_id, heating_relay_index, cooling_relay_index, min_temperature,
+                max_temperature, active in rows]
+
+    def upsert_program(self, program):
+        """
+        Stores the program, replacing the stored program with the same id if there is one. A new program is
+        stored after the existing ones
+        """
+        values = self.__program_values(program)
+
+        def upsert(cursor):
+            cursor.execute(SQL_UPDATE_PROGRAM, values + (program.program_id,))
+            if cursor.rowcount == 0:
+                cursor.execute(SQL_APPEND_PROGRAM, (program.program_id,) + values)
+        self.__execute_in_transaction(upsert, [(program.program_id,) + values])
+
+    def delete_program(self, program_id):
+        self.__execute_in_transaction(lambda cursor: cursor.execute(SQL_DELETE_PROGRAM, (program_id,)))
+
+    def store_sensors(self, sensors):
+        rows = [(sensor.id, position, sensor.name) for position, sensor in enumerate(sensors)]
+
+        def store(cursor):
+            cursor.execute(SQL_DELETE_SENSORS)
+            cursor.executemany(SQL_INSERT_SENSOR, rows)
+        self.__execute_in_transaction(store, rows)
+
+    def load_sensors(self):
+        rows = self.__execute_in_transaction(lambda cursor: cursor.execute(SQL_SELECT_SENSORS).fetchall())
+        return [ThermSensor(sensor_id, name) for sensor_id, name in rows]
+
+    def upsert_sensor(self, sensor):
+        """
+        Stores the sensor, replacing the stored sensor with the same id if there is one
+        """
+        def upsert(cursor):
+            cursor.execute(SQL_UPDATE_SENSOR, (sensor.name, sensor.id))
+            if cursor.rowcount == 0:
+                cursor.execute(SQL_APPEND_SENSOR, (sensor.id, sensor.name))
+        self.__execute_in_transaction(upsert, [(sensor.id, sensor.name)])
+
+    def append_logs(self, entries):
+        """
+        :param entries: Log entries to store
+        :type entries: list
+        """
+        rows = [(entry.date.strftime(SqliteStorage.LOG_DATE_FORMAT), entry.level, entry.message) for entry in entries]
+        self.__execute_in_transaction(lambda cursor: cursor.executemany(SQL_INSERT_LOG, rows), rows)
+
+    def load_logs(self, limit=-1):
+        """
+        :param limit: Maximum number of the most recent entries to load, all entries if negative
+        :type limit: int
+        :return: Log entries, the oldest first
+        :rtype: list
+        """
+        rows = self.__execute_in_transaction(lambda cursor: cursor.execute(SQL_SELECT_LOGS, (limit,)).fetchall())
+        return [LogEntry(datetime.strptime(date, SqliteStorage.LOG_DATE_FORMAT), level, message)
+                for date, level, message in rows]
+
+    def append_history(self, records):
+        """
+        :param records: History records to store
+        :type records: list
+        """
+        rows = [(record.timestamp, record.sensor_id, record.temperature, record.relay_mask) for record in records]
+        self.__execute_in_transaction(lambda cursor: cursor.executemany(SQL_INSERT_HISTORY, rows), rows)
+
+    def query_history(self, sensor_id, start=None, end=None):
+        """
+        Returns history records of the sensor within the time range (inclusive), see HistoryStore.query
+        :rtype: list
+        """
+        parameters = (sensor_id, float("-inf") if start is None else start, float("inf") if end is None else end)
+        rows = self.__execute_in_transaction(lambda cursor: cursor.execute(SQL_SELECT_HISTORY, parameters).fetchall())
+        return [HistoryRecord(timestamp, sensor_id, temperature, relay_mask)
+                for timestamp, sensor_id, temperature, relay_mask in rows]
+
+    @staticmethod
+    def __program_values(program):
+        return (program.program_name, program.sensor_id, program.heating_relay_index, program.cooling_relay_index,
+                program.min_temperature, program.max_temperature, 1 if program.active else 0)
+
+    @staticmethod
+    def __get_size(rows):
+        # text as UTF-8, numbers as 8 bytes, the way SQLite stores them at most
+        return sum(0 if value is None else len(value.encode("utf-8")) if isinstance(value, str) else 8
+                   for row in rows for value in row)
+
+    def __execute_in_transaction(self, function, rows=()):
+        """
+        :param rows: Rows written by the function, counted in bytes_written once committed
+        """
+        self.__lock.acquire()
+        try:
+            cursor = self.__connection.cursor()
+            cursor.execute("BEGIN")
+            try:
+                result = function(cursor)
+                cursor.execute("COMMIT")
+                self.bytes_written += SqliteStorage.__get_size(rows)
+                return result
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+            finally:
+                cursor.close()
+        finally:
+            self.__lock.release()
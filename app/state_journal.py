@@ -0,0 +1,152 @@
+import json
+import os
+import time
+
+from app.logger import Logger
+from app.program import ProgramState
+
+
+class JournalSnapshot(object):
+    """
+    State of the controller captured in the journal
+    """
+
+    __slots__ = ("__timestamp", "__relay_states", "__program_states")
+
+    def __init__(self, timestamp, relay_states, program_states):
+        """
+        Creates snapshot instance.
+        :param timestamp: Time (seconds since the epoch) the snapshot was captured
+        :type timestamp: float
+        :param relay_states: States of all relays (0|1) by relay index
+        :type relay_states: list
+        :param program_states: Last published states of the programs, by program id
+        :type program_states: dict
+        """
+        self.__timestamp = timestamp
+        self.__relay_states = list(relay_states)
+        self.__program_states = dict(program_states)
+
+    @property
+    def timestamp(self):
+        return self.__timestamp
+
+    @property
+    def relay_states(self):
+        return self.__relay_states
+
+    @property
+    def program_states(self):
+        return self.__program_states
+
+    def to_json_data(self):
+        return {"timestamp": self.timestamp,
+                "relay_states": self.relay_states,
+                "program_states": [state.to_json_data() for state in self.program_states.values()]}
+
+    @classmethod
+    def from_json_data(cls, data):
+        states = [ProgramState.from_json_data(state) for state in data["program_states"]]
+        return JournalSnapshot(data["timestamp"], [1 if state else 0 for state in data["relay_states"]],
+                               {state.program_id: state for state in states})
+
+    def __str__(self):
+        return "JournalSnapshot [timestamp:{} relay_states:{} program_states:{}]".format(
+            self.timestamp, self.relay_states, list(self.program_states.values()))
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class StateJournal(object):
+    """
+    Small file holding the last relay states and program states, written by the control loop every few seconds.
+    After a crash the controller restores from it - relays are kept in their state instead of being switched off and
+    on again, and program states are available before the sensors are read for the first time.
+
+    The journal is meant to survive restarts of the process, not of the system (relays are reset on boot anyway),
+    so it's best kept in memory backed file system, eg. /dev/shm, to spare the SD card
+    """
+
+    def __init__(self, journal_file, interval_secs=5.0, max_age_secs=300.0, clock=time.time):
+        """
+        Creates journal instance.
+        :param journal_file: Path to the journal file
+        :type journal_file: str
+        :param interval_secs: Minimum time between subsequent writes
+        :type interval_secs: float
+        :param max_age_secs: Snapshots older than this are not restored, the state of the hardware might have changed
+        too much since then
+        :type max_age_secs: float
+        :param clock: Function returning current time in seconds since the epoch
+        """
+        super().__init__()
+        self.__journal_file = journal_file
+        self.__interval_secs = interval_secs
+        self.__max_age_secs = max_age_secs
+        self.__clock = clock
+        self.__last_write_time = None
+        self.__snapshot = None
+        self.__restored = False
+
+    def is_due(self):
+        """
+        Returns True if the interval since the last write has passed
+        """
+        return self.__last_write_time is None or self.__clock() - self.__last_write_time >= self.__interval_secs
+
+    def write(self, relay_states, program_states):
+        """
+        Writes the snapshot of the current state, replacing the previous one atomically
+        :param relay_states: States of all relays (0|1) by relay index
+        :type relay_states: list
+        :param program_states: Last published states of the programs, by program id
+        :type program_states: dict
+        """
+        now = self.__clock()
+        self.__last_write_time = now
+        snapshot = JournalSnapshot(now, relay_states, program_states)
+        temp_file = self.__journal_file + ".tmp"
+        try:
+            with open(temp_file, "w") as output_stream:
+                output_stream.write(json.dumps(snapshot.to_json_data()))
+            os.replace(temp_file, self.__journal_file)
+        except OSError as e:
+            Logger.error("State journal write error {}".format(str(e)))
+
+    def clear(self):
+        """
+        Removes the journal file, so there is nothing to restore after a clean shutdown. Restoring is meant for
+        restarts after a crash only
+        """
+        try:
+            os.remove(self.__journal_file)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            Logger.error("State journal cannot be cleared: {}".format(str(e)))
+
+    def restore(self):
+        """
+        Returns the snapshot written before the restart. The journal file is read once, subsequent calls return the
+        same snapshot
+        :return: Snapshot or None if there is none, it's not valid or it's too old
+        :rtype: JournalSnapshot
+        """
+        if self.__restored:
+            return self.__snapshot
+        self.__restored = True
+        if not os.path.exists(self.__journal_file):
+            return None
+        try:
+            with open(self.__journal_file, "r") as input_stream:
+                snapshot = JournalSnapshot.from_json_data(json.loads(input_stream.read()))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            Logger.error("State journal cannot be restored: {}".format(str(e)))
+            return None
+        age = self.__clock() - snapshot.timestamp
+        if age > self.__max_age_secs or age < 0:
+            Logger.info("State journal ignored, captured {:.0f}s ago".format(age))
+            return None
+        self.__snapshot = snapshot
+        return snapshot
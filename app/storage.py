@@ -1,6 +1,8 @@
 import os
 import json
+import shutil
 from pathlib import Path
+from app.logger import Logger
 from app.program import Program
 from app.therm_sensor import ThermSensor
 
@@ -15,51 +17,118 @@ def get_storage_root_dir_path():
 
 class Storage(object):
     """
-    Use to persistently store data, eg. configuration
+    Use to persistently store data, eg. configuration. Files are replaced atomically, so a power cut during a write
+    leaves either the previous or the new content. Previous contents of each file are kept as generations
+    (eg. programs.1, programs.2) and used when loading if the newest file is not valid
     """
 
+    TEMP_FILE_SUFFIX = ".tmp"
+
     def __init__(self, storage_root_dir=get_storage_root_dir_path(),
-                 programs_file_name="programs", sensors_file_name="sensors"):
+                 programs_file_name="programs", sensors_file_name="sensors", generations=3):
+        """
+        Creates storage instance.
+        :param storage_root_dir: Directory the files are stored in
+        :type storage_root_dir: str
+        :param programs_file_name: Name of the file programs are stored in
+        :type programs_file_name: str
+        :param sensors_file_name: Name of the file sensors are stored in
+        :type sensors_file_name: str
+        :param generations: Number of previous contents to keep for each file
+        :type generations: int
+        """
         super().__init__()
         self.storage_root_dir = storage_root_dir
         self.programs_file = programs_file_name
         self.sensors_file = sensors_file_name
+        self.generations = generations
+        self.bytes_written = 0
 
     def store_programs(self, programs):
         json_data = [program.to_json_data() for program in programs]
         self.__write_json_data_to_file(self.programs_file, json_data)
 
     def load_programs(self):
-        input_file = os.path.join(self.storage_root_dir, self.programs_file)
-        if os.path.exists(input_file):
-            with open(input_file, "r") as file:
-                json_input = file.read()
-                json_data = json.loads(json_input)
-                return [Program.from_json_data(json_data[index]) for index in range(len(json_data))]
-        else:
-            return []
+        json_data = self.__read_json_data_from_file(self.programs_file)
+        return [Program.from_json_data(json_data[index]) for index in range(len(json_data))]
 
     def store_sensors(self, sensors):
         json_data = [sensor.to_json_data() for sensor in sensors]
         self.__write_json_data_to_file(self.sensors_file, json_data)
 
     def load_sensors(self):
-        input_file = os.path.join(self.storage_root_dir, self.sensors_file)
-        if os.path.exists(input_file):
-            with open(input_file, "r") as file:
-                json_input = file.read()
-                json_data = json.loads(json_input)
-                return [ThermSensor.from_json_data(json_data[index]) for index in range(len(json_data))]
-        else:
-            return []
+        json_data = self.__read_json_data_from_file(self.sensors_file)
+        return [ThermSensor.from_json_data(json_data[index]) for index in range(len(json_data))]
+
+    def __generation_file_path(self, file, generation):
+        file_path = os.path.join(self.storage_root_dir, file)
+        return file_path if generation == 0 else "{}.{}".format(file_path, generation)
+
+    def __read_json_data_from_file(self, file):
+        # Returns content of the newest valid generation of the file, empty list if the file was not stored yet
+        error = None
+        for generation in range(self.generations + 1):
+            input_file = self.__generation_file_path(file, generation)
+            if not os.path.exists(input_file):
+                continue
+            try:
+                with open(input_file, "r") as input_stream:
+                    json_data = json.loads(input_stream.read())
+                if not isinstance(json_data, list):
+                    raise ValueError("List expected in {}".format(input_file))
+                if generation > 0:
+                    Logger.error("Storage file {} is not valid, loaded {}".format(file, input_file))
+                return json_data
+            except (IOError, ValueError) as e:
+                Logger.error("Storage file {} cannot be loaded: {}".format(input_file, str(e)))
+                error = e
+        if error is not None:
+            raise error
+        return []
 
     def __write_json_data_to_file(self, file, json_data):
         self.__create_root_dir_if_needed()
-        output_file = os.path.join(self.storage_root_dir, file)
+        output_file = self.__generation_file_path(file, 0)
+        temp_file = output_file + Storage.TEMP_FILE_SUFFIX
         json_output = json.dumps(json_data)
-        # TODO: For safety write to temp file first, then replace
-        with open(output_file, "w") as file:
-            file.write(json_output)
+        with open(temp_file, "w") as output_stream:
+            output_stream.write(json_output)
+            output_stream.flush()
+            self.bytes_written += output_stream.tell()
+            os.fsync(output_stream.fileno())
+        self.__rotate_generations(file)
+        os.replace(temp_file, output_file)
+        self.__sync_root_dir()
+
+    def __rotate_generations(self, file):
+        # file.2 -> file.3, file.1 -> file.2, the oldest generation gets overwritten
+        for generation in range(self.generations, 1, -1):
+            previous_generation_file = self.__generation_file_path(file, generation - 1)
+            if os.path.exists(previous_generation_file):
+                os.replace(previous_generation_file, self.__generation_file_path(file, generation))
+        live_file = self.__generation_file_path(file, 0)
+        if self.generations == 0 or not os.path.exists(live_file):
+            return
+        # file is linked (copied where links are not supported) to file.1, not moved, so it exists until replaced by
+        # the new content
+        temp_file = self.__generation_file_path(file, 1) + Storage.TEMP_FILE_SUFFIX
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        try:
+            os.link(live_file, temp_file)
+        except OSError:
+            shutil.copyfile(live_file, temp_file)
+        os.replace(temp_file, self.__generation_file_path(file, 1))
+
+    def __sync_root_dir(self):
+        # makes the renames durable, not supported on some platforms, eg. Windows
+        if not hasattr(os, "O_DIRECTORY"):
+            return
+        dir_fd = os.open(self.storage_root_dir, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
 
     def __create_root_dir_if_needed(self):
         if not os.path.exists(self.storage_root_dir):
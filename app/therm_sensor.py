@@ -1,6 +1,8 @@
 class ThermSensor(object):
     """Single temperature sensor"""
 
+    __slots__ = ("__sensor_id", "__name")
+
     def __init__(self, sensor_id, name=""):
         super(ThermSensor, self).__init__()
         self.__sensor_id = sensor_id
@@ -28,5 +30,11 @@ class ThermSensor(object):
 
         return False
 
+    def __hash__(self):
+        return hash((self.id, self.name))
+
     def __str__(self):
         return "Sensor [sensor_id:{} sensor_name:{}]".format(self.id, self.name)
+
+    def __repr__(self):
+        return self.__str__()
@@ -9,3 +9,6 @@ class EventBus(object):
 
     def emit(self, event: str, *args, **kwargs):
         _event_bus.emit(event, *args, **kwargs)
+
+    def remove(self, event: str, func):
+        _event_bus.remove_event(func.__name__, event)
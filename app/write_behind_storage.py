@@ -0,0 +1,267 @@
+import atexit
+import threading
+import time
+
+from app.logger import Logger
+
+
+class WriteBehindStorage(object):
+    """
+    Keeps programs and sensors in memory and writes them to the underlying storage later, so a burst of changes
+    (eg. a slider in the UI modifying a program several times a second) results in a single write. Data is written
+    once it has not changed for the debounce time, or once it has been waiting for the maximum delay, whichever comes
+    first. Pending changes are written synchronously at exit.
+
+    Changes of single programs and sensors (upsert_program, delete_program, upsert_sensor) are kept by id and written
+    as row level updates, if the underlying storage supports them (see SqliteStorage). All programs or sensors are
+    written otherwise.
+
+    Note that errors of the underlying storage are not reported to the caller of store_programs/store_sensors, they
+    are logged and the write is retried later
+    """
+
+    PROGRAMS = "programs"
+    SENSORS = "sensors"
+
+    def __init__(self, storage, debounce_secs=2.0, max_delay_secs=10.0, clock=time.monotonic):
+        """
+        Creates write behind storage instance.
+        :param storage: Storage the data is written to and initially loaded from, eg. Storage or SqliteStorage
+        :param debounce_secs: Time without changes after which pending data is written
+        :type debounce_secs: float
+        :param max_delay_secs: Maximum time pending data waits to be written
+        :type max_delay_secs: float
+        :param clock: Function returning current time in seconds
+        """
+        super().__init__()
+        self.__storage = storage
+        self.__debounce_secs = debounce_secs
+        self.__max_delay_secs = max_delay_secs
+        self.__clock = clock
+        self.__condition = threading.Condition()
+        self.__flush_lock = threading.Lock()
+        self.__thread = None
+        self.__data = {}
+        self.__loaders = {WriteBehindStorage.PROGRAMS: storage.load_programs,
+                          WriteBehindStorage.SENSORS: storage.load_sensors}
+        self.__writers = {WriteBehindStorage.PROGRAMS: storage.store_programs,
+                          WriteBehindStorage.SENSORS: storage.store_sensors}
+        # upsert and delete functions of the storage by kind, kinds the storage has no row level updates for are missing
+        self.__row_writers = {}
+        if hasattr(storage, "upsert_program") and hasattr(storage, "delete_program"):
+            self.__row_writers[WriteBehindStorage.PROGRAMS] = (storage.upsert_program, storage.delete_program)
+        if hasattr(storage, "upsert_sensor"):
+            self.__row_writers[WriteBehindStorage.SENSORS] = (storage.upsert_sensor, None)
+        # pending data by kind, versions tell whether the data changed while being written
+        self.__dirty = {}
+        # pending changes of single rows by kind, None for deleted rows, by id in the order of the first change
+        self.__dirty_rows = {}
+        self.__versions = {WriteBehindStorage.PROGRAMS: 0, WriteBehindStorage.SENSORS: 0}
+        self.__first_change_time = None
+        self.__last_change_time = None
+        self.__store_count = 0
+        self.__write_count = 0
+        self.__write_error_count = 0
+
+    def start(self):
+        """
+        Starts the thread writing pending data and registers writing of pending data at exit
+        """
+        if self.__thread is not None:
+            raise RuntimeError("Write behind storage already running")
+        atexit.register(self.flush)
+        self.__thread = threading.Thread(target=self.__flush_loop, name="write-behind-storage", daemon=True)
+        self.__thread.start()
+
+    def store_programs(self, programs):
+        self.__store(WriteBehindStorage.PROGRAMS, list(programs))
+
+    def load_programs(self):
+        return list(self.__load(WriteBehindStorage.PROGRAMS))
+
+    def store_sensors(self, sensors):
+        self.__store(WriteBehindStorage.SENSORS, list(sensors))
+
+    def load_sensors(self):
+        return list(self.__load(WriteBehindStorage.SENSORS))
+
+    def upsert_program(self, program):
+        """
+        Replaces the program with the same id, a new program is added after the existing ones
+        """
+        self.__store_row(WriteBehindStorage.PROGRAMS, program.program_id, program,
+                         lambda stored_program: stored_program.program_id)
+
+    def delete_program(self, program_id):
+        self.__store_row(WriteBehindStorage.PROGRAMS, program_id, None,
+                         lambda stored_program: stored_program.program_id)
+
+    def upsert_sensor(self, sensor):
+        """
+        Replaces the sensor with the same id, a new sensor is added after the existing ones
+        """
+        self.__store_row(WriteBehindStorage.SENSORS, sensor.id, sensor, lambda stored_sensor: stored_sensor.id)
+
+    def flush(self):
+        """
+        Writes all pending data now
+        """
+        self.__flush(force=True)
+
+    def flush_if_due(self):
+        """
+        Writes pending data if the debounce time or maximum delay has passed
+        :return: Number of seconds until pending data is due, None if there is no pending data
+        :rtype: float
+        """
+        return self.__flush(force=False)
+
+    def get_metrics(self):
+        """
+        Returns counters of stores and writes to the underlying storage
+        :rtype: dict
+        """
+        self.__condition.acquire()
+        try:
+            metrics = {"store_count": self.__store_count,
+                       "write_count": self.__write_count,
+                       "write_error_count": self.__write_error_count,
+                       "pending": sorted(set(self.__dirty) | set(self.__dirty_rows))}
+        finally:
+            self.__condition.release()
+        bytes_written = getattr(self.__storage, "bytes_written", None)
+        if bytes_written is not None:
+            metrics["bytes_written_count"] = bytes_written
+        return metrics
+
+    def __store(self, kind, data):
+        self.__condition.acquire()
+        try:
+            self.__data[kind] = data
+            self.__dirty[kind] = data
+            # written with the data
+            self.__dirty_rows.pop(kind, None)
+            self.__mark_changed(kind)
+        finally:
+            self.__condition.release()
+
+    def __store_row(self, kind, row_id, row, get_id):
+        self.__condition.acquire()
+        try:
+            data = [stored_row for stored_row in self.__load(kind) if get_id(stored_row) != row_id]
+            if row is not None:
+                rows = self.__data[kind]
+                index = next((index for index, stored_row in enumerate(rows) if get_id(stored_row) == row_id),
+                             len(rows))
+                data.insert(index, row)
+            self.__data[kind] = data
+            if kind in self.__dirty or kind not in self.__row_writers:
+                self.__dirty[kind] = data
+            else:
+                self.__dirty_rows.setdefault(kind, {})[row_id] = row
+            self.__mark_changed(kind)
+        finally:
+            self.__condition.release()
+
+    def __mark_changed(self, kind):
+        now = self.__clock()
+        self.__versions[kind] += 1
+        self.__store_count += 1
+        if self.__first_change_time is None:
+            self.__first_change_time = now
+        self.__last_change_time = now
+        self.__condition.notify()
+
+    def __load(self, kind):
+        self.__condition.acquire()
+        try:
+            if kind not in self.__data:
+                self.__data[kind] = self.__loaders[kind]()
+            return self.__data[kind]
+        finally:
+            self.__condition.release()
+
+    def __get_due_in_secs(self, now):
+        if not self.__dirty and not self.__dirty_rows:
+            return None
+        due_time = min(self.__last_change_time + self.__debounce_secs,
+                       self.__first_change_time + self.__max_delay_secs)
+        return max(0.0, due_time - now)
+
+    def __flush(self, force):
+        # writes are serialized, so data can't be overwritten by an older version
+        self.__flush_lock.acquire()
+        try:
+            self.__condition.acquire()
+            try:
+                due_in_secs = self.__get_due_in_secs(self.__clock())
+                if due_in_secs is None or due_in_secs > 0 and not force:
+                    return due_in_secs
+                pending = [(kind, data, None, self.__versions[kind]) for kind, data in self.__dirty.items()]
+                pending.extend((kind, None, rows, self.__versions[kind]) for kind, rows in self.__dirty_rows.items())
+                self.__dirty = {}
+                self.__dirty_rows = {}
+                self.__first_change_time = None
+            finally:
+                self.__condition.release()
+
+            write_count = 0
+            write_error_count = 0
+            for kind, data, rows, version in pending:
+                try:
+                    if rows is None:
+                        self.__writers[kind](data)
+                    else:
+                        self.__write_rows(kind, rows)
+                    write_count += 1
+                except Exception as e:
+                    Logger.error("Write behind storage error {}".format(str(e)))
+                    write_error_count += 1
+                    self.__restore_dirty(kind, rows, version)
+
+            self.__condition.acquire()
+            try:
+                # read by get_metrics under the condition
+                self.__write_count += write_count
+                self.__write_error_count += write_error_count
+                return self.__get_due_in_secs(self.__clock())
+            finally:
+                self.__condition.release()
+        finally:
+            self.__flush_lock.release()
+
+    def __write_rows(self, kind, rows):
+        upsert, delete = self.__row_writers[kind]
+        for row_id, row in rows.items():
+            if row is None:
+                delete(row_id)
+            else:
+                upsert(row)
+
+    def __restore_dirty(self, kind, rows, version):
+        # retried later. Changed rows are retried alone unless the data changed since, the current data is written
+        # then, it contains the newer changes as well
+        self.__condition.acquire()
+        try:
+            now = self.__clock()
+            if rows is not None and self.__versions[kind] == version:
+                self.__dirty_rows[kind] = rows
+            else:
+                self.__dirty[kind] = self.__data[kind]
+                self.__dirty_rows.pop(kind, None)
+            if self.__first_change_time is None:
+                self.__first_change_time = now
+            self.__last_change_time = now
+        finally:
+            self.__condition.release()
+
+    def __flush_loop(self):
+        while True:
+            self.__condition.acquire()
+            try:
+                due_in_secs = self.__get_due_in_secs(self.__clock())
+                if due_in_secs is None or due_in_secs > 0:
+                    self.__condition.wait(due_in_secs)
+            finally:
+                self.__condition.release()
+            self.flush_if_due()
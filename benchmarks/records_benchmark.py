@@ -0,0 +1,107 @@
+"""
+Compares memory usage and construction time of the slotted records (Program, ProgramState, LogEntry, ThermSensor)
+with their former layout, where every instance kept its fields in a per-instance __dict__. The Dict* classes below
+replicate the former constructors, including computation of the program digest.
+
+Run from the root directory of the project:
+
+    python3 -m benchmarks.records_benchmark
+"""
+import hashlib
+import json
+import timeit
+import tracemalloc
+from datetime import datetime
+
+from app.logger import LogEntry
+from app.program import Program, ProgramState
+from app.therm_sensor import ThermSensor
+
+INSTANCES = 10000
+REPEATS = 5
+
+
+class DictProgram(object):
+    def __init__(self, program_id, program_name, sensor_id, heating_relay_index, cooling_relay_index,
+                 min_temperature, max_temperature, active):
+        super().__init__()
+        self.__program_id = program_id
+        self.__program_name = program_name
+        self.__sensor_id = sensor_id
+        self.__heating_relay_index = heating_relay_index
+        self.__cooling_relay_index = cooling_relay_index
+        self.__min_temperature = min_temperature
+        self.__max_temperature = max_temperature
+        self.__active = active
+        canonical_json = json.dumps([program_id, program_name, sensor_id, cooling_relay_index, heating_relay_index,
+                                     min_temperature, max_temperature, active],
+                                    separators=(",", ":"), ensure_ascii=False)
+        self.__program_crc = hashlib.sha1(canonical_json.encode("utf-8")).hexdigest()
+
+
+class DictProgramState(object):
+    def __init__(self, program_id, current_temperature, program_crc, heating_activated=False,
+                 cooling_activated=False, error=None, timestamp=None):
+        super().__init__()
+        self.__program_id = program_id
+        self.__current_temperature = current_temperature
+        self.__program_crc = program_crc
+        self.__heating_activated = True if heating_activated else False
+        self.__cooling_activated = True if cooling_activated else False
+        self.__error = error
+        self.__timestamp = timestamp
+
+
+class DictLogEntry(object):
+    def __init__(self, date, level, message):
+        self.date = date
+        self.level = level
+        self.message = message
+
+
+class DictThermSensor(object):
+    def __init__(self, sensor_id, name=""):
+        super().__init__()
+        self.__sensor_id = sensor_id
+        self.__name = name
+
+
+NOW = datetime.now()
+
+FACTORIES = [
+    ("Program", lambda: Program("id", "name", "sensor", 1, 2, 18.0, 19.0, True),
+     lambda: DictProgram("id", "name", "sensor", 1, 2, 18.0, 19.0, True)),
+    ("ProgramState", lambda: ProgramState("id", 18.5, "crc", True, False, None, 1000.0),
+     lambda: DictProgramState("id", 18.5, "crc", True, False, None, 1000.0)),
+    ("LogEntry", lambda: LogEntry(NOW, "info", "message"),
+     lambda: DictLogEntry(NOW, "info", "message")),
+    ("ThermSensor", lambda: ThermSensor("id", "name"),
+     lambda: DictThermSensor("id", "name")),
+]
+
+
+def measure_memory(factory):
+    tracemalloc.start()
+    instances = [factory() for _ in range(INSTANCES)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del instances
+    return size / INSTANCES
+
+
+def measure_construction(factory):
+    return min(timeit.repeat(factory, number=INSTANCES, repeat=REPEATS)) / INSTANCES * 1e6
+
+
+def main():
+    print("{:<14}{:>16}{:>16}{:>18}{:>18}".format(
+        "record", "slots [B/obj]", "dict [B/obj]", "slots [us/obj]", "dict [us/obj]"))
+    for name, slotted_factory, dict_factory in FACTORIES:
+        print("{:<14}{:>16.0f}{:>16.0f}{:>18.2f}{:>18.2f}".format(
+            name,
+            measure_memory(slotted_factory), measure_memory(dict_factory),
+            measure_construction(slotted_factory), measure_construction(dict_factory)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,11 @@
 from unittest.mock import Mock
 import uuid
+import time
 
-from app.controller import Controller, ProgramError
+from app.controller import Controller, ControllerSnapshot, ProgramError, ProgramOperationsError
 from app.hardware.therm_sensor_api import SensorNotReadyError, NoSensorFoundError, ThermSensorApi
 from app.hardware.relay_api import RelayApi
-from app.program import Program
+from app.program import Program, ProgramState, ProgramRollup, ProgramOperation, ProgramOperationResult
 from app.storage import Storage
 from therm_sensor import ThermSensor
 
@@ -83,8 +84,13 @@ class ControllerMock(Mock):
         self.get_programs = Mock(side_effect=self.__mocked_get_programs)
         self.get_program_state = Mock(side_effect=self.__mocked_get_program_state)
         self.get_program_states = Mock(side_effect=self.__mocked_get_program_states)
+        self.get_program_history = Mock(side_effect=self.__mocked_get_program_history)
+        self.apply_program_operations = Mock(side_effect=self.__mocked_apply_program_operations)
+        self.get_versions = Mock(side_effect=lambda: dict(self.versions))
+        self.get_snapshot = Mock(side_effect=self.__mocked_get_snapshot)
 
         self.programs = []
+        self.versions = {Controller.VERSION_PROGRAMS: 0, Controller.VERSION_SENSORS: 0, Controller.VERSION_STATES: 0}
         self.__next_program_id = None
         self.__temperatures = {}
 
@@ -102,11 +108,17 @@ class ControllerMock(Mock):
     def raise_error_on_program_delete(self):
         self.delete_program = Mock(side_effect=ProgramError(message=ControllerMock.DEFAULT_ERROR_MESSAGE))
 
+    def raise_error_on_program_operations(self):
+        self.apply_program_operations = Mock(side_effect=ProgramOperationsError(
+            [], message=ControllerMock.DEFAULT_ERROR_MESSAGE))
+
     def set_sensor_temperature(self, sensor_id, temperature):
         self.therm_sensor_api.temperatures[sensor_id] = temperature
+        self.versions[Controller.VERSION_STATES] += 1
 
     def set_relay_state(self, relay_index, relay_state):
         self.relay_api.relays[relay_index] = relay_state
+        self.versions[Controller.VERSION_STATES] += 1
 
     def __mocked_get_sensors(self):
         return [ThermSensor(sensor_id, "") for sensor_id in self.therm_sensor_api.get_sensor_id_list()]
@@ -122,6 +134,7 @@ class ControllerMock(Mock):
             max_temperature=program.max_temperature,
             active=program.active)
         self.programs.append(new_program)
+        self.versions[Controller.VERSION_PROGRAMS] += 1
         self.__generate_next_program_id()
         return new_program
 
@@ -136,6 +149,7 @@ class ControllerMock(Mock):
                                error_code=ProgramError.ERROR_CODE_INVALID_ID)
         existing_program = self.programs[program_index]
         self.programs[program_index] = existing_program.modify_with(program)
+        self.versions[Controller.VERSION_PROGRAMS] += 1
         return self.programs[program_index]
 
     def __mocked_delete_program(self, program_id):
@@ -149,11 +163,29 @@ class ControllerMock(Mock):
                                ProgramError.ERROR_CODE_INVALID_ID)
         deleted_program = self.programs[program_index]
         del self.programs[program_index]
+        self.versions[Controller.VERSION_PROGRAMS] += 1
         return deleted_program
 
+    def __mocked_apply_program_operations(self, operations):
+        results = []
+        for operation in operations:
+            if operation.kind == ProgramOperation.CREATE:
+                results.append(ProgramOperationResult(operation, self.__mocked_create_program(operation.program)))
+            elif operation.kind == ProgramOperation.MODIFY:
+                results.append(ProgramOperationResult(
+                    operation, self.__mocked_modify_program(operation.program_id, operation.program)))
+            else:
+                results.append(ProgramOperationResult(operation, self.__mocked_delete_program(operation.program_id)))
+        return results
+
     def __mocked_get_programs(self):
         return self.programs
 
+    def __mocked_get_snapshot(self):
+        return ControllerSnapshot(self.versions, self.__mocked_get_sensors(), self.programs,
+                                  self.__mocked_get_program_states(),
+                                  [self.relay_api.get_relay_state(index) for index in sorted(self.relay_api.relays)])
+
     def __generate_next_program_id(self):
         self.__next_program_id = str(uuid.uuid4())
         self.next_program_id = self.__next_program_id
@@ -161,11 +193,35 @@ class ControllerMock(Mock):
 
     def __mocked_get_program_state(self, program_id):
         program = self.__get_program_by_id(program_id)
-        return program.create_program_state(self.therm_sensor_api, self.relay_api)
+        return self.__create_program_state(program)
 
     def __mocked_get_program_states(self):
-        return [self.programs[index].create_program_state(self.therm_sensor_api, self.relay_api)
-                for index in range(len(self.programs))]
+        return [self.__create_program_state(self.programs[index]) for index in range(len(self.programs))]
+
+    def __mocked_get_program_history(self, program_id, start=None, end=None, resolution_secs=None):
+        program = self.__get_program_by_id(program_id)
+        if program is None:
+            raise ProgramError(None, "Program with the given ID not found:{}".format(program_id),
+                               ProgramError.ERROR_CODE_INVALID_ID)
+        if resolution_secs is not None:
+            temperature = self.therm_sensor_api.get_sensor_temperature(program.sensor_id)
+            return [ProgramRollup(program.program_id, time.time(), resolution_secs, temperature, temperature,
+                                  temperature, 1, 0.0, 0.0)]
+        return [self.__create_program_state(program)]
+
+    def __create_program_state(self, program):
+        # Simulates the state that the controller's loop would publish for the current mocked hardware state
+        heating_activated = False
+        if program.heating_relay_index != Program.UNDEFINED_HEATING_RELAY_INDEX:
+            heating_activated = self.relay_api.get_relay_state(program.heating_relay_index)
+        cooling_activated = False
+        if program.cooling_relay_index != Program.UNDEFINED_COOLING_RELAY_INDEX:
+            cooling_activated = self.relay_api.get_relay_state(program.cooling_relay_index)
+        return ProgramState(program.program_id,
+                            self.therm_sensor_api.get_sensor_temperature(program.sensor_id),
+                            program.program_crc,
+                            heating_activated, cooling_activated,
+                            timestamp=time.time())
 
     def __get_program_by_id(self, program_id):
         for index in range(len(self.programs)):
@@ -0,0 +1,53 @@
+import json
+import unittest
+
+from werkzeug.datastructures import MIMEAccept
+
+from app import codec
+from app.codec import Codec, JSON_CODEC, CONTENT_TYPE_JSON
+
+CONTENT_TYPE_TEST = "application/x-test"
+
+
+class CodecTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.test_codec = Codec("test", CONTENT_TYPE_TEST, lambda data: repr(data).encode("utf-8"))
+        codec.register_codec(self.test_codec)
+
+    def tearDown(self):
+        codec.unregister_codec(CONTENT_TYPE_TEST)
+
+    def test_should_encode_json_as_stdlib(self):
+        data = [{"id": "1", "temperature": 15.5, "active": True, "name": "žatec"}]
+
+        self.assertEqual(json.dumps(data).encode("utf-8"), JSON_CODEC.encode(data))
+
+    def test_should_negotiate_codec_accepted_by_client(self):
+        self.assertIs(self.test_codec, codec.negotiate_codec(MIMEAccept([(CONTENT_TYPE_TEST, 1)])))
+        self.assertIs(self.test_codec, codec.negotiate_codec(
+            MIMEAccept([(CONTENT_TYPE_JSON, 0.5), (CONTENT_TYPE_TEST, 1)])))
+
+    def test_should_negotiate_json_by_default(self):
+        self.assertIs(JSON_CODEC, codec.negotiate_codec(MIMEAccept()))
+        self.assertIs(JSON_CODEC, codec.negotiate_codec(MIMEAccept([("*/*", 1)])))
+        self.assertIs(JSON_CODEC, codec.negotiate_codec(MIMEAccept([("application/unknown", 1)])))
+
+    def test_should_replace_codec_of_same_content_type(self):
+        replacement = Codec("replacement", CONTENT_TYPE_TEST, lambda data: b"")
+        codec.register_codec(replacement)
+
+        codecs = codec.get_codecs()
+
+        self.assertIn(replacement, codecs)
+        self.assertNotIn(self.test_codec, codecs)
+        self.assertIs(JSON_CODEC, codecs[0])
+
+    def test_should_keep_json_codec(self):
+        codec.unregister_codec(CONTENT_TYPE_JSON)
+
+        self.assertIs(JSON_CODEC, codec.get_codecs()[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,21 @@
+import os
+import shutil
+import tempfile
 import unittest
 from unittest.mock import Mock, call
 
-from app.controller import Controller, ProgramError
+from app.controller import Controller, ProgramError, ProgramOperationsError
 from app.hardware.therm_sensor_api import ThermSensorApi, NoSensorFoundError, SensorNotReadyError
-from app.program import Program
+from app.program import Program, ProgramOperation, ProgramState
+from app.shared_relay import SharedRelay
+from app.power_scheduler import PowerScheduler
+from app.history import HistoryStore
+from app.sqlite_storage import SqliteStorage
+from app.write_behind_storage import WriteBehindStorage
+from app.therm_sensor import ThermSensor
+from app.state_journal import JournalSnapshot, StateJournal
+from app.metrics import MetricsWriter
+from app.utils import EventBus
 from tests.mocks import StorageMock, ThermSensorApiMock, RelayApiMock
 
 PROGRAM_NAME = "ProgramName"
@@ -252,6 +264,75 @@ class ControllerTestCase(unittest.TestCase):
         self.assertEqual(programs[1], program2)
         self.assertEqual(programs[2], program3)
 
+    def test_should_apply_program_operations_with_single_store(self):
+        program1 = self.add_test_program("1001", 2, 4, 16.5, 17.1)
+        program2 = self.add_test_program("1002", 1, 5, 16.1, 17.4)
+        self.storage_mock.store_programs.reset_mock()
+        # program3 takes relays of program2 that is going to be deleted in the same batch
+        operations = [
+            ProgramOperation(ProgramOperation.CREATE, program=create_test_program("1003", 1, 5, 16.0, 17.2)),
+            ProgramOperation(ProgramOperation.MODIFY, program1.program_id,
+                             create_test_program("1004", 2, 4, 15.0, 16.0)),
+            ProgramOperation(ProgramOperation.DELETE, program2.program_id),
+        ]
+
+        results = self.controller.apply_program_operations(operations)
+
+        programs = self.controller.get_programs()
+        self.storage_mock.store_programs.assert_called_once_with(programs)
+        self.assertEqual(2, len(programs))
+        self.assertEqual(program1.program_id, programs[0].program_id)
+        self.assertEqual("1004", programs[0].sensor_id)
+        self.assertEqual("1003", programs[1].sensor_id)
+        self.assertEqual([programs[1], programs[0], program2], [result.program for result in results])
+        self.assertTrue(all(result.error is None for result in results))
+
+    def test_should_reject_all_program_operations_if_any_is_invalid(self):
+        program1 = self.add_test_program("1001", 2, 4, 16.5, 17.1)
+        self.storage_mock.store_programs.reset_mock()
+        operations = [
+            ProgramOperation(ProgramOperation.CREATE, program=create_test_program("1002", 1, 5, 16.0, 17.2)),
+            ProgramOperation(ProgramOperation.CREATE, program=create_test_program("1003", 1, 6, 16.0, 17.2)),
+            ProgramOperation(ProgramOperation.DELETE, "invalid_id"),
+        ]
+
+        with self.assertRaises(ProgramOperationsError) as context:
+            self.controller.apply_program_operations(operations)
+
+        results = context.exception.get_results()
+        self.assertEqual(3, len(results))
+        # both programs use heating relay 1, each of them is rejected when validated against the other one
+        self.assertEqual(ProgramError.ERROR_CODE_HEATING_RELAY_ALREADY_IN_USE, results[0].error.get_error_code())
+        self.assertEqual(ProgramError.ERROR_CODE_HEATING_RELAY_ALREADY_IN_USE, results[1].error.get_error_code())
+        self.assertEqual(ProgramError.ERROR_CODE_INVALID_ID, results[2].error.get_error_code())
+        self.storage_mock.store_programs.assert_not_called()
+        self.assertEqual([program1], self.controller.get_programs())
+
+    def test_should_reject_invalid_program_operation(self):
+        operations = [
+            ProgramOperation(ProgramOperation.CREATE, program=create_test_program("1002", 1, 5, 16.0, 17.2)),
+            ProgramOperation("invalid_operation", "invalid_id"),
+        ]
+
+        with self.assertRaises(ProgramOperationsError) as context:
+            self.controller.apply_program_operations(operations)
+
+        results = context.exception.get_results()
+        self.assertIsNone(results[0].error)
+        self.assertEqual(ProgramError.ERROR_CODE_INVALID_OPERATION, results[1].error.get_error_code())
+        self.assertEqual([], self.controller.get_programs())
+
+    def test_should_leave_programs_intact_on_error_while_storing_program_operations(self):
+        program1 = self.add_test_program("1001", 2, 4, 16.5, 17.1)
+        self.storage_mock.store_programs = Mock(side_effect=IOError())
+        operations = [ProgramOperation(ProgramOperation.DELETE, program1.program_id)]
+
+        with self.assertRaises(ProgramOperationsError) as context:
+            self.controller.apply_program_operations(operations)
+
+        self.assertEqual(ProgramError.ERROR_CODE_CANNOT_STORE_PROGRAMS, context.exception.get_error_code())
+        self.assertEqual([program1], self.controller.get_programs())
+
     def test_should_load_programs_and_start_monitoring_when_run(self):
         program1 = create_test_program("1001", 2, 4, 2.0, 3.0, program_id="id1")  # cooling should get activated
         program2 = create_test_program("1002", 1, 5, 25.0, 28.0, program_id="id2")  # heating should get activated
@@ -367,6 +448,234 @@ class ControllerTestCase(unittest.TestCase):
         calls = [call(5, 0), call(1, 1), call(2, 1)]
         self.assertEqual(calls, self.relay_api_mock.set_relay_state.mock_calls)
 
+    def test_should_activate_shared_relay_when_dependent_program_cools(self):
+        self.create_controller_with_shared_relay(7, [1, 2])
+        self.therm_sensor_api_mock.mock_sensors_temperature({"1001": 11.0, "1002": 13.0})
+        self.add_test_program("1001", -1, 1, 10.0, 12.0)  # no action needed
+        self.add_test_program("1002", -1, 2, 10.0, 12.0)  # cooling should get activated
+
+        self.run_controller_iterations(1)
+
+        calls = [call(2, 1), call(7, 1)]
+        self.assertEqual(calls, self.relay_api_mock.set_relay_state.mock_calls)
+
+    def test_should_not_deactivate_shared_relay_as_unassigned(self):
+        self.create_controller_with_shared_relay(7, [1])
+        self.relay_api_mock.mock_relay_state(7, 1)
+        self.therm_sensor_api_mock.mock_sensors_temperature({"1001": 13.0})
+        self.add_test_program("1001", -1, 1, 10.0, 12.0)  # cooling should get activated
+
+        self.run_controller_iterations(1)
+
+        self.assertEqual([call(1, 1)], self.relay_api_mock.set_relay_state.mock_calls)
+
+    def test_should_reject_program_that_uses_shared_relay(self):
+        self.create_controller_with_shared_relay(7, [1])
+        with self.assertRaises(ProgramError):
+            self.controller.create_program(create_test_program("1001", -1, 7, 10.0, 12.0))
+        with self.assertRaises(ProgramError):
+            self.controller.create_program(create_test_program("1001", 7, -1, 10.0, 12.0))
+
+    def test_should_reject_invalid_shared_relays(self):
+        with self.assertRaises(ValueError):
+            self.create_controller_with_shared_relay(Controller.RELAYS_COUNT, [1])
+        with self.assertRaises(ValueError):
+            self.create_controller_with_shared_relay(7, [7])
+
+    def test_should_store_single_program_and_sensor_if_storage_supports_it(self):
+        for write_behind in (False, True):
+            with self.subTest(write_behind=write_behind):
+                storage_dir = tempfile.mkdtemp()
+                self.addCleanup(shutil.rmtree, storage_dir, ignore_errors=True)
+                sqlite_storage = SqliteStorage(storage_root_dir=storage_dir)
+                self.addCleanup(sqlite_storage.close)
+                storage_spy = Mock(wraps=sqlite_storage)
+                storage = WriteBehindStorage(storage_spy) if write_behind else storage_spy
+                self.controller = Controller(
+                    therm_sensor_api=self.therm_sensor_api_mock,
+                    relay_api=self.relay_api_mock,
+                    storage=storage)
+                program1 = self.add_test_program("1001", 1, 2, 10.0, 12.0)
+                program2 = self.add_test_program("1002", 3, 4, 10.0, 12.0)
+
+                modified_program1 = self.controller.modify_program(program1.program_id,
+                                                                   create_test_program("1001", 1, 2, 10.0, 14.0))
+                self.controller.delete_program(program2.program_id)
+                self.controller.set_therm_sensor_name("1001", "sensor1")
+                if write_behind:
+                    storage.flush()
+
+                storage_spy.store_programs.assert_not_called()
+                storage_spy.store_sensors.assert_not_called()
+                self.assertEqual([modified_program1], sqlite_storage.load_programs())
+                self.assertEqual([ThermSensor("1001", "sensor1")], sqlite_storage.load_sensors())
+
+    def test_should_activate_heating_within_power_budget_furthest_from_setpoint_first(self):
+        self.controller = Controller(
+            therm_sensor_api=self.therm_sensor_api_mock,
+            relay_api=self.relay_api_mock,
+            storage=self.storage_mock,
+            power_scheduler=PowerScheduler({1: 500.0, 2: 500.0}, 600.0, self.relay_api_mock))
+        self.therm_sensor_api_mock.mock_sensors_temperature({"1001": 9.0, "1002": 5.0})
+        self.add_test_program("1001", 1, -1, 10.0, 12.0)  # heating should get activated
+        self.add_test_program("1002", 2, -1, 10.0, 12.0)  # heating should get activated, further from setpoint
+
+        self.run_controller_iterations(3)
+
+        self.assertEqual([call(2, 1)], self.relay_api_mock.set_relay_state.mock_calls)
+        metrics = self.controller.get_power_metrics()
+        self.assertEqual([1], metrics["queued_relays"])
+        self.assertEqual(500.0, metrics["used_watts"])
+
+    def test_should_cancel_power_requests_of_relays_without_program_only(self):
+        self.controller = Controller(
+            therm_sensor_api=self.therm_sensor_api_mock,
+            relay_api=self.relay_api_mock,
+            storage=self.storage_mock,
+            power_scheduler=PowerScheduler({1: 500.0, 2: 500.0, 3: 500.0}, 600.0, self.relay_api_mock))
+        self.therm_sensor_api_mock.mock_sensors_temperature({"1001": 9.0, "1002": 5.0, "1003": 8.0})
+        self.add_test_program("1001", 1, -1, 10.0, 12.0)
+        self.add_test_program("1002", 2, -1, 10.0, 12.0)
+        program = self.add_test_program("1003", 3, -1, 10.0, 12.0)
+        self.run_controller_iterations(1)
+        self.assertEqual([1, 3], self.controller.get_power_metrics()["queued_relays"])
+
+        self.controller.delete_program(program.program_id)
+
+        self.assertEqual([1], self.controller.get_power_metrics()["queued_relays"])
+
+    def test_should_read_relays_once_per_tick_after_checks(self):
+        history = Mock(spec=HistoryStore)
+        journal = Mock(spec=StateJournal)
+        journal.restore.return_value = None
+        journal.is_due.return_value = True
+        self.controller = Controller(
+            therm_sensor_api=self.therm_sensor_api_mock,
+            relay_api=self.relay_api_mock,
+            storage=self.storage_mock,
+            history=history,
+            journal=journal)
+
+        self.run_controller_iterations(1)
+
+        # once to deactivate relays without program (none is assigned), once to publish, record history and journal
+        self.assertEqual(2 * Controller.RELAYS_COUNT, self.relay_api_mock.get_relay_state.call_count)
+        journal.write.assert_called_once_with([0] * Controller.RELAYS_COUNT, {})
+
+    def test_should_record_program_history_when_run(self):
+        history_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, history_dir, ignore_errors=True)
+        history = HistoryStore(history_dir)
+        history.start()
+        # cleanups run in reverse order, the writer thread is stopped before its directory is removed
+        self.addCleanup(history.stop)
+        self.controller = Controller(
+            therm_sensor_api=self.therm_sensor_api_mock,
+            relay_api=self.relay_api_mock,
+            storage=self.storage_mock,
+            history=history)
+        self.therm_sensor_api_mock.mock_sensors_temperature({"1001": 13.0, "1002": 11.0})
+        program1 = self.add_test_program("1001", -1, 1, 10.0, 12.0)  # cooling should get activated
+        program2 = self.add_test_program("1002", 2, -1, 10.0, 12.0)  # no action needed
+
+        self.run_controller_iterations(2)
+        history.flush()
+
+        states = self.controller.get_program_history(program1.program_id)
+        self.assertEqual(2, len(states))
+        self.assertEqual(13.0, states[0].current_temperature)
+        self.assertTrue(states[0].cooling_activated)
+        self.assertFalse(states[0].heating_activated)
+        self.assertLessEqual(states[0].timestamp, states[1].timestamp)
+        states = self.controller.get_program_history(program2.program_id, start=states[1].timestamp)
+        self.assertEqual(1, len(states))
+        self.assertEqual(11.0, states[0].current_temperature)
+        self.assertFalse(states[0].heating_activated)
+
+    def test_should_return_empty_history_if_history_is_not_recorded(self):
+        program = self.add_test_program("1001", -1, 1, 10.0, 12.0)
+        self.run_controller_iterations(1)
+
+        self.assertEqual([], self.controller.get_program_history(program.program_id))
+        with self.assertRaises(ProgramError):
+            self.controller.get_program_history("invalid_program_id")
+
+    def test_should_restore_program_states_and_relays_from_journal_before_first_check(self):
+        program = create_test_program("1001", -1, 1, 10.0, 12.0, program_id="id1")
+        modified_program = create_test_program("1002", 2, -1, 10.0, 12.0, program_id="id2")
+        self.storage_mock = StorageMock(programs=[program, modified_program])
+        restored_state = ProgramState("id1", 11.5, program.program_crc, False, True, None, 1000.0)
+        journal_mock = self.create_journal_mock(JournalSnapshot(1000.0, [0, 1, 1, 1, 0, 0, 0, 0], {
+            "id1": restored_state,
+            "id2": ProgramState("id2", 9.0, "old crc", True, False, None, 1000.0)}))
+        self.controller = Controller(
+            therm_sensor_api=self.therm_sensor_api_mock,
+            relay_api=self.relay_api_mock,
+            storage=self.storage_mock,
+            journal=journal_mock)
+
+        self.run_controller_iterations(0)
+
+        self.assertEqual(restored_state, self.controller.get_program_state("id1"))
+        self.assertIsNone(self.controller.get_program_state("id2").timestamp)
+        # only the relay of the restored program is set, unassigned relays are handled by the control loop
+        self.assertEqual([call(1, 1)], self.relay_api_mock.set_relay_state.mock_calls)
+        self.therm_sensor_api_mock.get_sensor_temperature.assert_not_called()
+
+    def test_should_not_toggle_relays_restored_from_journal(self):
+        self.therm_sensor_api_mock.mock_sensors_temperature({"1001": 11.5})
+        program = create_test_program("1001", -1, 1, 10.0, 12.0, program_id="id1")
+        self.storage_mock = StorageMock(programs=[program])
+        self.relay_api_mock.mock_relay_state(1, 1)
+        journal_mock = self.create_journal_mock(JournalSnapshot(1000.0, [0, 1, 0, 0, 0, 0, 0, 0], {
+            "id1": ProgramState("id1", 11.5, program.program_crc, False, True, None, 1000.0)}))
+        self.controller = Controller(
+            therm_sensor_api=self.therm_sensor_api_mock,
+            relay_api=self.relay_api_mock,
+            storage=self.storage_mock,
+            journal=journal_mock)
+
+        # cooling continues until the middle temperature is reached
+        self.run_controller_iterations(2)
+
+        self.relay_api_mock.set_relay_state.assert_not_called()
+        journal_mock.write.assert_called_once()
+        relay_states, states = journal_mock.write.call_args[0]
+        self.assertEqual([0, 1, 0, 0, 0, 0, 0, 0], relay_states)
+        self.assertTrue(states["id1"].cooling_activated)
+
+    def test_should_leave_nothing_to_restore_after_clean_up(self):
+        journal_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, journal_dir, ignore_errors=True)
+        journal_file = os.path.join(journal_dir, "journal.json")
+        self.therm_sensor_api_mock.mock_sensors_temperature({"1001": 13.0})
+        self.controller = Controller(
+            therm_sensor_api=self.therm_sensor_api_mock,
+            relay_api=self.relay_api_mock,
+            storage=self.storage_mock,
+            journal=StateJournal(journal_file))
+        self.add_test_program("1001", -1, 1, 10.0, 12.0)
+        self.run_controller_iterations(1)
+        self.assertEqual(1, StateJournal(journal_file).restore().relay_states[1])
+
+        self.controller.clean_up()
+
+        self.assertIsNone(StateJournal(journal_file).restore())
+        self.assertEqual(0, self.relay_api_mock.get_relay_state(1))
+
+    def create_journal_mock(self, snapshot):
+        journal_mock = Mock()
+        journal_mock.restore = Mock(return_value=snapshot)
+        journal_mock.is_due = Mock(side_effect=lambda: not journal_mock.write.called)
+        return journal_mock
+
+    def create_controller_with_shared_relay(self, relay_index, dependent_relay_indexes):
+        self.controller = Controller(
+            therm_sensor_api=self.therm_sensor_api_mock,
+            relay_api=self.relay_api_mock,
+            storage=self.storage_mock,
+            shared_relays=[SharedRelay(relay_index, dependent_relay_indexes)])
+
     def test_should_reject_sensor_name_change_for_non_existing_sensor(self):
         with self.assertRaises(NoSensorFoundError):
             self.controller.set_therm_sensor_name("invalid_sensor_id", "sensor_name")
@@ -383,24 +692,155 @@ class ControllerTestCase(unittest.TestCase):
     def test_should_return_state_for_given_program(self):
         self.therm_sensor_api_mock.mock_sensors_temperature({"1001": 13.0})
         program = self.add_test_program("1001", -1, 1, 10.0, 12.0)
+        self.run_controller_iterations(1)
 
         state = self.controller.get_program_state(program.program_id)
 
         self.assertEqual(program.program_id, state.program_id)
-        self.assertIsNotNone(state.program_crc)
-        self.assertIsNotNone(state.cooling_activated)
-        self.assertIsNotNone(state.heating_activated)
-        self.assertIsNotNone(state.current_temperature)
+        self.assertEqual(program.program_crc, state.program_crc)
+        self.assertTrue(state.cooling_activated)
+        self.assertFalse(state.heating_activated)
+        self.assertEqual(13.0, state.current_temperature)
+        self.assertIsNone(state.error)
+        self.assertIsNotNone(state.timestamp)
 
     def test_should_return_states_for_all_programs(self):
         self.therm_sensor_api_mock.mock_sensors_temperature({"1001": 13.0, "1002": 14.0})
         program1 = self.add_test_program("1001", -1, 1, 10.0, 12.0)
         program2 = self.add_test_program("1002", 1, -1, 15.0, 16.0)
+        self.run_controller_iterations(1)
 
         states = self.controller.get_program_states()
 
         self.assertEqual(program1.program_id, states[0].program_id)
+        self.assertEqual(13.0, states[0].current_temperature)
         self.assertEqual(program2.program_id, states[1].program_id)
+        self.assertEqual(14.0, states[1].current_temperature)
+
+    def test_should_return_state_without_temperature_if_program_has_not_been_checked_yet(self):
+        program = self.add_test_program("1001", -1, 1, 10.0, 12.0)
+
+        state = self.controller.get_program_state(program.program_id)
+
+        self.assertEqual(program.program_id, state.program_id)
+        self.assertEqual(program.program_crc, state.program_crc)
+        self.assertIsNone(state.current_temperature)
+        self.assertIsNone(state.timestamp)
+
+    def test_should_not_access_hardware_when_returning_program_states(self):
+        self.therm_sensor_api_mock.mock_sensors_temperature({"1001": 13.0})
+        program = self.add_test_program("1001", -1, 1, 10.0, 12.0)
+        self.run_controller_iterations(1)
+        self.therm_sensor_api_mock.get_sensor_temperature.reset_mock()
+        self.relay_api_mock.get_relay_state.reset_mock()
+
+        self.controller.get_program_state(program.program_id)
+        self.controller.get_program_states()
+
+        self.therm_sensor_api_mock.get_sensor_temperature.assert_not_called()
+        self.relay_api_mock.get_relay_state.assert_not_called()
+
+    def test_should_report_sensor_error_in_program_state(self):
+        self.therm_sensor_api_mock.mock_sensors_temperature({"1001": None})
+        program = self.add_test_program("1001", -1, 1, 10.0, 12.0)
+        self.run_controller_iterations(1)
+
+        state = self.controller.get_program_state(program.program_id)
+
+        self.assertIsNone(state.current_temperature)
+        self.assertIsNotNone(state.error)
+
+    def test_should_increment_versions_when_data_changes(self):
+        versions = self.controller.get_versions()
+
+        program = self.add_test_program("1001", -1, 1, 10.0, 12.0)
+        self.controller.modify_program(program.program_id, create_test_program("1001", -1, 1, 10.0, 13.0))
+        self.controller.set_therm_sensor_name("1001", "fermenter")
+        self.run_controller_iterations(2)
+
+        self.assertEqual({Controller.VERSION_PROGRAMS: versions[Controller.VERSION_PROGRAMS] + 3,
+                          Controller.VERSION_SENSORS: versions[Controller.VERSION_SENSORS] + 2,
+                          Controller.VERSION_STATES: versions[Controller.VERSION_STATES] + 2},
+                         self.controller.get_versions())
+
+    def test_should_not_increment_versions_when_data_does_not_change(self):
+        self.add_test_program("1001", -1, 1, 10.0, 12.0)
+        self.controller.get_therm_sensors()
+        versions = self.controller.get_versions()
+
+        self.controller.get_programs()
+        self.controller.get_therm_sensors()
+        self.controller.get_program_states()
+
+        self.assertEqual(versions, self.controller.get_versions())
+
+    def test_should_emit_published_states_and_relay_changes(self):
+        self.therm_sensor_api_mock.mock_sensors_temperature({"1001": 13.0})
+        program = self.add_test_program("1001", -1, 1, 10.0, 12.0)
+        bus = EventBus()
+        published_states = []
+        relay_changes = []
+
+        def on_states_published(states):
+            published_states.append(states)
+
+        def on_relays_changed(relay_states):
+            relay_changes.append(relay_states)
+
+        bus.on('states_published')(on_states_published)
+        bus.on('relays_changed')(on_relays_changed)
+        try:
+            self.run_controller_iterations(2)
+        finally:
+            bus.remove('states_published', on_states_published)
+            bus.remove('relays_changed', on_relays_changed)
+
+        self.assertEqual(2, len(published_states))
+        self.assertTrue(published_states[-1][program.program_id].cooling_activated)
+        # relays changed in the first iteration only
+        self.assertEqual(1, len(relay_changes))
+        self.assertEqual(1, relay_changes[0][1])
+
+    def test_should_return_snapshot_of_published_data(self):
+        self.therm_sensor_api_mock.mock_sensors_temperature({"1001": 13.0})
+        program = self.add_test_program("1001", -1, 1, 10.0, 12.0)
+        self.run_controller_iterations(1)
+        self.relay_api_mock.get_relay_state.reset_mock()
+
+        snapshot = self.controller.get_snapshot()
+
+        self.assertEqual(self.controller.get_versions(), snapshot.versions)
+        self.assertEqual(self.MOCKED_SENSOR_IDS, [sensor.id for sensor in snapshot.sensors])
+        self.assertEqual([program], snapshot.programs)
+        self.assertEqual(self.controller.get_program_states(), snapshot.program_states)
+        self.assertEqual(1, snapshot.relay_states[1])
+        # relay states published by the loop are used
+        self.relay_api_mock.get_relay_state.assert_not_called()
+
+    def test_should_collect_metrics_without_accessing_hardware(self):
+        self.therm_sensor_api_mock.mock_sensors_temperature({"1001": 13.0})
+        program = self.add_test_program("1001", -1, 1, 10.0, 12.0)
+        self.run_controller_iterations(2)
+        self.therm_sensor_api_mock.get_sensor_temperature.reset_mock()
+        self.relay_api_mock.get_relay_state.reset_mock()
+        writer = MetricsWriter()
+
+        self.controller.collect_metrics(writer)
+
+        text = writer.to_text()
+        self.assertIn("brewery_loop_ticks_total 2\n", text)
+        self.assertIn("brewery_sensor_temperature_celsius{sensor=\"1001\"} 13.0\n", text)
+        self.assertIn("brewery_sensor_read_duration_seconds_count{sensor=\"1001\"} 2\n", text)
+        self.assertIn("brewery_relay_state{relay=\"1\"} 1\n", text)
+        self.assertIn("brewery_program_error{program=\"" + program.program_id + "\"} 0\n", text)
+        self.therm_sensor_api_mock.get_sensor_temperature.assert_not_called()
+        self.relay_api_mock.get_relay_state.assert_not_called()
+
+    def run_controller_iterations(self, iterations):
+        main_loop_exit_condition = TestLoopExitCondition(max_iterations=iterations)
+        self.controller.run(
+            interval_secs=0.01,
+            main_loop_exit_condition=main_loop_exit_condition.should_exit_main_loop)
 
 
 class IterationTask:
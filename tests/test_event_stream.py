@@ -0,0 +1,120 @@
+import json
+import threading
+import unittest
+
+from app.event_stream import EventStream, EVENT_RELAYS, EVENT_SNAPSHOT, EVENT_STATES
+from app.program import ProgramState
+from app.utils import EventBus
+
+
+def create_state(program_id, temperature, timestamp=100.0, heating=False):
+    return ProgramState(program_id, temperature, "crc", heating, False, None, timestamp)
+
+
+def parse_event(event):
+    lines = event.to_sse().decode("utf-8").rstrip("\n").split("\n")
+    fields = dict(line.split(": ", 1) for line in lines)
+    return int(fields["id"]), fields["event"], json.loads(fields["data"])
+
+
+class EventStreamTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = EventStream(backlog_size=4, client_queue_size=3)
+
+    def test_should_send_snapshot_to_new_client(self):
+        self.stream.publish_states({"p1": create_state("p1", 10.0)})
+        self.stream.publish_relays([0, 1])
+
+        events = self.stream.subscribe().get(timeout=0)
+
+        self.assertEqual([(2, EVENT_SNAPSHOT, {"states": [create_state("p1", 10.0).to_json_data()],
+                                               "relays": [0, 1]})],
+                         [parse_event(event) for event in events])
+
+    def test_should_send_changed_and_removed_states_only(self):
+        self.stream.publish_states({"p1": create_state("p1", 10.0), "p2": create_state("p2", 20.0)})
+        subscription = self.stream.subscribe()
+        subscription.get(timeout=0)
+
+        self.stream.publish_states({"p1": create_state("p1", 10.0, timestamp=101.0),
+                                    "p2": create_state("p2", 20.5, timestamp=101.0)})
+        self.stream.publish_states({"p1": create_state("p1", 10.0, timestamp=102.0)})
+        self.stream.publish_relays([0, 0])
+        self.stream.publish_relays([0, 0])
+
+        self.assertEqual([(2, EVENT_STATES, {"states": [create_state("p2", 20.5, timestamp=101.0).to_json_data()],
+                                             "removed": []}),
+                          (3, EVENT_STATES, {"states": [], "removed": ["p2"]}),
+                          (4, EVENT_RELAYS, {"relays": [0, 0]})],
+                         [parse_event(event) for event in subscription.get(timeout=0)])
+
+    def test_should_resume_from_last_event_id(self):
+        for index in range(5):
+            self.stream.publish_relays([index])
+
+        self.assertEqual([4, 5], [event.event_id for event in self.stream.subscribe("3").get(timeout=0)])
+        self.assertEqual([], self.stream.subscribe("5").get(timeout=0))
+        # event 1 is not in the backlog anymore
+        self.assertEqual([(5, EVENT_SNAPSHOT)], [(event.event_id, event.event_type)
+                                                 for event in self.stream.subscribe("0").get(timeout=0)])
+        self.assertEqual([EVENT_SNAPSHOT], [event.event_type for event in self.stream.subscribe("x").get(timeout=0)])
+
+    def test_should_send_snapshot_to_client_that_did_not_keep_up(self):
+        subscription = self.stream.subscribe()
+        subscription.get(timeout=0)
+        for index in range(5):
+            self.stream.publish_relays([index])
+
+        self.assertEqual([(5, EVENT_SNAPSHOT, {"states": [], "relays": [4]})],
+                         [parse_event(event) for event in subscription.get(timeout=0)])
+        self.assertEqual(1, self.stream.get_metrics()["overflow_count"])
+        self.stream.publish_relays([5])
+        self.assertEqual([6], [event.event_id for event in subscription.get(timeout=0)])
+
+    def test_should_wake_up_waiting_client(self):
+        subscription = self.stream.subscribe()
+        subscription.get(timeout=0)
+        result = []
+        thread = threading.Thread(target=lambda: result.append(subscription.get(timeout=5)))
+        thread.start()
+
+        self.stream.publish_relays([1])
+        thread.join()
+
+        self.assertEqual([1], [event.event_id for event in result[0]])
+
+    def test_should_end_closed_subscriptions(self):
+        subscription = self.stream.subscribe()
+
+        self.stream.close()
+
+        self.assertIsNone(subscription.get(timeout=0))
+        self.assertEqual(0, self.stream.get_metrics()["clients"])
+        self.assertIsNone(self.stream.subscribe())
+
+    def test_should_refuse_clients_above_limit(self):
+        stream = EventStream(max_clients=1)
+        subscription = stream.subscribe()
+
+        self.assertIsNone(stream.subscribe())
+        subscription.close()
+        self.assertIsNotNone(stream.subscribe())
+
+    def test_should_publish_events_of_event_bus(self):
+        bus = EventBus()
+        self.stream.attach()
+        try:
+            bus.emit('states_published', {"p1": create_state("p1", 10.0)})
+            bus.emit('relays_changed', [1, 0])
+        finally:
+            bus.remove('states_published', self.stream.publish_states)
+            bus.remove('relays_changed', self.stream.publish_relays)
+
+        self.assertEqual([(2, EVENT_SNAPSHOT, {"states": [create_state("p1", 10.0).to_json_data()],
+                                               "relays": [1, 0]})],
+                         [parse_event(event) for event in self.stream.subscribe().get(timeout=0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from app.history import HistoryStore, HistoryRecord, RollupRecord
+
+BASE_TIMESTAMP = 3600.0 * 1000
+
+
+class HistoryStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.history_dir = tempfile.mkdtemp()
+        self.history = None
+
+    def tearDown(self):
+        if self.history is not None:
+            self.history.stop()
+        shutil.rmtree(self.history_dir, ignore_errors=True)
+
+    def test_should_return_records_of_given_sensor_within_time_range(self):
+        self.__start_history()
+        for second in range(10):
+            self.history.append("sensor1", 10.0 + second, 0b01, timestamp=100.0 + second)
+            self.history.append("sensor2", 20.0 + second, 0b10, timestamp=100.0 + second)
+        self.history.flush()
+
+        records = self.history.query("sensor2", start=103.0, end=105.0)
+
+        self.assertEqual([HistoryRecord(103.0, "sensor2", 23.0, 0b10),
+                          HistoryRecord(104.0, "sensor2", 24.0, 0b10),
+                          HistoryRecord(105.0, "sensor2", 25.0, 0b10)], records)
+        self.assertTrue(records[0].is_relay_active(1))
+        self.assertFalse(records[0].is_relay_active(0))
+        self.assertFalse(records[0].is_relay_active(-1))
+
+    def test_should_return_empty_list_for_unknown_sensor(self):
+        self.__start_history()
+        self.history.append("sensor1", 10.0, 0, timestamp=100.0)
+        self.history.flush()
+
+        self.assertEqual([], self.history.query("sensor2"))
+
+    def test_should_store_unknown_temperature(self):
+        self.__start_history()
+        self.history.append("sensor1", None, 0, timestamp=100.0)
+        self.history.flush()
+
+        self.assertIsNone(self.history.query("sensor1")[0].temperature)
+
+    def test_should_not_store_decreasing_timestamps(self):
+        self.__start_history()
+        self.history.append("sensor1", 10.0, 0, timestamp=100.0)
+        self.history.append("sensor1", 11.0, 0, timestamp=90.0)
+        self.history.flush()
+
+        self.assertEqual([100.0, 100.0], [record.timestamp for record in self.history.query("sensor1")])
+
+    def test_should_query_ranges_across_segments_and_index_blocks(self):
+        self.__start_history(segment_records=HistoryStore.INDEX_STRIDE * 3)
+        for second in range(HistoryStore.INDEX_STRIDE * 10):
+            self.history.append("sensor1", 10.0, 0, timestamp=float(second))
+        self.history.flush()
+
+        self.assertEqual(4, len(self.__list_raw_segments()))
+        start = HistoryStore.INDEX_STRIDE * 2.5
+        end = HistoryStore.INDEX_STRIDE * 7.5
+        timestamps = [record.timestamp for record in self.history.query("sensor1", start, end)]
+        self.assertEqual([float(second) for second in range(int(start), int(end) + 1)], timestamps)
+
+    def test_should_load_existing_segments_and_drop_incomplete_record(self):
+        self.__start_history()
+        self.history.append("sensor1", 10.0, 0, timestamp=100.0)
+        self.history.append("sensor2", 20.0, 1, timestamp=101.0)
+        self.history.stop()
+        with open(self.__list_raw_segments()[0], "ab") as output_stream:
+            output_stream.write(b"\x01\x02\x03")
+
+        self.__start_history()
+        self.history.append("sensor2", 21.0, 0, timestamp=102.0)
+        self.history.flush()
+
+        self.assertEqual([HistoryRecord(101.0, "sensor2", 20.0, 1), HistoryRecord(102.0, "sensor2", 21.0, 0)],
+                         self.history.query("sensor2"))
+
+    def test_should_drop_records_when_queue_is_full(self):
+        self.history = HistoryStore(self.history_dir, queue_size=1)
+        self.history.append("sensor1", 10.0, 0, timestamp=100.0)
+        self.history.append("sensor1", 11.0, 0, timestamp=101.0)
+
+        self.assertEqual(1, self.history.dropped_count)
+
+    def test_should_select_coarsest_tier_not_coarser_than_requested_resolution(self):
+        self.history = HistoryStore(self.history_dir)
+
+        self.assertIsNone(self.history.select_tier())
+        self.assertIsNone(self.history.select_tier(30))
+        self.assertEqual(60, self.history.select_tier(60))
+        self.assertEqual(60, self.history.select_tier(899))
+        self.assertEqual(900, self.history.select_tier(900))
+        self.assertEqual(3600, self.history.select_tier(24 * 3600))
+
+    def test_should_roll_up_samples(self):
+        self.__start_history()
+        # heating relay 0 active for the first half of each minute, cooling relay 3 never
+        for second in range(0, 180, 10):
+            relay_mask = 0b1 if second % 60 < 30 else 0
+            self.history.append("sensor1", 10.0 + second % 60 / 10, relay_mask, timestamp=BASE_TIMESTAMP + second)
+        self.history.append("sensor2", 20.0, 0, timestamp=BASE_TIMESTAMP + 180)
+        self.history.flush()
+
+        rollups = self.history.query("sensor1", resolution_secs=60)
+
+        self.assertEqual(3, len(rollups))
+        self.assertEqual([BASE_TIMESTAMP, BASE_TIMESTAMP + 60, BASE_TIMESTAMP + 120],
+                         [rollup.timestamp for rollup in rollups])
+        for rollup in rollups:
+            self.assertEqual(60, rollup.resolution_secs)
+            self.assertEqual(10.0, rollup.min_temperature)
+            self.assertEqual(15.0, rollup.max_temperature)
+            self.assertEqual(12.5, rollup.mean_temperature)
+            self.assertEqual(6, rollup.count)
+            self.assertEqual(0.0, rollup.get_relay_on_secs(3))
+        # relay state is held until the next sample
+        self.assertEqual([30.0, 30.0, 30.0], [rollup.get_relay_on_secs(0) for rollup in rollups])
+        hourly = self.history.query("sensor1", resolution_secs=3600)
+        self.assertEqual([RollupRecord(BASE_TIMESTAMP, "sensor1", 3600, 10.0, 15.0, 12.5, 18,
+                                       [90.0] + [0.0] * (HistoryStore.RELAYS_COUNT - 1))], hourly)
+
+    def test_should_return_rollups_overlapping_requested_range(self):
+        self.__start_history()
+        for second in range(0, 300, 10):
+            self.history.append("sensor1", 10.0, 0, timestamp=BASE_TIMESTAMP + second)
+        self.history.flush()
+
+        rollups = self.history.query("sensor1", BASE_TIMESTAMP + 90, BASE_TIMESTAMP + 150, resolution_secs=60)
+
+        self.assertEqual([BASE_TIMESTAMP + 60, BASE_TIMESTAMP + 120], [rollup.timestamp for rollup in rollups])
+
+    def test_should_merge_rollups_of_period_interrupted_by_restart(self):
+        self.__start_history()
+        self.history.append("sensor1", 10.0, 0, timestamp=BASE_TIMESTAMP)
+        self.history.append("sensor1", 12.0, 0, timestamp=BASE_TIMESTAMP + 10)
+        self.history.stop()
+
+        self.__start_history()
+        self.history.append("sensor1", 14.0, 0, timestamp=BASE_TIMESTAMP + 20)
+        self.history.append("sensor1", 16.0, 0, timestamp=BASE_TIMESTAMP + 60)
+        self.history.flush()
+
+        rollups = self.history.query("sensor1", resolution_secs=60)
+        self.assertEqual(2, len(rollups))
+        self.assertEqual((10.0, 14.0, 12.0, 3),
+                         (rollups[0].min_temperature, rollups[0].max_temperature, rollups[0].mean_temperature,
+                          rollups[0].count))
+        self.assertEqual(16.0, rollups[1].mean_temperature)
+
+    def test_should_expire_samples_after_retention_and_keep_rollups(self):
+        self.history = HistoryStore(self.history_dir, segment_records=10, raw_retention_secs=3600)
+        self.history.start()
+        for minute in range(180):
+            self.history.append("sensor1", 10.0, 0, timestamp=BASE_TIMESTAMP + minute * 60)
+        self.history.flush()
+
+        samples = self.history.query("sensor1")
+        self.assertLessEqual(samples[0].timestamp, BASE_TIMESTAMP + 120 * 60)
+        self.assertGreater(samples[0].timestamp, BASE_TIMESTAMP + 100 * 60)
+        self.assertLess(len(self.__list_raw_segments()), 10)
+        self.assertEqual(180, len(self.history.query("sensor1", resolution_secs=60)))
+        self.assertEqual(BASE_TIMESTAMP, self.history.query("sensor1", resolution_secs=3600)[0].timestamp)
+
+    def __start_history(self, segment_records=65536):
+        self.history = HistoryStore(self.history_dir, segment_records=segment_records)
+        self.history.start()
+
+    def __list_raw_segments(self):
+        raw_dir = os.path.join(self.history_dir, HistoryStore.RAW_DIR_NAME)
+        return sorted(os.path.join(raw_dir, file_name) for file_name in os.listdir(raw_dir)
+                      if file_name.endswith(HistoryStore.SEGMENT_FILE_SUFFIX))
+
+
+if __name__ == '__main__':
+    unittest.main()
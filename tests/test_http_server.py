@@ -1,17 +1,26 @@
+import gzip
 import json
+import time
 import unittest
 from datetime import datetime
 
+import app.codec as codec
 import app.http_server as server
 from app.program import Program
+from app.event_stream import EventStream
 from app.logger import Logger, LogEntry
+from app.metrics import MetricsRegistry
 from mocks import ControllerMock, ThermSensorApiMock
 
 URL_PATH = "/brewery/api/v1.0/"
 URL_RESOURCE_SENSORS = "therm_sensors"
 URL_RESOURCE_PROGRAMS = "programs"
+URL_RESOURCE_PROGRAMS_BATCH = "programs/batch"
+URL_RESOURCE_HISTORY = "history"
 URL_RESOURCE_STATES = "states"
 URL_RESOURCE_LOGS = "logs"
+URL_RESOURCE_STREAM = "stream"
+URL_RESOURCE_SNAPSHOT = "snapshot"
 
 
 class HttpServerTestCase(unittest.TestCase):
@@ -19,6 +28,7 @@ class HttpServerTestCase(unittest.TestCase):
     def setUp(self):
         self.controller_mock = ControllerMock()
         server.init(self.controller_mock)
+        server.configure_access_log(sample_rate=0.0)
 
         # create a test client
         self.app = server.app.test_client()
@@ -162,6 +172,45 @@ class HttpServerTestCase(unittest.TestCase):
         response = self.app.delete(URL_PATH + URL_RESOURCE_PROGRAMS + "/invalid_program_id", follow_redirects=True)
         self.assertEqual(response.status_code, 404)
 
+    def test_should_apply_program_operations(self):
+        program = self.__create_program(ThermSensorApiMock.MOCKED_SENSORS[0], 1, 2, 16.0, 18.0, True)
+        request_content = [
+            {"op": "create", "program": {"name": "new_program", "sensor_id": ThermSensorApiMock.MOCKED_SENSORS[1],
+                                         "heating_relay_index": 3, "cooling_relay_index": 4,
+                                         "min_temp": 16.0, "max_temp": 18.0, "active": True}},
+            {"op": "delete", "id": program.program_id}
+        ]
+        response = self.app.post(URL_PATH + URL_RESOURCE_PROGRAMS_BATCH, follow_redirects=True,
+                                 json=request_content)
+        self.assertEqual(200, response.status_code)
+        response_json = json.loads(response.data.decode("utf-8"))
+        self.assertEqual(2, len(response_json))
+        self.assertEqual("create", response_json[0]["op"])
+        self.assertEqual("new_program", response_json[0]["program"]["name"])
+        self.assertEqual(self.controller_mock.programs[0].program_id, response_json[0]["id"])
+        self.assertEqual("delete", response_json[1]["op"])
+        self.assertEqual(program.program_id, response_json[1]["id"])
+        self.assertEqual(1, len(self.controller_mock.programs))
+
+    def test_should_return_status_403_when_program_operations_were_rejected(self):
+        self.controller_mock.raise_error_on_program_operations()
+        response = self.app.post(URL_PATH + URL_RESOURCE_PROGRAMS_BATCH, follow_redirects=True,
+                                 json=[{"op": "delete", "id": "0"}])
+        self.assertEqual(403, response.status_code)
+        response_json = json.loads(response.data.decode("utf-8"))
+        self.assertEqual(ControllerMock.DEFAULT_ERROR_MESSAGE, response_json["message"])
+        self.assertEqual([], response_json["results"])
+
+    def test_should_return_status_400_when_program_operations_are_not_list_of_objects(self):
+        for request_content in (None, {"op": "delete", "id": "0"}, ["delete"], [{"op": "create", "program": 1}]):
+            response = self.app.post(URL_PATH + URL_RESOURCE_PROGRAMS_BATCH, follow_redirects=True,
+                                     json=request_content)
+            self.assertEqual(400, response.status_code)
+            response_json = json.loads(response.data.decode("utf-8"))
+            self.assertEqual("invalid_operation", response_json["error_code"])
+            self.assertEqual([], response_json["results"])
+        self.assertEqual(400, self.app.post(URL_PATH + URL_RESOURCE_PROGRAMS_BATCH).status_code)
+
     def test_should_return_existing_programs(self):
         self.controller_mock.programs.append(Program("program_id1", "program_name1", "sensor_id1", 2, 4, 15.0, 15.5, active=True))
         self.controller_mock.programs.append(Program("program_id2", "program_name2", "sensor_id2", 1, 5, 15.1, 15.8, active=False))
@@ -208,6 +257,327 @@ class HttpServerTestCase(unittest.TestCase):
         self.assertEqual(response_json[-1]["level"], "error")
         self.assertEqual(response_json[-1]["msg"], "error msg")
 
+    def test_should_return_logs_since_given_id(self):
+        Logger.info("first msg")
+        response = self.app.get(URL_PATH + URL_RESOURCE_LOGS, follow_redirects=True)
+        last_id = json.loads(response.data.decode("utf-8"))[-1]["id"]
+        Logger.info("second msg")
+        Logger.error("third msg")
+
+        response = self.app.get(URL_PATH + URL_RESOURCE_LOGS + "?since={}".format(last_id), follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        response_json = json.loads(response.data.decode("utf-8"))
+
+        self.assertEqual(["second msg", "third msg"], [entry["msg"] for entry in response_json])
+        self.assertEqual([last_id + 1, last_id + 2], [entry["id"] for entry in response_json])
+
+    def test_should_return_filtered_logs(self):
+        Logger.info("first filtered msg")
+        response = self.app.get(URL_PATH + URL_RESOURCE_LOGS, follow_redirects=True)
+        last_id = json.loads(response.data.decode("utf-8"))[-1]["id"]
+        Logger.error("second filtered msg")
+        Logger.info("third filtered msg")
+        Logger.error("fourth filtered msg")
+        Logger.error("fifth msg")
+
+        response = self.app.get(URL_PATH + URL_RESOURCE_LOGS + "?since={}&level=error&contains=FILTERED&limit=1"
+                                .format(last_id), follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        response_json = json.loads(response.data.decode("utf-8"))
+
+        self.assertEqual(["second filtered msg"], [entry["msg"] for entry in response_json])
+
+    def test_should_return_logs_within_time_range(self):
+        now = time.time()
+        Logger.info("recent msg")
+
+        response = self.app.get(URL_PATH + URL_RESOURCE_LOGS + "?from={}".format(now + 3600), follow_redirects=True)
+        self.assertEqual([], json.loads(response.data.decode("utf-8")))
+        response = self.app.get(URL_PATH + URL_RESOURCE_LOGS + "?from={}".format(now - 10), follow_redirects=True)
+        self.assertEqual("recent msg", json.loads(response.data.decode("utf-8"))[-1]["msg"])
+
+    def test_should_log_sampled_requests_without_bodies(self):
+        server.configure_access_log(sample_rate=0.5, random_function=lambda: 0.4)
+        _, cursor = Logger.get_logs_since()
+
+        self.app.get(URL_PATH + URL_RESOURCE_SENSORS + "?name=x", follow_redirects=True)
+
+        access_logs = [entry for entry in Logger.get_logs_since(cursor)[0] if entry.message.startswith("Access")]
+        self.assertEqual(1, len(access_logs))
+        self.assertRegex(access_logs[0].message, r"^Access method=GET path=/brewery/api/v1\.0/therm_sensors\?name=x "
+                                                 r"status=200 bytes=\d+ duration_ms=\d+\.\d$")
+
+    def test_should_not_log_requests_out_of_sample(self):
+        server.configure_access_log(sample_rate=0.5, random_function=lambda: 0.5)
+        _, cursor = Logger.get_logs_since()
+
+        self.app.get(URL_PATH + URL_RESOURCE_SENSORS, follow_redirects=True)
+
+        self.assertEqual([], [entry for entry in Logger.get_logs_since(cursor)[0]
+                              if entry.message.startswith("Access")])
+
+    def test_should_log_failed_requests_with_bodies(self):
+        server.configure_access_log(sample_rate=0.0)
+        _, cursor = Logger.get_logs_since()
+
+        self.app.get(URL_PATH + URL_RESOURCE_SENSORS + "/invalid_sensor_id", follow_redirects=True)
+
+        access_logs = [entry for entry in Logger.get_logs_since(cursor)[0] if entry.message.startswith("Access")]
+        self.assertEqual(1, len(access_logs))
+        self.assertEqual("error", access_logs[0].level)
+        self.assertIn("status=404", access_logs[0].message)
+        self.assertIn("response_body=", access_logs[0].message)
+
+    def test_should_return_not_modified_programs_without_getting_them(self):
+        sensor = ThermSensorApiMock.MOCKED_SENSORS[0]
+        self.__create_program(sensor, 2, 4, 15.0, 15.5, True)
+        response = self.app.get(URL_PATH + URL_RESOURCE_PROGRAMS, follow_redirects=True)
+        etag = response.headers["ETag"]
+        self.controller_mock.get_programs.reset_mock()
+
+        response = self.app.get(URL_PATH + URL_RESOURCE_PROGRAMS, headers={"If-None-Match": etag},
+                                follow_redirects=True)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(b"", response.data)
+        self.assertEqual(etag, response.headers["ETag"])
+        self.controller_mock.get_programs.assert_not_called()
+
+    def test_should_return_modified_programs_when_version_changed(self):
+        sensors = ThermSensorApiMock.MOCKED_SENSORS
+        self.__create_program(sensors[0], 2, 4, 15.0, 15.5, True)
+        etag = self.app.get(URL_PATH + URL_RESOURCE_PROGRAMS, follow_redirects=True).headers["ETag"]
+        self.__create_program(sensors[1], 3, 5, 15.0, 15.5, True)
+
+        response = self.app.get(URL_PATH + URL_RESOURCE_PROGRAMS, headers={"If-None-Match": etag},
+                                follow_redirects=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(etag, response.headers["ETag"])
+        self.assertEqual(2, len(json.loads(response.data.decode("utf-8"))))
+
+    def test_should_return_not_modified_sensors_and_states(self):
+        for url in (URL_PATH + URL_RESOURCE_SENSORS, URL_PATH + URL_RESOURCE_STATES):
+            etag = self.app.get(url, follow_redirects=True).headers["ETag"]
+
+            response = self.app.get(url, headers={"If-None-Match": etag}, follow_redirects=True)
+
+            self.assertEqual(response.status_code, 304)
+
+        etag = self.app.get(URL_PATH + URL_RESOURCE_STATES, follow_redirects=True).headers["ETag"]
+        self.controller_mock.set_sensor_temperature(ThermSensorApiMock.MOCKED_SENSORS[0], 10.0)
+        response = self.app.get(URL_PATH + URL_RESOURCE_STATES, headers={"If-None-Match": etag}, follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+
+    def test_should_serialize_programs_once_per_version(self):
+        sensors = ThermSensorApiMock.MOCKED_SENSORS
+        self.__create_program(sensors[0], 2, 4, 15.0, 15.5, True)
+        first = self.app.get(URL_PATH + URL_RESOURCE_PROGRAMS, follow_redirects=True)
+        second = self.app.get(URL_PATH + URL_RESOURCE_PROGRAMS, follow_redirects=True)
+        self.assertEqual(1, self.controller_mock.get_programs.call_count)
+        self.assertEqual(first.data, second.data)
+
+        self.__create_program(sensors[1], 3, 5, 15.0, 15.5, True)
+        response = self.app.get(URL_PATH + URL_RESOURCE_PROGRAMS, follow_redirects=True)
+
+        self.assertEqual(2, self.controller_mock.get_programs.call_count)
+        self.assertEqual(2, len(json.loads(response.data.decode("utf-8"))))
+
+    def test_should_serialize_states_once_per_tick(self):
+        self.app.get(URL_PATH + URL_RESOURCE_STATES, follow_redirects=True)
+        self.app.get(URL_PATH + URL_RESOURCE_STATES, follow_redirects=True)
+        self.assertEqual(1, self.controller_mock.get_program_states.call_count)
+
+        self.controller_mock.set_sensor_temperature(ThermSensorApiMock.MOCKED_SENSORS[0], 10.0)
+        self.app.get(URL_PATH + URL_RESOURCE_STATES, follow_redirects=True)
+
+        self.assertEqual(2, self.controller_mock.get_program_states.call_count)
+
+    def test_should_log_length_of_compressed_and_binary_bodies_in_debug_mode(self):
+        server.configure_access_log(debug=True)
+        codec.register_codec(codec.Codec("test", "application/x-test", lambda data: b"\xff\xfe"))
+        gzip_min_bytes = server.GZIP_MIN_BYTES
+        server.GZIP_MIN_BYTES = 0
+        _, cursor = Logger.get_logs_since()
+        try:
+            compressed = self.app.get(URL_PATH + URL_RESOURCE_SENSORS, headers={"Accept-Encoding": "gzip"},
+                                      follow_redirects=True)
+            binary = self.app.get(URL_PATH + URL_RESOURCE_SENSORS, headers={"Accept": "application/x-test"},
+                                  follow_redirects=True)
+        finally:
+            server.GZIP_MIN_BYTES = gzip_min_bytes
+            codec.unregister_codec("application/x-test")
+
+        self.assertEqual(200, compressed.status_code)
+        self.assertEqual(200, binary.status_code)
+        access_logs = [entry.message for entry in Logger.get_logs_since(cursor)[0]
+                       if entry.message.startswith("Access")]
+        self.assertEqual(2, len(access_logs))
+        self.assertIn("response_body=<{} bytes gzip>".format(len(compressed.data)), access_logs[0])
+        self.assertIn("response_body=<2 bytes application/x-test>", access_logs[1])
+
+    def test_should_return_gzip_content_when_accepted(self):
+        gzip_min_bytes = server.GZIP_MIN_BYTES
+        server.GZIP_MIN_BYTES = 0
+        try:
+            plain = self.app.get(URL_PATH + URL_RESOURCE_SENSORS, follow_redirects=True)
+            compressed = self.app.get(URL_PATH + URL_RESOURCE_SENSORS, headers={"Accept-Encoding": "gzip"},
+                                      follow_redirects=True)
+        finally:
+            server.GZIP_MIN_BYTES = gzip_min_bytes
+
+        self.assertNotIn("Content-Encoding", plain.headers)
+        self.assertEqual("gzip", compressed.headers["Content-Encoding"])
+        self.assertIn("Accept-Encoding", compressed.headers["Vary"])
+        self.assertEqual(plain.headers["ETag"], compressed.headers["ETag"])
+        self.assertEqual(plain.data, gzip.decompress(compressed.data))
+
+    def test_should_not_compress_small_content(self):
+        response = self.app.get(URL_PATH + URL_RESOURCE_SENSORS, headers={"Accept-Encoding": "gzip"},
+                                follow_redirects=True)
+
+        self.assertNotIn("Content-Encoding", response.headers)
+
+    def test_should_encode_responses_by_accepted_codec(self):
+        codec.register_codec(codec.Codec("test", "application/x-test", lambda data: repr(data).encode("utf-8")))
+        try:
+            self.__create_program(ThermSensorApiMock.MOCKED_SENSORS[0], 2, 4, 15.0, 15.5, True)
+            json_response = self.app.get(URL_PATH + URL_RESOURCE_PROGRAMS, follow_redirects=True)
+            test_response = self.app.get(URL_PATH + URL_RESOURCE_PROGRAMS, headers={"Accept": "application/x-test"},
+                                         follow_redirects=True)
+            logs_response = self.app.get(URL_PATH + URL_RESOURCE_LOGS, headers={"Accept": "application/x-test"},
+                                         follow_redirects=True)
+        finally:
+            codec.unregister_codec("application/x-test")
+
+        self.assertEqual("application/json", json_response.content_type)
+        self.assertEqual("application/x-test", test_response.content_type)
+        self.assertEqual(repr(json.loads(json_response.data.decode("utf-8"))).encode("utf-8"), test_response.data)
+        self.assertNotEqual(json_response.headers["ETag"], test_response.headers["ETag"])
+        self.assertIn("Accept", test_response.headers["Vary"])
+        self.assertEqual("application/x-test", logs_response.content_type)
+
+    def test_should_encode_json_by_default(self):
+        response = self.app.get(URL_PATH + URL_RESOURCE_SENSORS, headers={"Accept": "application/unknown"},
+                                follow_redirects=True)
+
+        self.assertEqual("application/json", response.content_type)
+        self.assertEqual(len(ThermSensorApiMock.MOCKED_SENSORS), len(json.loads(response.data.decode("utf-8"))))
+
+    def test_should_return_snapshot(self):
+        sensor = ThermSensorApiMock.MOCKED_SENSORS[0]
+        self.__create_program(sensor, 2, 4, 15.0, 15.5, True)
+        self.controller_mock.set_relay_state(2, 1)
+        Logger.info("snapshot message")
+
+        response = self.app.get(URL_PATH + URL_RESOURCE_SNAPSHOT, follow_redirects=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("ETag", response.headers)
+        response_json = json.loads(response.data.decode("utf-8"))
+        self.assertEqual(len(ThermSensorApiMock.MOCKED_SENSORS), len(response_json["sensors"]))
+        self.assertEqual(self.controller_mock.programs[0].program_id, response_json["programs"][0]["id"])
+        self.assertEqual(self.controller_mock.programs[0].program_id, response_json["states"][0]["program_id"])
+        self.assertEqual(1, response_json["relays"][2])
+        self.assertEqual("snapshot message", response_json["logs"][-1]["msg"])
+        self.controller_mock.get_snapshot.assert_called_once_with()
+
+    def test_should_return_selected_snapshot_fields(self):
+        response = self.app.get(URL_PATH + URL_RESOURCE_SNAPSHOT + "?fields=relays,states&log_limit=5",
+                                follow_redirects=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({"states", "relays"}, set(json.loads(response.data.decode("utf-8")).keys()))
+
+    def test_should_reject_snapshot_without_valid_fields(self):
+        response = self.app.get(URL_PATH + URL_RESOURCE_SNAPSHOT + "?fields=unknown", follow_redirects=True)
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_should_return_not_modified_snapshot_until_data_changes(self):
+        url = URL_PATH + URL_RESOURCE_SNAPSHOT + "?fields=programs,states,relays"
+        etag = self.app.get(url, follow_redirects=True).headers["ETag"]
+        Logger.info("not in the selected fields")
+
+        response = self.app.get(url, headers={"If-None-Match": etag}, follow_redirects=True)
+        self.assertEqual(response.status_code, 304)
+
+        self.controller_mock.set_relay_state(2, 1)
+        response = self.app.get(url, headers={"If-None-Match": etag}, follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(1, json.loads(response.data.decode("utf-8"))["relays"][2])
+
+    def test_should_return_modified_snapshot_with_new_logs(self):
+        url = URL_PATH + URL_RESOURCE_SNAPSHOT + "?fields=logs"
+        etag = self.app.get(url, follow_redirects=True).headers["ETag"]
+        Logger.info("new snapshot message")
+
+        response = self.app.get(url, headers={"If-None-Match": etag}, follow_redirects=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual("new snapshot message", json.loads(response.data.decode("utf-8"))["logs"][-1]["msg"])
+
+    def test_should_return_metrics(self):
+        metrics = MetricsRegistry()
+        metrics.add_collector(server.collect_metrics)
+        server.init(self.controller_mock, metrics=metrics)
+        self.app.get(URL_PATH + URL_RESOURCE_SENSORS, follow_redirects=True)
+        self.app.get(URL_PATH + URL_RESOURCE_SENSORS + "/invalid_sensor_id", follow_redirects=True)
+
+        response = self.app.get("/metrics", follow_redirects=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith("text/plain; version=0.0.4"))
+        text = response.data.decode("utf-8")
+        route = URL_PATH + URL_RESOURCE_SENSORS
+        self.assertIn('brewery_http_responses_total{method="GET",route="' + route + '",status="200"}', text)
+        self.assertIn('brewery_http_responses_total{method="GET",route="' + route + '/<sensor_id>",status="404"} 1',
+                      text)
+        self.assertIn('brewery_http_request_duration_seconds_count{method="DELETE",route="' + URL_PATH +
+                      URL_RESOURCE_PROGRAMS + '/<program_id>"}', text)
+
+    def test_should_not_return_metrics_without_registry(self):
+        response = self.app.get("/metrics", follow_redirects=True)
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_should_stream_events_from_last_event_id(self):
+        event_stream = EventStream()
+        server.init(self.controller_mock, event_stream)
+        event_stream.publish_relays([1, 0])
+        event_stream.publish_relays([0, 0])
+
+        response = self.app.get(URL_PATH + URL_RESOURCE_STREAM, headers={"Last-Event-ID": "1"}, buffered=False)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith("text/event-stream"))
+        chunks = iter(response.response)
+        self.assertEqual(b'id: 2\nevent: relays\ndata: {"relays": [0, 0]}\n\n', next(chunks))
+        event_stream.close()
+        self.assertEqual([], list(chunks))
+        response.close()
+        self.assertEqual(0, event_stream.get_metrics()["clients"])
+
+    def test_should_return_503_for_stream_above_client_limit(self):
+        event_stream = EventStream(max_clients=1)
+        server.init(self.controller_mock, event_stream)
+        subscription = event_stream.subscribe()
+
+        response = self.app.get(URL_PATH + URL_RESOURCE_STREAM)
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual("30", response.headers["Retry-After"])
+        subscription.close()
+
+    def test_should_return_404_for_stream_if_not_available(self):
+        response = self.app.get(URL_PATH + URL_RESOURCE_STREAM)
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_should_reject_invalid_server_mode(self):
+        with self.assertRaises(ValueError):
+            server.start_server(mode="invalid")
+
     def test_should_return_current_temperature_of_the_given_program(self):
         sensor = ThermSensorApiMock.MOCKED_SENSORS[0]
         created_program = self.__create_program(sensor, 2, 4, 15.0, 15.5, True)
@@ -220,6 +590,50 @@ class HttpServerTestCase(unittest.TestCase):
         self.assertEqual(created_program.program_id, response_json["program_id"])
         self.assertEqual(created_program.program_crc, response_json["program_crc"])
 
+    def test_should_return_age_of_the_program_state(self):
+        sensor = ThermSensorApiMock.MOCKED_SENSORS[0]
+        created_program = self.__create_program(sensor, 2, 4, 15.0, 15.5, True)
+
+        response = self.app.get(URL_PATH + URL_RESOURCE_STATES + "/" + created_program.program_id,
+                                follow_redirects=True)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("0", response.headers["Age"])
+        response_json = json.loads(response.data.decode("utf-8"))
+        self.assertIsNotNone(response_json["timestamp"])
+        self.assertIsNone(response_json["error"])
+
+    def test_should_return_program_history_for_given_period(self):
+        sensor = ThermSensorApiMock.MOCKED_SENSORS[0]
+        created_program = self.__create_program(sensor, 2, 4, 15.0, 15.5, True)
+
+        response = self.app.get(URL_PATH + URL_RESOURCE_PROGRAMS + "/" + created_program.program_id + "/" +
+                                URL_RESOURCE_HISTORY + "?from=100.5&to=200", follow_redirects=True)
+        self.assertEqual(200, response.status_code)
+        self.controller_mock.get_program_history.assert_called_once_with(created_program.program_id, 100.5, 200.0,
+                                                                          None)
+        response_json = json.loads(response.data.decode("utf-8"))
+        self.assertEqual(1, len(response_json))
+        self.assertEqual(ThermSensorApiMock.MOCKED_SENSORS_TEMPERATURE[sensor],
+                         response_json[0]["current_temperature"])
+
+    def test_should_return_program_history_rollups_of_given_resolution(self):
+        sensor = ThermSensorApiMock.MOCKED_SENSORS[0]
+        created_program = self.__create_program(sensor, 2, 4, 15.0, 15.5, True)
+
+        response = self.app.get(URL_PATH + URL_RESOURCE_PROGRAMS + "/" + created_program.program_id + "/" +
+                                URL_RESOURCE_HISTORY + "?resolution=3600", follow_redirects=True)
+        self.assertEqual(200, response.status_code)
+        self.controller_mock.get_program_history.assert_called_once_with(created_program.program_id, None, None,
+                                                                          3600.0)
+        response_json = json.loads(response.data.decode("utf-8"))
+        self.assertEqual(3600.0, response_json[0]["resolution"])
+        self.assertEqual(ThermSensorApiMock.MOCKED_SENSORS_TEMPERATURE[sensor], response_json[0]["mean_temperature"])
+
+    def test_should_return_status_404_on_program_history_when_invalid_program_id(self):
+        response = self.app.get(URL_PATH + URL_RESOURCE_PROGRAMS + "/invalid/" + URL_RESOURCE_HISTORY,
+                                follow_redirects=True)
+        self.assertEqual(404, response.status_code)
+
     def test_should_return_states_of_all_available_programs(self):
         sensor1 = ThermSensorApiMock.MOCKED_SENSORS[0]
         created_program1 = self.__create_program(sensor1, 2, 4, 15.0, 15.5, True)
@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from app.log_files import LogFileStore
+from app.logger import LogEntry
+
+BASE_DATE = datetime(2020, 1, 1, 12, 0, 0)
+
+
+def create_entries(count, start_index=0, level="info"):
+    return [LogEntry(BASE_DATE + timedelta(seconds=index), level, "message{}".format(index))
+            for index in range(start_index, start_index + count)]
+
+
+class LogFileStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.log_dir = tempfile.mkdtemp()
+        self.log_files = None
+
+    def tearDown(self):
+        if self.log_files is not None:
+            self.log_files.close()
+        shutil.rmtree(self.log_dir, ignore_errors=True)
+
+    def test_should_return_entries_within_time_range(self):
+        self.log_files = LogFileStore(self.log_dir)
+        entries = create_entries(10)
+        self.log_files.append(entries)
+
+        result = self.log_files.query(entries[3].date, entries[5].date)
+
+        self.assertEqual(entries[3:6], result)
+        self.assertEqual(entries, self.log_files.query())
+
+    def test_should_filter_entries_by_level_and_message(self):
+        self.log_files = LogFileStore(self.log_dir)
+        entries = create_entries(3) + create_entries(3, start_index=3, level="error")
+        self.log_files.append(entries)
+
+        self.assertEqual(entries[3:], self.log_files.query(level="error"))
+        self.assertEqual([entries[4]], self.log_files.query(contains="MESSAGE4"))
+        self.assertEqual(entries[:2], self.log_files.query(limit=2))
+
+    def test_should_keep_new_lines_and_tabs_of_messages(self):
+        self.log_files = LogFileStore(self.log_dir)
+        entry = LogEntry(BASE_DATE, "error", "Traceback:\n\tline \\n 1\r\n")
+        self.log_files.append([entry])
+
+        self.assertEqual([entry], self.log_files.query())
+
+    def test_should_return_entries_written_before_restart(self):
+        self.log_files = LogFileStore(self.log_dir)
+        entries = create_entries(10)
+        self.log_files.append(entries[:5])
+        self.log_files.close()
+
+        self.log_files = LogFileStore(self.log_dir)
+        self.log_files.append(entries[5:])
+
+        self.assertEqual(entries[4:7], self.log_files.query(entries[4].date, entries[6].date))
+        self.assertEqual(2, len([name for name in os.listdir(self.log_dir) if name.endswith(".log")]))
+
+    def test_should_rotate_segments_and_find_entries_across_them(self):
+        self.log_files = LogFileStore(self.log_dir, segment_bytes=2000, max_total_bytes=1000000)
+        entries = create_entries(2000)
+        for position in range(0, len(entries), 100):
+            self.log_files.append(entries[position:position + 100])
+
+        self.assertGreater(len([name for name in os.listdir(self.log_dir) if name.endswith(".log")]), 10)
+        self.assertEqual(entries[1234:1240], self.log_files.query(entries[1234].date, entries[1239].date))
+        self.assertEqual(entries, self.log_files.query())
+
+    def test_should_remove_oldest_segments_over_size_limit(self):
+        self.log_files = LogFileStore(self.log_dir, segment_bytes=2000, max_total_bytes=10000)
+        entries = create_entries(2000)
+        for position in range(0, len(entries), 100):
+            self.log_files.append(entries[position:position + 100])
+
+        self.assertLessEqual(self.log_files.total_bytes, 10000)
+        result = self.log_files.query()
+        self.assertEqual(entries[-len(result):], result)
+        self.assertLess(len(result), len(entries))
+
+    def test_should_skip_incomplete_last_line(self):
+        self.log_files = LogFileStore(self.log_dir)
+        entries = create_entries(2)
+        self.log_files.append(entries)
+        self.log_files.close()
+        with open(os.path.join(self.log_dir, "00000000.log"), "ab") as output_stream:
+            output_stream.write(b"1577880000.0\tinfo\tincompl")
+
+        self.log_files = LogFileStore(self.log_dir)
+
+        self.assertEqual(entries, self.log_files.query())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,328 @@
+import io
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from app.log_files import LogFileStore
+from app.logger import AsyncLogSink, LogBuffer, LogEntry, Logger, LogSuppressor
+
+
+def create_entry(index, message="", level="info"):
+    return LogEntry(datetime(2020, 1, 1, 12, 0, index % 60), level, message or "message{}".format(index))
+
+
+class LogBufferTestCase(unittest.TestCase):
+
+    def test_should_return_appended_entries(self):
+        buffer = LogBuffer(max_entries=10)
+        entries = [create_entry(index) for index in range(5)]
+        for entry in entries:
+            buffer.append(entry)
+
+        self.assertEqual((entries, 5), buffer.get_entries())
+        self.assertEqual(5, len(buffer))
+
+    def test_should_drop_oldest_entries_when_full(self):
+        buffer = LogBuffer(max_entries=3)
+        entries = [create_entry(index) for index in range(5)]
+        for entry in entries:
+            buffer.append(entry)
+
+        self.assertEqual((entries[2:], 5), buffer.get_entries())
+        self.assertEqual(2, buffer.first_cursor)
+        self.assertEqual(2, buffer.dropped_count)
+
+    def test_should_limit_approximate_size_of_entries(self):
+        entry_bytes = LogBuffer.ENTRY_OVERHEAD_BYTES + 10
+        buffer = LogBuffer(max_entries=100, max_bytes=entry_bytes * 3)
+        entries = [create_entry(index, "x" * 10) for index in range(5)]
+        for entry in entries:
+            buffer.append(entry)
+
+        self.assertEqual(entries[2:], buffer.get_entries()[0])
+        self.assertEqual(entry_bytes * 3, buffer.bytes)
+
+    def test_should_return_entries_since_cursor(self):
+        buffer = LogBuffer(max_entries=3)
+        entries = [create_entry(index) for index in range(5)]
+        for entry in entries[:2]:
+            buffer.append(entry)
+        _, cursor = buffer.get_entries()
+        for entry in entries[2:]:
+            buffer.append(entry)
+
+        self.assertEqual((entries[2:], 5), buffer.get_entries(cursor))
+        self.assertEqual((entries[2:4], 4), buffer.get_entries(cursor, limit=2))
+        self.assertEqual(([], 5), buffer.get_entries(5))
+        # dropped entries are skipped
+        self.assertEqual((entries[2:], 5), buffer.get_entries(0))
+
+    def test_should_keep_cursors_when_cleared_or_resized(self):
+        buffer = LogBuffer(max_entries=5)
+        entries = [create_entry(index) for index in range(5)]
+        for entry in entries:
+            buffer.append(entry)
+
+        buffer.set_capacity(2)
+        self.assertEqual((entries[3:], 5), buffer.get_entries(3))
+        buffer.clear()
+        self.assertEqual(0, len(buffer))
+        self.assertEqual(5, buffer.append(create_entry(5)))
+
+    def test_should_query_entries_by_level_time_and_message(self):
+        buffer = LogBuffer(max_entries=4)
+        entries = [create_entry(index, level="error" if index % 2 else "info") for index in range(6)]
+        for entry in entries:
+            buffer.append(entry)
+
+        self.assertEqual([(2, entries[2]), (4, entries[4])], buffer.query(level="info"))
+        self.assertEqual([(3, entries[3]), (5, entries[5])], buffer.query(level="error"))
+        self.assertEqual([(5, entries[5])], buffer.query(cursor=4, level="error"))
+        self.assertEqual([], buffer.query(level="warning"))
+        self.assertEqual([(3, entries[3]), (4, entries[4])],
+                         buffer.query(start=entries[3].date, end=entries[4].date))
+        self.assertEqual([(4, entries[4])], buffer.query(contains="MESSAGE4"))
+        self.assertEqual([(2, entries[2]), (3, entries[3])], buffer.query(limit=2))
+
+    def test_should_keep_level_index_consistent_with_dropped_entries(self):
+        buffer = LogBuffer(max_entries=10)
+        for index in range(5000):
+            buffer.append(create_entry(index, level="error" if index % 3 == 0 else "info"))
+
+        result = buffer.query(level="error")
+
+        self.assertEqual(list(range(4992, 5000, 3)), [sequence for sequence, _ in result])
+        self.assertTrue(all(entry.level == "error" for _, entry in result))
+
+
+class AsyncLogSinkTestCase(unittest.TestCase):
+
+    def test_should_write_queued_entries_on_flush(self):
+        stream = io.StringIO()
+        sink = AsyncLogSink(stream=stream)
+        entries = [create_entry(index) for index in range(2)]
+        for entry in entries:
+            sink.emit(entry)
+        self.assertEqual("", stream.getvalue())
+
+        sink.flush()
+
+        self.assertEqual("".join(str(entry) + "\n" for entry in entries), stream.getvalue())
+
+    def test_should_drop_oldest_entries_when_queue_is_full(self):
+        stream = io.StringIO()
+        sink = AsyncLogSink(queue_size=2, stream=stream)
+        entries = [create_entry(index) for index in range(3)]
+        for entry in entries:
+            sink.emit(entry)
+
+        sink.flush()
+
+        self.assertEqual(1, sink.dropped_count)
+        self.assertEqual([str(entries[1]), str(entries[2]), "1 log entries dropped"],
+                         stream.getvalue().splitlines())
+
+    def test_should_write_entries_from_background_thread(self):
+        stream = io.StringIO()
+        sink = AsyncLogSink(stream=stream)
+        sink.start()
+        entry = create_entry(0)
+        sink.emit(entry)
+
+        sink.stop()
+
+        self.assertEqual(str(entry) + "\n", stream.getvalue())
+
+    def test_should_write_entries_to_log_files(self):
+        log_dir = tempfile.mkdtemp()
+        try:
+            log_files = LogFileStore(log_dir)
+            sink = AsyncLogSink(stream=io.StringIO(), log_files=log_files)
+            entry = create_entry(0)
+            sink.emit(entry)
+
+            sink.flush()
+
+            self.assertEqual([entry], log_files.query())
+            log_files.close()
+        finally:
+            shutil.rmtree(log_dir, ignore_errors=True)
+
+
+class FakeClock(object):
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class LogSuppressorTestCase(unittest.TestCase):
+
+    def test_should_suppress_repeats_within_window(self):
+        clock = FakeClock()
+        suppressor = LogSuppressor(window_secs=60, clock=clock)
+
+        self.assertEqual((False, []), suppressor.suppress("error", "source", "sensor {}", ("1",)))
+        clock.now = 10
+        self.assertEqual((True, []), suppressor.suppress("error", "source", "sensor {}", ("1",)))
+        self.assertEqual((True, []), suppressor.suppress("error", "source", "sensor {}", ("1",)))
+        self.assertEqual((False, []), suppressor.suppress("error", "other source", "sensor {}", ("1",)))
+        self.assertEqual((False, []), suppressor.suppress("info", "source", "sensor {}", ("1",)))
+        clock.now = 61
+        self.assertEqual((False, [("error", "sensor 1 (repeated 2 times)")]),
+                         suppressor.suppress("error", "source", "sensor {}", ("1",)))
+
+    def test_should_not_suppress_messages_with_different_args(self):
+        suppressor = LogSuppressor(window_secs=60, clock=FakeClock())
+
+        self.assertEqual((False, []), suppressor.suppress("info", "source", "GPIO {} set to {}", (17, 1)))
+        self.assertEqual((False, []), suppressor.suppress("info", "source", "GPIO {} set to {}", (27, 1)))
+        self.assertEqual((False, []), suppressor.suppress("info", "source", "GPIO {} set to {}", (17, 0)))
+        self.assertEqual((True, []), suppressor.suppress("info", "source", "GPIO {} set to {}", (17, 0)))
+
+    def test_should_summarize_repeats_of_ended_windows_of_other_messages(self):
+        clock = FakeClock()
+        suppressor = LogSuppressor(window_secs=60, clock=clock)
+        suppressor.suppress("error", "source", "not ready", ())
+        suppressor.suppress("error", "source", "not ready", ())
+        suppressor.suppress("info", "source", "other", ())
+
+        clock.now = 120
+        self.assertEqual((False, [("error", "not ready (repeated 1 times)")]),
+                         suppressor.suppress("info", "source", "another", ()))
+
+    def test_should_count_suppressed_messages(self):
+        suppressor = LogSuppressor(window_secs=60, clock=FakeClock())
+        for _ in range(3):
+            suppressor.suppress("error", "source", "first", ())
+        for _ in range(2):
+            suppressor.suppress("info", "source", "second", ())
+
+        self.assertEqual([{"level": "error", "source": "source", "template": "first", "suppressed": 2},
+                          {"level": "info", "source": "source", "template": "second", "suppressed": 1}],
+                         suppressor.get_counters())
+
+
+class LoggerTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        Logger.set_capacity(Logger.DEFAULT_MAX_ENTRIES)
+        Logger.set_sink(None)
+        Logger.set_log_files(None)
+        Logger.set_repeat_window(None)
+
+    def test_should_pass_log_entries_to_sink(self):
+        stream = io.StringIO()
+        sink = AsyncLogSink(stream=stream)
+        Logger.set_sink(sink)
+
+        Logger.info("sink message")
+        sink.flush()
+
+        self.assertTrue(stream.getvalue().endswith("info sink message\n"))
+
+    def test_should_keep_limited_number_of_log_entries(self):
+        Logger.set_capacity(2)
+        for index in range(3):
+            Logger.info("message{}".format(index))
+
+        self.assertEqual(["message1", "message2"], [entry.message for entry in Logger.get_logs()])
+
+    def test_should_return_log_entries_since_cursor(self):
+        _, cursor = Logger.get_logs_since()
+        Logger.error("error message")
+
+        entries, next_cursor = Logger.get_logs_since(cursor)
+
+        self.assertEqual(["error message"], [entry.message for entry in entries])
+        self.assertEqual(cursor + 1, next_cursor)
+
+    def test_should_return_recent_log_entries(self):
+        _, cursor = Logger.get_logs_since()
+        for index in range(3):
+            Logger.info("recent{}".format(index))
+
+        entries, next_cursor = Logger.get_recent_logs(2)
+
+        self.assertEqual([(cursor + 1, "recent1"), (cursor + 2, "recent2")],
+                         [(sequence, entry.message) for sequence, entry in entries])
+        self.assertEqual(cursor + 3, next_cursor)
+        self.assertEqual([], Logger.get_recent_logs(0)[0])
+
+    def test_should_return_metrics_of_buffer_and_sink(self):
+        Logger.set_capacity(2)
+        Logger.clear()
+        Logger.set_sink(AsyncLogSink(stream=io.StringIO()))
+        dropped_count = Logger.get_metrics()["dropped_count"]
+        for index in range(3):
+            Logger.info("metrics{}".format(index))
+
+        metrics = Logger.get_metrics()
+
+        self.assertEqual(2, metrics["entries"])
+        self.assertEqual(dropped_count + 1, metrics["dropped_count"])
+        self.assertEqual(3, metrics["sink_queue_depth"])
+        self.assertEqual(0, metrics["sink_dropped_count"])
+        self.assertEqual(0, metrics["suppressed_count"])
+
+    def test_should_collapse_repeated_messages(self):
+        clock = FakeClock()
+        Logger.set_repeat_window(60, clock)
+        _, cursor = Logger.get_logs_since()
+
+        for _ in range(3):
+            Logger.error("Sensor {} not ready", 1)
+        clock.now = 60
+        Logger.error("Sensor {} not ready", 1)
+
+        self.assertEqual(["Sensor 1 not ready", "Sensor 1 not ready (repeated 2 times)", "Sensor 1 not ready"],
+                         [entry.message for entry in Logger.get_logs_since(cursor)[0]])
+        self.assertEqual([{"level": "error", "source": __name__ + ":test_should_collapse_repeated_messages",
+                           "template": "Sensor {} not ready", "suppressed": 2}], Logger.get_suppressed_counters())
+
+    def test_should_log_writes_of_different_pins(self):
+        Logger.set_repeat_window(60, FakeClock())
+        _, cursor = Logger.get_logs_since()
+
+        for gpio in (17, 27):
+            Logger.info("GPIO {} set to {}", gpio, 1)
+
+        self.assertEqual(["GPIO 17 set to 1", "GPIO 27 set to 1"],
+                         [entry.message for entry in Logger.get_logs_since(cursor)[0]])
+
+    def test_should_query_log_entries(self):
+        _, cursor = Logger.get_logs_since()
+        Logger.info("queried info")
+        Logger.error("queried error")
+
+        result = Logger.query_logs(cursor, level="error")
+
+        self.assertEqual([(cursor + 1, "queried error")], [(sequence, entry.message) for sequence, entry in result])
+
+    def test_should_query_log_files_for_entries_older_than_kept_in_memory(self):
+        log_dir = tempfile.mkdtemp()
+        try:
+            log_files = LogFileStore(log_dir)
+            old_entry = LogEntry(datetime.now() - timedelta(hours=1), "info", "old message")
+            log_files.append([old_entry])
+            Logger.set_log_files(log_files)
+            Logger.set_capacity(1)
+            Logger.info("new message")
+            start = datetime.now() - timedelta(hours=2)
+
+            result = Logger.query_logs(start=start)
+
+            self.assertEqual([(None, "old message"), (Logger.get_logs_since()[1] - 1, "new message")],
+                             [(sequence, entry.message) for sequence, entry in result])
+            self.assertEqual([(None, "old message")],
+                             [(sequence, entry.message) for sequence, entry in Logger.query_logs(start=start, limit=1)])
+            log_files.close()
+        finally:
+            shutil.rmtree(log_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
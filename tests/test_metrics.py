@@ -0,0 +1,129 @@
+import unittest
+
+from app.metrics import ControllerMetrics, Histogram, MetricsRegistry, MetricsWriter, METRIC_TYPE_COUNTER, \
+    METRIC_TYPE_GAUGE
+
+
+class HistogramTestCase(unittest.TestCase):
+
+    def test_should_count_values_in_cumulative_buckets(self):
+        histogram = Histogram((0.1, 1.0))
+
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+
+        self.assertEqual(([2, 3, 4], 2.65, 4), histogram.get_values())
+
+
+class MetricsWriterTestCase(unittest.TestCase):
+
+    def test_should_write_samples_grouped_by_metric(self):
+        writer = MetricsWriter()
+
+        writer.add("relay_state", METRIC_TYPE_GAUGE, 1, {"relay": 0}, help_text="State of the relay")
+        writer.add("ticks_total", METRIC_TYPE_COUNTER, 5)
+        writer.add("relay_state", METRIC_TYPE_GAUGE, False, {"relay": 1})
+        writer.add("skipped", METRIC_TYPE_GAUGE, None)
+
+        self.assertEqual("# HELP relay_state State of the relay\n"
+                         "# TYPE relay_state gauge\n"
+                         "relay_state{relay=\"0\"} 1\n"
+                         "relay_state{relay=\"1\"} 0\n"
+                         "# TYPE ticks_total counter\n"
+                         "ticks_total 5\n", writer.to_text())
+
+    def test_should_escape_label_values(self):
+        writer = MetricsWriter()
+
+        writer.add("temperature", METRIC_TYPE_GAUGE, 12.5, {"sensor": "a\"b\\c\nd"})
+
+        self.assertIn("temperature{sensor=\"a\\\"b\\\\c\\nd\"} 12.5\n", writer.to_text())
+
+    def test_should_write_histogram(self):
+        writer = MetricsWriter()
+        histogram = Histogram((0.5,))
+        histogram.observe(0.25)
+        histogram.observe(1.0)
+
+        writer.add_histogram("duration_seconds", histogram, {"route": "/x"})
+
+        self.assertEqual("# TYPE duration_seconds histogram\n"
+                         "duration_seconds_bucket{le=\"0.5\",route=\"/x\"} 1\n"
+                         "duration_seconds_bucket{le=\"+Inf\",route=\"/x\"} 2\n"
+                         "duration_seconds_sum{route=\"/x\"} 1.25\n"
+                         "duration_seconds_count{route=\"/x\"} 2\n", writer.to_text())
+
+    def test_should_write_numeric_values_of_metrics_dict(self):
+        writer = MetricsWriter()
+
+        writer.add_values("storage", {"write_count": 3, "used_watts": 400.0, "pending": ["programs"],
+                                      "enabled": True})
+
+        self.assertEqual("# TYPE storage_used_watts gauge\n"
+                         "storage_used_watts 400.0\n"
+                         "# TYPE storage_write_total counter\n"
+                         "storage_write_total 3\n", writer.to_text())
+
+
+class MetricsRegistryTestCase(unittest.TestCase):
+
+    def test_should_collect_metrics_of_all_collectors(self):
+        registry = MetricsRegistry()
+        registry.add_collector(lambda writer: writer.add("first", METRIC_TYPE_GAUGE, 1))
+        registry.add_values("component", lambda: {"dropped_count": 2})
+
+        self.assertEqual("# TYPE first gauge\nfirst 1\n# TYPE component_dropped_total counter\n"
+                         "component_dropped_total 2\n", registry.collect())
+
+    def test_should_return_no_metrics_without_collectors(self):
+        self.assertEqual("", MetricsRegistry().collect())
+
+
+class ControllerMetricsTestCase(unittest.TestCase):
+
+    def test_should_count_relay_toggles(self):
+        metrics = ControllerMetrics(2)
+
+        metrics.record_relay_states([1, 0])
+        metrics.record_relay_states([0, 0])
+        metrics.record_relay_states([1, 1])
+
+        text = self.collect(metrics)
+        self.assertIn("brewery_relay_toggles_total{relay=\"0\"} 2\n", text)
+        self.assertIn("brewery_relay_toggles_total{relay=\"1\"} 1\n", text)
+        self.assertIn("brewery_relay_state{relay=\"0\"} 1\n", text)
+
+    def test_should_record_sensor_reads(self):
+        metrics = ControllerMetrics(1)
+
+        metrics.record_sensor_read("1001", 12.5, 0.02)
+        metrics.record_sensor_read("1001", None, 0.75)
+
+        text = self.collect(metrics)
+        self.assertIn("brewery_sensor_temperature_celsius{sensor=\"1001\"} 12.5\n", text)
+        self.assertIn("brewery_sensor_read_errors_total{sensor=\"1001\"} 1\n", text)
+        self.assertIn("brewery_sensor_read_duration_seconds_count{sensor=\"1001\"} 2\n", text)
+        self.assertIn("brewery_sensor_read_duration_seconds_bucket{le=\"0.025\",sensor=\"1001\"} 1\n", text)
+
+    def test_should_record_ticks(self):
+        metrics = ControllerMetrics(1)
+
+        metrics.record_tick(0.2, 0.05)
+        metrics.record_tick(0.3, -0.01)
+
+        text = self.collect(metrics)
+        self.assertIn("brewery_loop_ticks_total 2\n", text)
+        self.assertIn("brewery_loop_lag_seconds 0.0\n", text)
+        self.assertIn("brewery_loop_tick_duration_seconds_sum 0.5\n", text)
+        # relay states are not known before the loop publishes them
+        self.assertNotIn("brewery_relay_state{", text)
+
+    @staticmethod
+    def collect(metrics):
+        writer = MetricsWriter()
+        metrics.collect(writer)
+        return writer.to_text()
+
+
+if __name__ == '__main__':
+    unittest.main()
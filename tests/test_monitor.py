@@ -278,6 +278,34 @@ class TestMonitor(unittest.TestCase):
         self.then_cooling_is(0)
         self.then_heating_is(0)
 
+    def test_monitor_should_publish_program_state_after_check(self):
+        self.givenProgramWithMinMaxTemp(18.0, 18.4)
+        self.assertIsNone(self.monitor.get_state())
+        self.when_temperature_is(18.5)
+        state = self.monitor.get_state()
+        self.assertEqual(PROGRAM_ID, state.program_id)
+        self.assertEqual(self.program.program_crc, state.program_crc)
+        self.assertEqual(18.5, state.current_temperature)
+        self.assertTrue(state.cooling_activated)
+        self.assertFalse(state.heating_activated)
+        self.assertIsNone(state.error)
+        self.assertIsNotNone(state.timestamp)
+
+    def test_monitor_should_publish_error_in_program_state_if_sensor_was_not_found(self):
+        self.givenProgramWithMinMaxTemp(18.0, 18.4)
+        self.when_sensor_was_detached()
+        self.monitor.check()
+        state = self.monitor.get_state()
+        self.assertIsNone(state.current_temperature)
+        self.assertIsNotNone(state.error)
+
+    def test_monitor_should_publish_temperature_of_inactive_program(self):
+        self.givenProgramWithMinMaxTemp(18.0, 18.4, active=False)
+        self.when_temperature_is(18.5)
+        state = self.monitor.get_state()
+        self.assertEqual(18.5, state.current_temperature)
+        self.assertFalse(state.cooling_activated)
+
     def givenProgramWithMinMaxTemp(self, min_temp, max_temp, heating=True, cooling=True, active=True):
         self.program = Program(PROGRAM_ID, PROGRAM_NAME,
                                SENSOR_ID,
@@ -0,0 +1,108 @@
+import unittest
+
+from app.power_scheduler import PowerScheduler
+from app.hardware.hw_config import parse_relay_power_ratings
+from mocks import RelayApiMock
+
+RELAY_POWER_RATINGS = {0: 400.0, 1: 400.0, 2: 400.0, 3: 100.0}
+BUDGET_WATTS = 1000.0
+STAGGER_SECS = 5.0
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class PowerSchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.relay_api_mock = RelayApiMock()
+        self.clock = FakeClock()
+        self.scheduler = PowerScheduler(RELAY_POWER_RATINGS, BUDGET_WATTS, self.relay_api_mock,
+                                        stagger_secs=STAGGER_SECS, clock=self.clock)
+
+    def test_should_schedule_only_relays_with_power_rating(self):
+        self.assertTrue(self.scheduler.is_scheduled(0))
+        self.assertFalse(self.scheduler.is_scheduled(4))
+
+    def test_should_activate_request_with_highest_priority_first(self):
+        self.scheduler.request(0, 0.5)
+        self.scheduler.request(1, 2.0)
+        self.scheduler.request(2, 1.0)
+        self.scheduler.schedule()
+        self.then_active_relays_are([1])
+        self.next_stagger_interval()
+        self.then_active_relays_are([1, 2])
+        self.next_stagger_interval()
+        # 1200W would exceed the budget
+        self.then_active_relays_are([1, 2])
+        self.assertEqual([0], self.scheduler.get_metrics()["queued_relays"])
+
+    def test_should_stagger_activations(self):
+        self.scheduler.request(0, 1.0)
+        self.scheduler.request(1, 1.0)
+        self.scheduler.schedule()
+        self.then_active_relays_are([0])
+        self.clock.now += STAGGER_SECS - 1
+        self.scheduler.schedule()
+        self.then_active_relays_are([0])
+        # relay 1 was held back in both iterations
+        self.assertEqual(2, self.scheduler.get_metrics()["staggered_count"])
+        self.clock.now += 1
+        self.scheduler.schedule()
+        self.then_active_relays_are([0, 1])
+
+    def test_should_keep_denied_request_queued_until_power_is_available(self):
+        self.relay_api_mock.mock_relay_state(0, 1)
+        self.relay_api_mock.mock_relay_state(1, 1)
+        self.scheduler.request(2, 1.0)
+        self.scheduler.schedule()
+        self.then_active_relays_are([0, 1])
+        self.assertEqual(1, self.scheduler.get_metrics()["denied_count"])
+        self.relay_api_mock.mock_relay_state(0, 0)
+        self.scheduler.schedule()
+        self.then_active_relays_are([1, 2])
+        self.assertEqual([], self.scheduler.get_metrics()["queued_relays"])
+
+    def test_should_serve_smaller_request_that_fits_the_budget(self):
+        self.relay_api_mock.mock_relay_state(0, 1)
+        self.relay_api_mock.mock_relay_state(1, 1)
+        self.scheduler.request(2, 2.0)
+        self.scheduler.request(3, 1.0)
+        self.scheduler.schedule()
+        self.then_active_relays_are([0, 1, 3])
+        self.assertEqual(900.0, self.scheduler.get_metrics()["used_watts"])
+
+    def test_should_not_activate_cancelled_request(self):
+        self.scheduler.request(0, 1.0)
+        self.scheduler.cancel(0)
+        self.scheduler.schedule()
+        self.then_active_relays_are([])
+
+    def test_should_retain_requests_of_given_relays_only(self):
+        self.scheduler.request(0, 1.0)
+        self.scheduler.request(1, 2.0)
+        self.scheduler.retain({1, 2})
+        self.scheduler.schedule()
+        self.then_active_relays_are([1])
+        self.assertEqual([], self.scheduler.get_metrics()["queued_relays"])
+
+    def test_should_parse_relay_power_ratings_definition(self):
+        self.assertEqual({0: 400.0, 2: 1500.0}, parse_relay_power_ratings("0:400,2:1500"))
+        self.assertEqual({}, parse_relay_power_ratings(""))
+
+    def next_stagger_interval(self):
+        self.clock.now += STAGGER_SECS
+        self.scheduler.schedule()
+
+    def then_active_relays_are(self, relay_indexes):
+        self.assertEqual(relay_indexes, [relay_index for relay_index, state in self.relay_api_mock.relays.items()
+                                         if state == 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,7 @@
 import unittest
 import json
 import uuid
-from app.program import Program
+from app.program import Program, ProgramState, ProgramOperation
 
 SENSOR_ID = "sensor_id"
 PROGRAM_ID = "11111111-abcd-abcd-2222-333333333333"
@@ -143,3 +143,96 @@ class TestProgram(unittest.TestCase):
         self.assertEqual(10.0, modified.min_temperature)
         self.assertEqual(11.0, modified.max_temperature)
         self.assertEqual(False, modified.active)
+
+    def test_program_crc_should_not_depend_on_process(self):
+        program = Program(program_id=PROGRAM_ID, program_name=PROGRAM_NAME, sensor_id=SENSOR_ID,
+                          heating_relay_index=HEATING_RELAY_INDEX, cooling_relay_index=COOLING_RELAY_INDEX,
+                          min_temperature=18.0, max_temperature=18.6, active=True)
+        # The value is expected to be the same on every run, regardless of PYTHONHASHSEED
+        self.assertEqual("ebf15dcf852b80f9bc46eb50f93d9287e30a48a5", program.program_crc)
+
+    def test_program_crc_should_be_the_same_for_programs_with_the_same_fields(self):
+        program1 = Program(PROGRAM_ID, PROGRAM_NAME, SENSOR_ID, HEATING_RELAY_INDEX, COOLING_RELAY_INDEX, 18, 19.5)
+        program2 = Program.from_json(program1.to_json())
+        self.assertEqual(program1.program_crc, program2.program_crc)
+        program3 = Program(PROGRAM_ID, PROGRAM_NAME, SENSOR_ID, HEATING_RELAY_INDEX, COOLING_RELAY_INDEX, 18.0, 19.5)
+        self.assertEqual(program1.program_crc, program3.program_crc)
+
+    def test_program_crc_should_change_if_any_field_changes(self):
+        program = Program(PROGRAM_ID, PROGRAM_NAME, SENSOR_ID, HEATING_RELAY_INDEX, COOLING_RELAY_INDEX, 18.0, 19.5)
+        modified_programs = [
+            program.modify_with(program, program_name="other name"),
+            program.modify_with(program, sensor_id="other_sensor"),
+            program.modify_with(program, heating_relay_index=COOLING_RELAY_INDEX,
+                                cooling_relay_index=HEATING_RELAY_INDEX),
+            program.modify_with(program, min_temperature=18.1),
+            program.modify_with(program, max_temperature=19.4),
+            program.modify_with(program, active=True),
+        ]
+        crcs = {modified_program.program_crc for modified_program in modified_programs}
+        self.assertEqual(len(modified_programs), len(crcs))
+        self.assertNotIn(program.program_crc, crcs)
+
+    def test_program_should_be_immutable(self):
+        program = Program(PROGRAM_ID, PROGRAM_NAME, SENSOR_ID, HEATING_RELAY_INDEX, COOLING_RELAY_INDEX, 18.0, 19.5)
+        with self.assertRaises(AttributeError):
+            program.min_temperature = 10.0
+        with self.assertRaises(AttributeError):
+            program.extra_attribute = 1
+
+    def test_programs_with_the_same_fields_should_be_equal_and_have_the_same_hash(self):
+        program1 = Program(PROGRAM_ID, PROGRAM_NAME, SENSOR_ID, HEATING_RELAY_INDEX, COOLING_RELAY_INDEX, 18.0, 19.5)
+        program2 = Program(PROGRAM_ID, PROGRAM_NAME, SENSOR_ID, HEATING_RELAY_INDEX, COOLING_RELAY_INDEX, 18.0, 19.5)
+        program3 = program1.modify_with(program1, min_temperature=18.5)
+        self.assertEqual(program1, program2)
+        self.assertEqual(hash(program1), hash(program2))
+        self.assertNotEqual(program1, program3)
+        self.assertEqual(2, len({program1, program2, program3}))
+
+
+class TestProgramState(unittest.TestCase):
+
+    def test_program_state_should_serialize_to_json(self):
+        state = ProgramState(PROGRAM_ID, 18.5, "crc", heating_activated=1, cooling_activated=0,
+                             error="error", timestamp=1000.0)
+        self.assertEqual({"program_id": PROGRAM_ID,
+                          "current_temperature": 18.5,
+                          "program_crc": "crc",
+                          "heating_activated": True,
+                          "cooling_activated": False,
+                          "error": "error",
+                          "timestamp": 1000.0}, json.loads(state.to_json()))
+
+    def test_program_state_should_be_immutable(self):
+        state = ProgramState(PROGRAM_ID, 18.5, "crc")
+        with self.assertRaises(AttributeError):
+            state.current_temperature = 19.0
+        with self.assertRaises(AttributeError):
+            state.extra_attribute = 1
+
+    def test_program_states_with_the_same_fields_should_be_equal_and_have_the_same_hash(self):
+        state1 = ProgramState(PROGRAM_ID, 18.5, "crc", True, False, None, 1000.0)
+        state2 = ProgramState(PROGRAM_ID, 18.5, "crc", True, False, None, 1000.0)
+        state3 = ProgramState(PROGRAM_ID, 18.5, "crc", True, False, None, 1001.0)
+        self.assertEqual(state1, state2)
+        self.assertEqual(hash(state1), hash(state2))
+        self.assertNotEqual(state1, state3)
+
+    def test_program_state_age_should_be_counted_from_timestamp(self):
+        self.assertEqual(2.5, ProgramState(PROGRAM_ID, 18.5, "crc", timestamp=1000.0).get_age(now=1002.5))
+        self.assertIsNone(ProgramState(PROGRAM_ID, None, "crc").get_age(now=1002.5))
+
+
+class TestProgramOperation(unittest.TestCase):
+
+    def test_program_operation_should_deserialize_from_json(self):
+        operation = ProgramOperation.from_json_data({"op": "modify", "id": PROGRAM_ID,
+                                                     "program": {"name": PROGRAM_NAME, "sensor_id": SENSOR_ID}})
+        self.assertEqual(ProgramOperation.MODIFY, operation.kind)
+        self.assertEqual(PROGRAM_ID, operation.program_id)
+        self.assertEqual(PROGRAM_NAME, operation.program.program_name)
+        self.assertEqual(SENSOR_ID, operation.program.sensor_id)
+
+        operation = ProgramOperation.from_json_data({"op": "delete", "id": PROGRAM_ID})
+        self.assertEqual(ProgramOperation.DELETE, operation.kind)
+        self.assertIsNone(operation.program)
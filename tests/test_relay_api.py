@@ -1,7 +1,7 @@
 import sys
 import unittest
 import random
-from unittest.mock import Mock
+from unittest.mock import Mock, call
 import RPi
 from app.hardware.relay_api import RelayApi
 
@@ -47,6 +47,19 @@ class RelayApiTest(unittest.TestCase):
         RPi.GPIO.setmode.assert_called_with(RPi.GPIO.BCM)
         RPi.GPIO.setup.assert_called_with(RELAY_GPIO_CHANNELS, RPi.GPIO.OUT, initial=RPi.GPIO.LOW)
 
+    def test_should_initialize_with_given_relay_states(self):
+        initial_states = [1, 0, 0, 1, 0, 0, 0, 1]
+        api = RelayApi(low_voltage_control=True, initial_states=initial_states)
+
+        calls = [call(RELAY_GPIO_CHANNELS[index], RPi.GPIO.OUT, initial=reversed_state(initial_states[index]))
+                 for index in range(len(RELAY_GPIO_CHANNELS))]
+        self.assertEqual(calls, RPi.GPIO.setup.mock_calls)
+
+        api = RelayApi(low_voltage_control=False, initial_states=initial_states)
+
+        self.assertEqual(call(RELAY_GPIO_CHANNELS[-1], RPi.GPIO.OUT, initial=RPi.GPIO.HIGH),
+                         RPi.GPIO.setup.mock_calls[-1])
+
     def test_should_return_proper_relay_state_for_low_voltage_control_relay(self):
         api = RelayApi(low_voltage_control=True)
 
@@ -0,0 +1,84 @@
+import unittest
+
+from app.program import Program, ProgramState
+from app.shared_relay import SharedRelay, SharedRelayScheduler
+from app.hardware.hw_config import parse_shared_relays
+from mocks import RelayApiMock
+
+SHARED_RELAY_INDEX = 7
+MIN_ON_SECS = 60.0
+MIN_OFF_SECS = 30.0
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class SharedRelaySchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.relay_api_mock = RelayApiMock()
+        self.clock = FakeClock()
+        self.programs = [
+            Program("id1", "program1", "sensor1", -1, 0, 10.0, 12.0, True),
+            Program("id2", "program2", "sensor2", -1, 1, 10.0, 12.0, True),
+            Program("id3", "program3", "sensor3", -1, 2, 10.0, 12.0, True),
+        ]
+        self.scheduler = SharedRelayScheduler(
+            [SharedRelay(SHARED_RELAY_INDEX, [0, 1], MIN_ON_SECS, MIN_OFF_SECS)], self.relay_api_mock, self.clock)
+
+    def test_should_activate_shared_relay_when_any_dependent_relay_is_active(self):
+        self.when_cooling_is({"id2"})
+        self.then_shared_relay_is(1)
+
+    def test_should_not_activate_shared_relay_for_relays_that_do_not_depend_on_it(self):
+        self.when_cooling_is({"id3"})
+        self.then_shared_relay_is(0)
+
+    def test_should_keep_shared_relay_active_for_minimum_on_time(self):
+        self.when_cooling_is({"id1"})
+        self.then_shared_relay_is(1)
+        self.clock.now += MIN_ON_SECS - 1
+        self.when_cooling_is(set())
+        self.then_shared_relay_is(1)
+        self.clock.now += 1
+        self.when_cooling_is(set())
+        self.then_shared_relay_is(0)
+
+    def test_should_keep_shared_relay_inactive_for_minimum_off_time(self):
+        self.when_cooling_is({"id1"})
+        self.clock.now += MIN_ON_SECS
+        self.when_cooling_is(set())
+        self.then_shared_relay_is(0)
+        self.clock.now += MIN_OFF_SECS - 1
+        self.when_cooling_is({"id1", "id2"})
+        self.then_shared_relay_is(0)
+        self.clock.now += 1
+        self.when_cooling_is({"id1", "id2"})
+        self.then_shared_relay_is(1)
+
+    def test_should_deactivate_shared_relays_immediately_on_request(self):
+        self.when_cooling_is({"id1"})
+        self.scheduler.deactivate_all()
+        self.then_shared_relay_is(0)
+
+    def test_should_parse_shared_relays_definition(self):
+        self.assertEqual([(7, [0, 1, 2]), (6, [3])], parse_shared_relays("7:0,1,2;6:3"))
+        self.assertEqual([], parse_shared_relays(""))
+
+    def when_cooling_is(self, cooling_program_ids):
+        states = {program.program_id: ProgramState(program.program_id, 15.0, program.program_crc,
+                                                   cooling_activated=program.program_id in cooling_program_ids)
+                  for program in self.programs}
+        self.scheduler.update(self.programs, states)
+
+    def then_shared_relay_is(self, relay_state):
+        self.assertEqual(relay_state, self.relay_api_mock.get_relay_state(SHARED_RELAY_INDEX))
+
+
+if __name__ == '__main__':
+    unittest.main()
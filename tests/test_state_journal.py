@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from app.program import ProgramState
+from app.state_journal import StateJournal
+
+INTERVAL_SECS = 5.0
+MAX_AGE_SECS = 300.0
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class StateJournalTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.journal_dir = tempfile.mkdtemp()
+        self.journal_file = os.path.join(self.journal_dir, "journal.json")
+        self.clock = FakeClock()
+        self.state = ProgramState("id1", 18.5, "crc", True, False, None, 999.0)
+
+    def tearDown(self):
+        shutil.rmtree(self.journal_dir, ignore_errors=True)
+
+    def test_should_restore_written_snapshot(self):
+        self.__create_journal().write([0, 1, 0], {"id1": self.state})
+
+        self.clock.now += MAX_AGE_SECS
+        snapshot = self.__create_journal().restore()
+
+        self.assertEqual(1000.0, snapshot.timestamp)
+        self.assertEqual([0, 1, 0], snapshot.relay_states)
+        self.assertEqual({"id1": self.state}, snapshot.program_states)
+
+    def test_should_not_restore_stale_snapshot(self):
+        self.__create_journal().write([0, 1, 0], {"id1": self.state})
+
+        self.clock.now += MAX_AGE_SECS + 1
+
+        self.assertIsNone(self.__create_journal().restore())
+
+    def test_should_not_restore_invalid_or_missing_snapshot(self):
+        self.assertIsNone(self.__create_journal().restore())
+
+        with open(self.journal_file, "w") as output_stream:
+            output_stream.write('{"timestamp": 1000.0, "relay_')
+
+        self.assertIsNone(self.__create_journal().restore())
+
+    def test_should_not_restore_cleared_snapshot(self):
+        journal = self.__create_journal()
+        journal.write([0, 1, 0], {"id1": self.state})
+
+        journal.clear()
+        journal.clear()
+
+        self.assertIsNone(self.__create_journal().restore())
+
+    def test_should_read_journal_file_once(self):
+        journal = self.__create_journal()
+        self.assertIsNone(journal.restore())
+        self.__create_journal().write([1], {})
+
+        self.assertIsNone(journal.restore())
+
+    def test_should_be_due_after_interval(self):
+        journal = self.__create_journal()
+        self.assertTrue(journal.is_due())
+
+        journal.write([0], {})
+        self.clock.now += INTERVAL_SECS / 2
+        self.assertFalse(journal.is_due())
+        self.clock.now += INTERVAL_SECS / 2
+        self.assertTrue(journal.is_due())
+
+    def __create_journal(self):
+        return StateJournal(self.journal_file, INTERVAL_SECS, MAX_AGE_SECS, clock=self.clock)
+
+
+if __name__ == '__main__':
+    unittest.main()
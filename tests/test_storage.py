@@ -1,47 +1,43 @@
+import json
 import unittest
 import uuid
 import os
-from pathlib import Path
-
+import shutil
+import sqlite3
+import tempfile
+from datetime import datetime
+from unittest.mock import patch
+
+from app.history import HistoryRecord
+from app.logger import LogEntry
 from app.program import Program
 from app.storage import Storage
+from app.sqlite_storage import SqliteStorage
 from app.therm_sensor import ThermSensor
 
 
-class StorageTestCase(unittest.TestCase):
-
-    def setUp(self):
-        self.home_dir = str(Path.home())
-        self.root_dir = os.path.join(self.home_dir, ".brewery")
-        self.programs_filename = str(uuid.uuid4())
-        self.programs_file_path = os.path.join(self.root_dir, self.programs_filename)
-        self.sensors_filename = str(uuid.uuid4())
-        self.sensors_file_path = os.path.join(self.root_dir, self.sensors_filename)
-
-    def tearDown(self):
-        try:
-            os.remove(self.programs_file_path)
-            os.remove(self.sensors_file_path)
-            os.rmdir(self.root_dir)
-        except FileNotFoundError:
-            return
+class StorageContractTests(object):
+    """
+    Tests common for all storage backends, mixed into the test case of each backend. The test case provides
+    create_storage returning a new storage instance of the backend
+    """
 
     def test_should_store_programs_to_file_and_be_able_to_load_it_back(self):
         programs = [
             Program("id1", "program1", "sensor1", 1, 2, 16.7, 18.9),
             Program("id2", "program2", "sensor2", 4, -1, 14.0, 15.0, active=False)
         ]
-        storage = self.__create_storage()
+        storage = self.create_storage()
         storage.store_programs(programs)
 
-        storage2 = self.__create_storage()
+        storage2 = self.create_storage()
         loaded_programs = storage2.load_programs()
 
         for index in range(len(loaded_programs)):
             self.assertEqual(loaded_programs[index], programs[index])
 
     def test_should_return_empty_program_list_if_not_yet_saved(self):
-        storage = self.__create_storage()
+        storage = self.create_storage()
         loaded_programs = storage.load_programs()
 
         self.assertEqual(len(loaded_programs), 0)
@@ -52,19 +48,202 @@ class StorageTestCase(unittest.TestCase):
             ThermSensor("id2", "sensor2"),
         ]
 
-        storage1 = self.__create_storage()
+        storage1 = self.create_storage()
         storage1.store_sensors(sensors)
 
-        storage2 = self.__create_storage()
+        storage2 = self.create_storage()
         loaded_sensors = storage2.load_sensors()
 
         self.assertEqual(loaded_sensors, sensors)
 
     def test_should_return_empty_sensor_list_if_not_yet_saved(self):
-        storage = self.__create_storage()
+        storage = self.create_storage()
         self.assertEqual(storage.load_sensors(), [])
 
-    def __create_storage(self):
+
+class StorageTestCase(StorageContractTests, unittest.TestCase):
+
+    def setUp(self):
+        self.root_dir = os.path.join(tempfile.mkdtemp(), ".brewery")
+        self.programs_filename = str(uuid.uuid4())
+        self.programs_file_path = os.path.join(self.root_dir, self.programs_filename)
+        self.sensors_filename = str(uuid.uuid4())
+        self.sensors_file_path = os.path.join(self.root_dir, self.sensors_filename)
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.root_dir), ignore_errors=True)
+
+    def test_should_not_leave_temp_file_after_store(self):
+        storage = self.__create_storage()
+        storage.store_programs([Program("id1", "program1", "sensor1", 1, 2, 16.7, 18.9)])
+
+        self.assertEqual(os.listdir(self.root_dir), [self.programs_filename])
+
+    def test_should_load_previous_generation_if_programs_file_is_truncated(self):
+        program1 = Program("id1", "program1", "sensor1", 1, 2, 16.7, 18.9)
+        program2 = Program("id2", "program2", "sensor2", 3, 4, 14.0, 15.0)
+        storage = self.__create_storage()
+        storage.store_programs([program1])
+        storage.store_programs([program1, program2])
+        with open(self.programs_file_path, "r+") as file:
+            file.truncate(10)
+
+        self.assertEqual(self.__create_storage().load_programs(), [program1])
+
+    def test_should_load_previous_generation_if_sensors_file_is_missing(self):
+        sensors = [ThermSensor("id1", "sensor1")]
+        storage = self.__create_storage()
+        storage.store_sensors(sensors)
+        storage.store_sensors([])
+        os.remove(self.sensors_file_path)
+
+        self.assertEqual(self.__create_storage().load_sensors(), sensors)
+
+    def test_should_keep_live_file_if_write_is_interrupted_after_rotation(self):
+        program = Program("id1", "program1", "sensor1", 1, 2, 16.7, 18.9)
+        storage = self.__create_storage()
+        storage.store_programs([program])
+        replace = os.replace
+
+        def interrupted_replace(source, destination):
+            if destination == self.programs_file_path:
+                raise OSError("Power cut")
+            replace(source, destination)
+
+        with patch("app.storage.os.replace", side_effect=interrupted_replace):
+            with self.assertRaises(OSError):
+                storage.store_programs([])
+
+        with open(self.programs_file_path) as file:
+            self.assertEqual([program.to_json_data()], json.load(file))
+        self.assertEqual([program], self.__create_storage().load_programs())
+
+    def test_should_count_written_bytes(self):
+        storage = self.__create_storage()
+        storage.store_programs([Program("id1", "program1", "sensor1", 1, 2, 16.7, 18.9)])
+        storage.store_sensors([ThermSensor("id1", "sensor1")])
+
+        self.assertEqual(os.path.getsize(self.programs_file_path) + os.path.getsize(self.sensors_file_path),
+                         storage.bytes_written)
+
+    def test_should_raise_error_if_no_generation_is_valid(self):
+        storage = self.__create_storage()
+        storage.store_programs([])
+        with open(self.programs_file_path, "w") as file:
+            file.write("[{")
+
+        with self.assertRaises(ValueError):
+            storage.load_programs()
+
+    def test_should_keep_limited_number_of_generations(self):
+        storage = self.__create_storage(generations=2)
+        for index in range(5):
+            storage.store_programs([Program("id{}".format(index), "program", "sensor", 1, 2, 16.7, 18.9)])
+
+        self.assertEqual(sorted(os.listdir(self.root_dir)),
+                         [self.programs_filename, self.programs_filename + ".1", self.programs_filename + ".2"])
+        os.remove(self.programs_file_path)
+        os.remove(self.programs_file_path + ".1")
+        self.assertEqual(storage.load_programs()[0].program_id, "id2")
+
+    def create_storage(self):
+        return self.__create_storage()
+
+    def __create_storage(self, generations=3):
         return Storage(storage_root_dir=self.root_dir,
                        programs_file_name=self.programs_filename,
-                       sensors_file_name=self.sensors_filename)
+                       sensors_file_name=self.sensors_filename,
+                       generations=generations)
+
+
+class SqliteStorageTestCase(StorageContractTests, unittest.TestCase):
+
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        self.storages = []
+
+    def tearDown(self):
+        for storage in self.storages:
+            storage.close()
+        shutil.rmtree(self.root_dir, ignore_errors=True)
+
+    def test_should_use_wal_journal_mode(self):
+        self.create_storage()
+        connection = sqlite3.connect(os.path.join(self.root_dir, "brewery.db"))
+        try:
+            self.assertEqual("wal", connection.execute("PRAGMA journal_mode").fetchone()[0])
+        finally:
+            connection.close()
+
+    def test_should_replace_stored_programs(self):
+        storage = self.create_storage()
+        storage.store_programs([Program("id1", "program1", "sensor1", 1, 2, 16.7, 18.9)])
+        programs = [Program("id2", "program2", "sensor2", 3, -1, 14.0, 15.0),
+                    Program("id3", "program3", "sensor3", -1, 4, 14.0, 15.0, active=False)]
+        storage.store_programs(programs)
+
+        self.assertEqual(programs, self.create_storage().load_programs())
+
+    def test_should_upsert_and_delete_single_program_keeping_order(self):
+        program1 = Program("id1", "program1", "sensor1", 1, 2, 16.7, 18.9)
+        program2 = Program("id2", "program2", "sensor2", 3, 4, 14.0, 15.0)
+        storage = self.create_storage()
+        storage.store_programs([program1, program2])
+
+        modified_program1 = program1.modify_with(program1, max_temperature=20.0)
+        program3 = Program("id3", "program3", "sensor3", 5, 6, 14.0, 15.0)
+        storage.upsert_program(modified_program1)
+        storage.upsert_program(program3)
+        storage.delete_program(program2.program_id)
+
+        self.assertEqual([modified_program1, program3], self.create_storage().load_programs())
+
+    def test_should_upsert_single_sensor(self):
+        storage = self.create_storage()
+        storage.store_sensors([ThermSensor("id1", "sensor1"), ThermSensor("id2", "sensor2")])
+
+        storage.upsert_sensor(ThermSensor("id2", "renamed"))
+        storage.upsert_sensor(ThermSensor("id3", "sensor3"))
+
+        self.assertEqual([ThermSensor("id1", "sensor1"), ThermSensor("id2", "renamed"), ThermSensor("id3", "sensor3")],
+                         storage.load_sensors())
+
+    def test_should_leave_stored_programs_intact_if_store_fails(self):
+        program = Program("id1", "program1", "sensor1", 1, 2, 16.7, 18.9)
+        storage = self.create_storage()
+        storage.store_programs([program])
+
+        with self.assertRaises(sqlite3.IntegrityError):
+            storage.store_programs([program, program])
+
+        self.assertEqual([program], storage.load_programs())
+
+    def test_should_store_logs_and_load_the_most_recent_ones(self):
+        storage = self.create_storage()
+        entries = [LogEntry(datetime(2020, 1, 1, 12, 0, second, 1000), "info", "message{}".format(second))
+                   for second in range(5)]
+        storage.append_logs(entries)
+
+        self.assertEqual(entries, storage.load_logs())
+        self.assertEqual(entries[-2:], storage.load_logs(limit=2))
+
+    def test_should_store_history_and_query_it_by_sensor_and_time(self):
+        storage = self.create_storage()
+        storage.append_history([HistoryRecord(100.0 + second, sensor_id, 10.0 + second, 1)
+                                for second in range(5) for sensor_id in ("sensor1", "sensor2")])
+
+        self.assertEqual([HistoryRecord(101.0, "sensor2", 11.0, 1), HistoryRecord(102.0, "sensor2", 12.0, 1)],
+                         storage.query_history("sensor2", 101.0, 102.0))
+        self.assertEqual(5, len(storage.query_history("sensor1")))
+
+    def test_should_count_written_bytes(self):
+        storage = self.create_storage()
+        storage.upsert_sensor(ThermSensor("id1", "sensor"))
+
+        # 3 bytes of the id and 6 bytes of the name
+        self.assertEqual(9, storage.bytes_written)
+
+    def create_storage(self):
+        storage = SqliteStorage(storage_root_dir=self.root_dir)
+        self.storages.append(storage)
+        return storage
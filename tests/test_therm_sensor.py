@@ -15,6 +15,17 @@ class ThermSensorTestCase(unittest.TestCase):
         with self.assertRaises(AttributeError):
             self.sensor.id = "someOtherId"
 
+    def test_should_not_allow_extra_attributes(self):
+        with self.assertRaises(AttributeError):
+            self.sensor.extra_attribute = 1
+
+    def test_sensors_with_the_same_id_and_name_should_be_equal_and_have_the_same_hash(self):
+        sensor1 = ThermSensor(self.SENSOR_ID, "name")
+        sensor2 = ThermSensor.from_json_data(sensor1.to_json_data())
+        self.assertEqual(sensor1, sensor2)
+        self.assertEqual(hash(sensor1), hash(sensor2))
+        self.assertNotEqual(sensor1, ThermSensor(self.SENSOR_ID, "other name"))
+
 
 if __name__ == '__main__':
     unittest.main()
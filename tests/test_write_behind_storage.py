@@ -0,0 +1,193 @@
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import Mock
+
+from app.metrics import MetricsWriter
+from app.program import Program
+from app.sqlite_storage import SqliteStorage
+from app.therm_sensor import ThermSensor
+from app.write_behind_storage import WriteBehindStorage
+from mocks import StorageMock
+
+DEBOUNCE_SECS = 2.0
+MAX_DELAY_SECS = 10.0
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class WriteBehindStorageTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.program1 = Program("id1", "program1", "sensor1", 1, 2, 16.0, 18.0)
+        self.program2 = Program("id2", "program2", "sensor2", 3, 4, 16.0, 18.0)
+        self.storage_mock = StorageMock(programs=[self.program1], sensors=[ThermSensor("sensor1", "name")])
+        self.clock = FakeClock()
+        self.storage = WriteBehindStorage(self.storage_mock, DEBOUNCE_SECS, MAX_DELAY_SECS, clock=self.clock)
+
+    def test_should_load_from_storage_once(self):
+        self.assertEqual([self.program1], self.storage.load_programs())
+        self.assertEqual([self.program1], self.storage.load_programs())
+        self.assertEqual([ThermSensor("sensor1", "name")], self.storage.load_sensors())
+
+        self.storage_mock.load_programs.assert_called_once_with()
+        self.storage_mock.load_sensors.assert_called_once_with()
+
+    def test_should_serve_stored_data_from_memory_before_it_is_written(self):
+        self.storage.store_programs([self.program2])
+
+        self.assertEqual([self.program2], self.storage.load_programs())
+        self.storage_mock.store_programs.assert_not_called()
+        self.storage_mock.load_programs.assert_not_called()
+
+    def test_should_write_once_data_has_not_changed_for_debounce_time(self):
+        self.storage.store_programs([self.program1, self.program2])
+        self.clock.now += DEBOUNCE_SECS / 2
+        self.storage.store_programs([self.program2])
+
+        self.clock.now += DEBOUNCE_SECS / 2
+        self.assertEqual(DEBOUNCE_SECS / 2, self.storage.flush_if_due())
+        self.storage_mock.store_programs.assert_not_called()
+
+        self.clock.now += DEBOUNCE_SECS / 2
+        self.assertIsNone(self.storage.flush_if_due())
+        self.storage_mock.store_programs.assert_called_once_with([self.program2])
+
+    def test_should_write_after_maximum_delay_even_if_data_keeps_changing(self):
+        for _ in range(int(MAX_DELAY_SECS)):
+            self.storage.store_programs([self.program2])
+            self.clock.now += 1.0
+            self.storage.flush_if_due()
+
+        self.storage_mock.store_programs.assert_called_once_with([self.program2])
+        metrics = self.storage.get_metrics()
+        self.assertEqual(int(MAX_DELAY_SECS), metrics["store_count"])
+        self.assertEqual(1, metrics["write_count"])
+
+    def test_should_write_all_pending_data_on_flush(self):
+        self.storage.store_programs([self.program2])
+        self.storage.store_sensors([])
+
+        self.storage.flush()
+
+        self.storage_mock.store_programs.assert_called_once_with([self.program2])
+        self.storage_mock.store_sensors.assert_called_once_with([])
+        self.assertIsNone(self.storage.flush_if_due())
+        self.assertEqual([], self.storage.get_metrics()["pending"])
+
+    def test_should_retry_write_after_error(self):
+        self.storage_mock.store_programs.side_effect = [IOError("disk full"), None]
+        self.storage.store_programs([self.program2])
+
+        self.storage.flush()
+        self.assertEqual(1, self.storage.get_metrics()["write_error_count"])
+        self.assertEqual(["programs"], self.storage.get_metrics()["pending"])
+
+        self.clock.now += DEBOUNCE_SECS
+        self.storage.flush_if_due()
+        self.assertEqual(2, self.storage_mock.store_programs.call_count)
+        self.assertEqual([], self.storage.get_metrics()["pending"])
+
+    def test_should_write_pending_data_in_background(self):
+        storage = WriteBehindStorage(self.storage_mock, debounce_secs=0.01, max_delay_secs=0.1)
+        storage.start()
+        storage.store_programs([self.program2])
+
+        deadline = time.monotonic() + 5.0
+        while not self.storage_mock.store_programs.called and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.storage_mock.store_programs.assert_called_once_with([self.program2])
+
+    def test_should_export_bytes_written_by_storage_as_counter(self):
+        self.storage_mock.bytes_written = 42
+        writer = MetricsWriter()
+
+        writer.add_values("brewery_storage", self.storage.get_metrics())
+
+        self.assertIn("# TYPE brewery_storage_bytes_written_total counter\nbrewery_storage_bytes_written_total 42\n",
+                      writer.to_text())
+
+    def test_should_write_all_programs_on_row_change_if_storage_has_no_row_level_updates(self):
+        modified_program1 = self.program1.modify_with(self.program1, max_temperature=20.0)
+        self.storage.upsert_program(modified_program1)
+        self.storage.upsert_program(self.program2)
+        self.storage.delete_program(self.program1.program_id)
+        self.storage.upsert_sensor(ThermSensor("sensor1", "renamed"))
+
+        self.storage.flush()
+
+        self.storage_mock.store_programs.assert_called_once_with([self.program2])
+        self.storage_mock.store_sensors.assert_called_once_with([ThermSensor("sensor1", "renamed")])
+
+
+class WriteBehindSqliteStorageTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root_dir, ignore_errors=True)
+        self.sqlite_storage = SqliteStorage(storage_root_dir=self.root_dir)
+        self.addCleanup(self.sqlite_storage.close)
+        self.program1 = Program("id1", "program1", "sensor1", 1, 2, 16.0, 18.0)
+        self.program2 = Program("id2", "program2", "sensor2", 3, 4, 16.0, 18.0)
+        self.sqlite_storage.store_programs([self.program1, self.program2])
+        self.sqlite_storage.store_sensors([ThermSensor("sensor1", "name")])
+        self.storage_spy = Mock(wraps=self.sqlite_storage)
+        self.clock = FakeClock()
+        self.storage = WriteBehindStorage(self.storage_spy, DEBOUNCE_SECS, MAX_DELAY_SECS, clock=self.clock)
+
+    def test_should_write_changed_rows_only(self):
+        modified_program1 = self.program1.modify_with(self.program1, max_temperature=20.0)
+        program3 = Program("id3", "program3", "sensor3", 5, 6, 16.0, 18.0)
+        self.storage.upsert_program(modified_program1)
+        self.storage.upsert_program(program3)
+        self.storage.upsert_program(program3.modify_with(program3, min_temperature=15.0))
+        self.storage.delete_program(self.program2.program_id)
+        self.storage.upsert_sensor(ThermSensor("sensor1", "renamed"))
+        self.assertEqual([modified_program1, program3.modify_with(program3, min_temperature=15.0)],
+                         self.storage.load_programs())
+
+        self.storage.flush()
+
+        self.storage_spy.store_programs.assert_not_called()
+        self.storage_spy.store_sensors.assert_not_called()
+        self.assertEqual(2, self.storage_spy.upsert_program.call_count)
+        self.assertEqual(self.storage.load_programs(), self.sqlite_storage.load_programs())
+        self.assertEqual([ThermSensor("sensor1", "renamed")], self.sqlite_storage.load_sensors())
+
+    def test_should_retry_rows_after_error(self):
+        self.storage_spy.upsert_program.side_effect = [IOError("disk full"), None]
+        modified_program1 = self.program1.modify_with(self.program1, max_temperature=20.0)
+        self.storage.upsert_program(modified_program1)
+
+        self.storage.flush()
+        self.assertEqual(["programs"], self.storage.get_metrics()["pending"])
+        self.storage.flush()
+
+        self.storage_spy.store_programs.assert_not_called()
+        self.assertEqual(2, self.storage_spy.upsert_program.call_count)
+        self.assertEqual([], self.storage.get_metrics()["pending"])
+
+    def test_should_write_all_programs_if_rows_changed_during_failed_write(self):
+        def fail_after_change(program):
+            self.storage.delete_program(self.program2.program_id)
+            raise IOError("disk full")
+        self.storage_spy.upsert_program.side_effect = fail_after_change
+        modified_program1 = self.program1.modify_with(self.program1, max_temperature=20.0)
+        self.storage.upsert_program(modified_program1)
+
+        self.storage.flush()
+        self.storage.flush()
+
+        self.storage_spy.store_programs.assert_called_once_with([modified_program1])
+        self.assertEqual([modified_program1], self.sqlite_storage.load_programs())
+
+
+if __name__ == '__main__':
+    unittest.main()